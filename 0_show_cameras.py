@@ -1,22 +1,50 @@
 import argparse
 
 from stereocam import StereoPair
+from stereocam.sources import open_source
+from stereocam.telemetry import Telemetry
 
 DESCRIPTION = (
-    "Этот скрипт предназначен для показа видеопотока с камер"
+    "Этот скрипт предназначен для показа видеопотока с камер или записи"
 )
 
 parser = argparse.ArgumentParser(description=DESCRIPTION)
 parser.add_argument(
-    'cams',
-    nargs=2,
-    type=int,
-    help="Индексы камер"
+    'source',
+    nargs='+',
+    help=(
+        "Источник кадров: индексы двух камер, два видеофайла, папка с кадрами "
+        "или (с --side-by-side) одна камера или видео со склеенными кадрами"
+    )
+)
+parser.add_argument(
+    "--side-by-side",
+    action="store_true",
+    help="Левый и правый кадр склеены по горизонтали в одном потоке"
+)
+parser.add_argument(
+    "--telemetry",
+    action="store_true",
+    help="Выводить поверх кадра задержки и FPS этапов"
+)
+parser.add_argument(
+    "--telemetry-log",
+    type=str,
+    default=None,
+    help="Файл, в который периодически дописывается сводка замеров (JSON lines)"
 )
 args = parser.parse_args()
-stereo_pair = StereoPair(args.cams)
+telemetry = None
+if args.telemetry or args.telemetry_log:
+    telemetry = Telemetry(log_path=args.telemetry_log)
+stereo_pair = StereoPair(open_source(args.source, args.side_by_side), telemetry=telemetry)
+if stereo_pair.source.live:
+    stereo_pair.start_capture()
 
 try:
-    stereo_pair.show_videos()
+    stereo_pair.show_videos(overlay=args.telemetry)
 except KeyboardInterrupt:
     pass
+finally:
+    stereo_pair.close()
+    stereo_pair.telemetry.close()
@@ -3,6 +3,7 @@ import argparse
 import threading
 
 from stereocam import StereoPair
+from stereocam.writer import AsyncWriter
 
 
 DESCRIPTION = (
@@ -40,16 +41,24 @@ parser.add_argument(
 )
 args = parser.parse_args()
 
-stereo_pair = StereoPair(args.cams)
+writer = AsyncWriter()
+stereo_pair = StereoPair(args.cams, writer)
+# показ и поиск доски читают кадры из разных потоков: захват идет в своих потоках,
+# и каждая пара кадров получена одним захватом
+if stereo_pair.source.live:
+    stereo_pair.start_capture()
 
 
 def save_frames():
     print("Поместите доску так, чтобы ее было видно на обеих камерах")
     for n in range(args.amount):
         time.sleep(5.0)
-        frames, _ = stereo_pair.get_chessboard_frames(args.columns, args.rows)
+        frames, _ = stereo_pair.get_chessboard_frames(
+            args.columns,
+            args.rows,
+            interval=0.1
+        )
         stereo_pair.save_frames(args.output, frames)
-        stereo_pair._saved_frames_count += 1
         print(f"кадры сохранены {n}")
     print("все снимки сделаны")
 
@@ -61,3 +70,7 @@ try:
     stereo_pair.show_videos()
 except KeyboardInterrupt:
     pass
+finally:
+    stereo_pair.close()
+    # дожидаемся записи всех снимков
+    writer.close()
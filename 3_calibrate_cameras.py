@@ -33,15 +33,53 @@ parser.add_argument(
     type=float,
     help="Размер квадрата в см.",
 )
-args = parser.parse_args()
-
-dataset = FramesDataset(args.folder_path)
-calibrator = StereoCalibrator(
-    dataset,
-    (args.columns, args.rows),
-    args.square_size
-)
-calibration_data, rectification_data, transformation_map = calibrator.calibrate()
-calibration_data.save("calib.npz")
-rectification_data.save("rectify.npz")
-transformation_map.save("transformation_map.npz")
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Количество процессов для поиска углов. По умолчанию - число ядер",
+)
+parser.add_argument(
+    "--cache",
+    type=str,
+    default="corners_cache.npz",
+    help="Файл кэша найденных углов. По умолчанию - corners_cache.npz рядом с calib.npz",
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="Не использовать кэш найденных углов",
+)
+parser.add_argument(
+    "--rebuild-cache",
+    action="store_true",
+    help="Очистить кэш и найти углы на всех изображениях заново",
+)
+
+
+def main() -> None:
+    args = parser.parse_args()
+
+    dataset = FramesDataset(args.folder_path, lazy=True, prefetch=4)
+    calibrator = StereoCalibrator(
+        dataset,
+        (args.columns, args.rows),
+        args.square_size,
+        workers=args.workers,
+        cache=None if args.no_cache else args.cache,
+        rebuild_cache=args.rebuild_cache
+    )
+    calibration_data, rectification_data, transformation_map = calibrator.calibrate()
+    if calibrator.rejected:
+        print(
+            f"Доска не найдена на {len(calibrator.rejected)} парах из {len(dataset)}, "
+            f"они пропущены: {calibrator.rejected}"
+        )
+    calibration_data.save("calib.npz")
+    rectification_data.save("rectify.npz")
+    transformation_map.save("transformation_map.npz")
+
+
+# пул процессов при запуске через spawn (Windows) заново импортирует этот модуль
+if __name__ == "__main__":
+    main()
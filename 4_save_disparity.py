@@ -1,16 +1,23 @@
+import sys
+import time
 import argparse
 import threading
-import msvcrt
 from pathlib import Path
 
 import cv2
 
 from stereocam import StereoPair, DisparityEstimator
 from stereocam.calibration import TransformationMap
+from stereocam.datasets import DisparityStore
+from stereocam.writer import AsyncWriter
+from stereocam.governor import QualityGovernor
+from stereocam.pipeline import PipelineItem
+from stereocam.sources import open_source
+from stereocam.telemetry import Telemetry
 
 DESCRIPTION = (
     "Этот скрипт предназначен для показа и сохранения карты диспаратности.\n"
-    "Чтобы сохранить карту, в терминале нажмите S.\n"
+    "Чтобы сохранить карту, в терминале введите s и нажмите Enter.\n"
     "Помимо карты в папку сохраняются исходные кадры с камер.\n"
     "Это необходимо для дальнейшего наложения цветом на облако точек.\n"
     "Поддерживает сохранение нескольких карт диспаратности."
@@ -19,51 +26,117 @@ MAPS_PATH = 'transformation_map.npz'
 
 parser = argparse.ArgumentParser(description=DESCRIPTION)
 parser.add_argument(
-    'cams',
-    nargs=2,
-    type=int,
-    help="Индексы камер"
+    'source',
+    nargs='+',
+    help=(
+        "Источник кадров: индексы двух камер, два видеофайла, папка с кадрами "
+        "или (с --side-by-side) одна камера или видео со склеенными кадрами"
+    )
+)
+parser.add_argument(
+    "--side-by-side",
+    action="store_true",
+    help="Левый и правый кадр склеены по горизонтали в одном потоке"
 )
 parser.add_argument(
     "output",
     type=str,
     help="Путь к папке, в которую будет сохранена карта диспаратности"
 )
+parser.add_argument(
+    "--store",
+    action="store_true",
+    help="Сохранять карты в отображаемое в память хранилище вместо отдельных .npz"
+)
+parser.add_argument(
+    "--codec",
+    choices=["zlib", "lz4"],
+    default=None,
+    help="Кодек сжатия для хранилища"
+)
+parser.add_argument(
+    "--target-fps",
+    type=float,
+    default=None,
+    help="Снижать качество показываемой карты, чтобы удерживать указанную частоту кадров"
+)
+parser.add_argument(
+    "--telemetry",
+    action="store_true",
+    help="Выводить поверх карты задержки и FPS этапов"
+)
+parser.add_argument(
+    "--telemetry-log",
+    type=str,
+    default=None,
+    help="Файл, в который периодически дописывается сводка замеров (JSON lines)"
+)
 args = parser.parse_args()
-stereo_pair = StereoPair(args.cams)
+telemetry = None
+if args.telemetry or args.telemetry_log:
+    telemetry = Telemetry(log_path=args.telemetry_log)
+writer = AsyncWriter()
+stereo_pair = StereoPair(open_source(args.source, args.side_by_side), writer, telemetry)
 output_folder = Path(args.output)
 frames_folder = output_folder / 'frames'
 frames_folder.mkdir(exist_ok=True)
+store = DisparityStore(output_folder, args.codec) if args.store else None
+
+
+save_requested = threading.Event()
+
+
+def wait_keypress(wait_key: str = 's'):
+    # построчное чтение stdin работает на всех платформах
+    for line in sys.stdin:
+        if line.strip().lower() == wait_key:
+            save_requested.set()
+
 
+save_estimator = DisparityEstimator(TransformationMap.load(MAPS_PATH))
+save_estimator.set_mode(cv2.STEREO_SGBM_MODE_HH)
+save_count = 0
 
-def save_on_keypress(wait_key: bytes = b's'):
-    estimator = DisparityEstimator(TransformationMap.load(MAPS_PATH))
-    estimator.set_mode(cv2.STEREO_SGBM_MODE_HH)
 
-    save_count = 0
-    while True:
-        if msvcrt.kbhit():
-            key = msvcrt.getch()
-            if key == wait_key:
-                print("Сохранение карты началось")
-                frames = stereo_pair.get_frames()
-                stereo_pair.save_frames(
-                    str(frames_folder),
-                    frames
-                )
-                stereo_pair.save_disparity(
-                    f"{output_folder}/{save_count}.npz",
-                    estimator,
-                    frames
-                )
-                print("Карта сохранена")
-                save_count += 1
+def save_item(item: PipelineItem):
+    global save_count
+    if not save_requested.is_set():
+        return
+    save_requested.clear()
+    print("Сохранение карты началось")
+    # сохраняем именно ту пару кадров, карта которой сейчас показана,
+    # и с одним временем - временем ее захвата, переведенным в unix time
+    captured = time.time() - (time.monotonic() - item.timestamp)
+    stereo_pair.save_frames(str(frames_folder), list(item.frames), captured)
+    stereo_pair.save_disparity(
+        f"{output_folder}/{save_count}.npz",
+        save_estimator,
+        list(item.frames),
+        store,
+        captured
+    )
+    print("Карта поставлена в очередь на сохранение")
+    save_count += 1
 
 
-save_thread = threading.Thread(target=save_on_keypress, daemon=True)
-save_thread.start()
+keypress_thread = threading.Thread(target=wait_keypress, daemon=True)
+keypress_thread.start()
+if stereo_pair.source.live:
+    stereo_pair.start_capture()
 
 try:
-    stereo_pair.show_disparity_map(DisparityEstimator(TransformationMap.load(MAPS_PATH)))
+    stereo_pair.show_disparity_map(
+        DisparityEstimator(TransformationMap.load(MAPS_PATH), telemetry=telemetry),
+        on_item=save_item,
+        overlay=args.telemetry,
+        governor=QualityGovernor(target_fps=args.target_fps) if args.target_fps else None
+    )
 except KeyboardInterrupt:
     pass
+finally:
+    stereo_pair.close()
+    # дожидаемся записи всех карт
+    writer.close()
+    if store is not None:
+        store.close()
+    stereo_pair.telemetry.close()
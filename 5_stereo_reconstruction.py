@@ -1,11 +1,16 @@
 import argparse
 from pathlib import Path
 
+import numpy as np
+
 from stereocam.datasets import DisparityDataset
 from stereocam.calibration import RectificationData
 from stereocam import StereoReconstructor
+from stereocam.fusion import VoxelMap
+from stereocam.sgbm_config import SGBMConfig
 
 
+SGBM_CONFIG_PATH = 'sgbm_config.yml'
 DESCRIPTION = (
     "Этот скрипт предназначен для создания облака точек из карты диспаратности."
 )
@@ -15,14 +20,132 @@ parser.add_argument(
     type=str,
     help="Путь к папке, в которой сохранены карты диспаратности"
 )
-args = parser.parse_args()
+parser.add_argument(
+    "--backend",
+    choices=StereoReconstructor.backends,
+    default="numpy",
+    help="Способ записи .ply: numpy - встроенный, open3d - через пакет open3d",
+)
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Количество процессов. По умолчанию - число ядер",
+)
+parser.add_argument(
+    "--voxel-size",
+    type=float,
+    default=None,
+    help="Размер вокселя для прореживания облака. По умолчанию облако не прореживается",
+)
+parser.add_argument(
+    "--lod-levels",
+    type=int,
+    default=1,
+    help="Количество уровней детализации, каждый следующий в 2 раза грубее (нужен --voxel-size)",
+)
+parser.add_argument(
+    "--outlier-std",
+    type=float,
+    default=None,
+    help="Порог отбрасывания выбросов в стандартных отклонениях плотности (нужен --voxel-size)",
+)
+parser.add_argument(
+    "--fuse",
+    type=float,
+    default=None,
+    metavar="VOXEL_SIZE",
+    help="Объединить все карты в одну модель point_clouds/fused.ply с вокселем указанного размера",
+)
+parser.add_argument(
+    "--max-voxels",
+    type=int,
+    default=None,
+    help="Максимальное количество вокселей объединенной модели",
+)
+parser.add_argument(
+    "--min-hits",
+    type=int,
+    default=1,
+    help="Сохранять только воксели, видимые хотя бы на стольких картах",
+)
+parser.add_argument(
+    "--poses",
+    type=str,
+    default=None,
+    help="Файл .npy с положениями камеры (Nx4x4) для каждой карты, если установка двигалась",
+)
+parser.add_argument(
+    "--depth",
+    choices=("float32", "uint16"),
+    default=None,
+    help="Вместо облаков точек записать карты глубины в папку depth_maps: "
+         "float32 - в .npy, uint16 - в 16-битные .png",
+)
+parser.add_argument(
+    "--depth-scale",
+    type=float,
+    default=1.0,
+    help="Множитель перевода глубины из единиц калибровки, например в миллиметры для uint16",
+)
+parser.add_argument(
+    "--overwrite",
+    action="store_true",
+    help="Перестроить уже существующие облака точек",
+)
+
+
+def main() -> None:
+    args = parser.parse_args()
+
+    dataset = DisparityDataset(args.input_folder, lazy=True)
+    recification_data = RectificationData.load('rectify.npz')
+    reconstructor = StereoReconstructor(
+        recification_data,
+        args.backend,
+        voxel_size=args.voxel_size,
+        lod_levels=args.lod_levels,
+        outlier_std=args.outlier_std
+    )
 
-models_folder = Path("point_clouds")
-models_folder.mkdir(exist_ok=True)
+    models_folder = Path("point_clouds")
+    if args.depth is not None:
+        depth_folder = Path("depth_maps")
+        depth_folder.mkdir(exist_ok=True)
+        # карты считались с этим min_disparity, меньшие значения - невалидные пиксели
+        min_disparity = SGBMConfig.from_path(SGBM_CONFIG_PATH).min_disparity
+        # карты глубины не требуют кадров, читаются только карты диспаратности
+        for idx in range(len(dataset)):
+            reconstructor.save_depth_map(
+                dataset.get_disparity(idx),
+                depth_folder / str(idx),
+                np.dtype(args.depth),
+                args.depth_scale,
+                min_disparity
+            )
+        print(f"Записано карт глубины: {len(dataset)}")
+        return
+    if args.fuse is not None:
+        models_folder.mkdir(exist_ok=True)
+        voxel_map = VoxelMap(args.fuse, args.max_voxels)
+        poses = None if args.poses is None else np.load(args.poses)
+        report = reconstructor.fuse_dataset(dataset, voxel_map, poses)
+        count = voxel_map.export(models_folder / "fused.ply", args.min_hits)
+        print(f"В объединенной модели {count} точек")
+    else:
+        report = reconstructor.reconstruct_dataset(
+            dataset,
+            models_folder,
+            workers=args.workers,
+            overwrite=args.overwrite
+        )
+    print(
+        f"Построено облаков: {report.processed}, пропущено готовых: {report.skipped}\n"
+        f"{report.seconds:.1f} с, {report.maps_per_second:.2f} карт/с, "
+        f"{report.points_per_second / 1e6:.1f} млн точек/с"
+    )
 
-dataset = DisparityDataset(args.input_folder)
-recification_data = RectificationData.load('rectify.npz')
-reconstructor = StereoReconstructor(recification_data)
 
-for idx, map_images_pair in enumerate(dataset):
-    reconstructor.save_point_cloud(map_images_pair, models_folder / f'{idx}.ply')
+# пул процессов при запуске через spawn (Windows) заново импортирует этот модуль
+if __name__ == "__main__":
+    main()
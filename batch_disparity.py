@@ -0,0 +1,74 @@
+import argparse
+
+from stereocam.batch import compute_disparities
+
+
+DESCRIPTION = (
+    "Этот скрипт рассчитывает карты диспаратности для всех пар папки с кадрами\n"
+    "без камер и без окон, используя все ядра процессора.\n"
+    "Результат открывается как DisparityDataset и подходит для 5_stereo_reconstruction.py.\n"
+    "Повторный запуск рассчитывает только недостающие карты."
+)
+MAPS_PATH = 'transformation_map.npz'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument(
+        "frames",
+        type=str,
+        help="Путь к папке с парами кадров"
+    )
+    parser.add_argument(
+        "output",
+        type=str,
+        help="Путь к папке, в которую будут сохранены карты диспаратности"
+    )
+    parser.add_argument(
+        "--maps",
+        type=str,
+        default=MAPS_PATH,
+        help="Путь к файлу с картами ректификации"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Количество процессов. По умолчанию - число ядер"
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="Сохранять карты в отображаемое в память хранилище вместо отдельных .npz"
+    )
+    parser.add_argument(
+        "--codec",
+        choices=["zlib", "lz4"],
+        default=None,
+        help="Кодек сжатия для хранилища"
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Пересчитать уже рассчитанные карты"
+    )
+    args = parser.parse_args()
+
+    report = compute_disparities(
+        args.frames,
+        args.maps,
+        args.output,
+        workers=args.workers,
+        store=args.store,
+        codec=args.codec,
+        overwrite=args.overwrite
+    )
+    print(
+        f"Рассчитано карт: {report.processed}, пропущено: {report.skipped}, "
+        f"{report.seconds:.1f} с ({report.maps_per_second:.2f} карт/с)"
+    )
+
+
+# пул процессов в Windows запускает скрипт заново, поэтому нужна защита
+if __name__ == "__main__":
+    main()
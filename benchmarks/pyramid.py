@@ -0,0 +1,81 @@
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stereocam import DisparityEstimator  # noqa: E402
+from stereocam.synthetic import (  # noqa: E402
+    make_stereo_pair,
+    identity_transformation,
+    disparity_error,
+)
+
+DESCRIPTION = (
+    "Этот скрипт сравнивает качество и скорость поиска диспаратности\n"
+    "с помощью пирамиды и поиска во всем диапазоне на синтетических стереопарах.\n"
+    "Запускать из корня репозитория (нужен sgbm_config.yml)."
+)
+MODES = {
+    "3way": cv2.STEREO_SGBM_MODE_SGBM_3WAY,
+    "sgbm": cv2.STEREO_SGBM_MODE_SGBM,
+    "hh": cv2.STEREO_SGBM_MODE_HH,
+}
+
+parser = argparse.ArgumentParser(description=DESCRIPTION)
+parser.add_argument("--width", type=int, default=1920, help="Ширина кадра")
+parser.add_argument("--height", type=int, default=1080, help="Высота кадра")
+parser.add_argument("--mode", choices=MODES, default="sgbm", help="Режим SGBM")
+parser.add_argument("--scenes", type=int, default=3, help="Количество синтетических сцен")
+parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3], help="Уровни пирамиды")
+parser.add_argument("--tile", type=int, nargs=2, default=[256, 256], help="Ширина и высота тайла")
+args = parser.parse_args()
+
+size = (args.width, args.height)
+transformation = identity_transformation(size)
+estimators = {"full": DisparityEstimator(transformation)}
+for levels in args.levels:
+    estimators[f"pyramid x{2 ** levels}"] = DisparityEstimator(
+        transformation,
+        pyramid_levels=levels,
+        tile_size=tuple(args.tile)
+    )
+for estimator in estimators.values():
+    estimator.set_mode(MODES[args.mode])
+
+config = estimators["full"].config
+ignore_left = config.min_disparity + config.num_disparities
+results = {name: {"time": [], "bad": [], "mae": [], "agree": []} for name in estimators}
+for seed in range(args.scenes):
+    frames, ground_truth = make_stereo_pair(size, seed=seed)
+    rectified = estimators["full"].rectify(frames)
+    reference = None
+    for name, estimator in estimators.items():
+        start = time.perf_counter()
+        disparity = estimator.match(rectified)
+        results[name]["time"].append(time.perf_counter() - start)
+        if reference is None:
+            reference = disparity
+        error = disparity_error(disparity, ground_truth, ignore_left=ignore_left)
+        results[name]["bad"].append(error["bad"])
+        results[name]["mae"].append(error["mae"])
+        # совпадение с полным поиском на пикселях, валидных в обеих картах
+        both = (reference > reference.min()) & (disparity > disparity.min())
+        results[name]["agree"].append(float(np.mean(np.abs(disparity - reference)[both] <= 1)))
+
+base = np.mean(results["full"]["time"])
+print(
+    f"{'режим':>14} {'время, с':>9} {'ускорение':>9} "
+    f"{'bad > 1px':>9} {'MAE':>7} {'совпадение':>10}"
+)
+for name, result in results.items():
+    elapsed = np.mean(result["time"])
+    print(
+        f"{name:>14} {elapsed:9.3f} {base / elapsed:9.2f} "
+        f"{np.mean(result['bad']):9.4f} {np.mean(result['mae']):7.3f} "
+        f"{np.mean(result['agree']):10.4f}"
+    )
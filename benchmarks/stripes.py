@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stereocam import DisparityEstimator  # noqa: E402
+from stereocam.synthetic import make_stereo_pair, identity_transformation  # noqa: E402
+
+DESCRIPTION = (
+    "Этот скрипт измеряет ускорение параллельного сопоставления полосами\n"
+    "в зависимости от количества потоков на синтетической стереопаре.\n"
+    "Запускать из корня репозитория (нужен sgbm_config.yml)."
+)
+MODES = {
+    "3way": cv2.STEREO_SGBM_MODE_SGBM_3WAY,
+    "sgbm": cv2.STEREO_SGBM_MODE_SGBM,
+    "hh": cv2.STEREO_SGBM_MODE_HH,
+}
+
+parser = argparse.ArgumentParser(description=DESCRIPTION)
+parser.add_argument("--width", type=int, default=1920, help="Ширина кадра")
+parser.add_argument("--height", type=int, default=1080, help="Высота кадра")
+parser.add_argument("--mode", choices=MODES, default="sgbm", help="Режим SGBM")
+parser.add_argument("--repeats", type=int, default=5, help="Количество повторов")
+parser.add_argument("--overlap", type=int, default=None, help="Перекрытие полос в строках")
+args = parser.parse_args()
+
+
+def measure(estimator: DisparityEstimator, frames) -> float:
+    timings = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        estimator.match(frames)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+size = (args.width, args.height)
+frames, _ = make_stereo_pair(size)
+transformation = identity_transformation(size)
+
+reference = DisparityEstimator(transformation)
+reference.set_mode(MODES[args.mode])
+rectified = reference.rectify(frames)
+expected = reference.match(rectified)
+base = measure(reference, rectified)
+print(f"{'потоки':>6} {'время, с':>9} {'ускорение':>9} {'расхождение':>11}")
+print(f"{'-':>6} {base:9.3f} {1.0:9.2f} {0.0:11.5f}")
+
+for workers in range(1, (os.cpu_count() or 1) + 1):
+    estimator = DisparityEstimator(transformation, stripes=workers, overlap=args.overlap)
+    estimator.set_mode(MODES[args.mode])
+    disparity = estimator.match(rectified)
+    valid = (expected > expected.min()) | (disparity > disparity.min())
+    mismatch = float(np.mean(np.abs(disparity - expected)[valid] > 1))
+    elapsed = measure(estimator, rectified)
+    print(f"{workers:6d} {elapsed:9.3f} {base / elapsed:9.2f} {mismatch:11.5f}")
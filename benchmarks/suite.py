@@ -0,0 +1,391 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stereocam import DisparityEstimator, FramesDataset, StereoCalibrator  # noqa: E402
+from stereocam.calibration import RectificationData  # noqa: E402
+from stereocam.datasets import DisparityStore, Manifest, ManifestEntry  # noqa: E402
+from stereocam.depth import DepthLUT  # noqa: E402
+from stereocam.point_cloud import reproject_points  # noqa: E402
+from stereocam.stereo_reconstructor import StereoReconstructor  # noqa: E402
+from stereocam.synthetic import (  # noqa: E402
+    disparity_error,
+    identity_transformation,
+    make_chessboard_pairs,
+    make_stereo_pair,
+    synthetic_q_matrix,
+)
+from stereocam.writer import write_image  # noqa: E402
+
+DESCRIPTION = (
+    "Набор замеров производительности без камер на синтетических стереопарах.\n"
+    "run - замеряет время каждого этапа и точность относительно истинной диспаратности\n"
+    "и записывает результат в JSON, compare - сравнивает два запуска и отмечает регрессии.\n"
+    "Запускать из корня репозитория (нужен sgbm_config.yml)."
+)
+MODES = {
+    "3way": cv2.STEREO_SGBM_MODE_SGBM_3WAY,
+    "sgbm": cv2.STEREO_SGBM_MODE_SGBM,
+    "hh": cv2.STEREO_SGBM_MODE_HH,
+}
+# режимы DisparityEstimator, которые сравниваются с полным расчетом sgbm_3way
+ESTIMATORS = {
+    "stripes": {"stripes": 2},
+    "pyramid": {"pyramid_levels": 1},
+    "incremental": {"incremental": True},
+}
+# количество кадров последовательности для инкрементального режима
+INCREMENTAL_FRAMES = 8
+STAGES = (
+    "cvtColor", "remap", "rectify", "sgbm", "wls", "estimator", "reproject", "depth_lut",
+    "save_ply", "save_npz", "save_store", "dataset_load", "calibration",
+)
+
+
+def measure(func: Callable, repeat: int) -> dict:
+    """Медиана и минимум времени выполнения func"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"time": float(np.median(times)), "min": float(np.min(times))}
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def changing_sequence(
+    size: Tuple[int, int],
+    count: int
+) -> List[Tuple[list, np.ndarray]]:
+    """
+    Последовательность пар, в которых меняется только горизонтальная полоса
+
+    В каждой паре полоса строк (1/8 кадра) заменена на другую сцену, и от кадра к кадру
+    полоса сдвигается вниз. Строки ректифицированной пары независимы, поэтому
+    истинная диспаратность полосы берется из той же сцены.
+    """
+    (frames, ground_truth), (other, other_truth) = (
+        make_stereo_pair(size, seed=seed) for seed in (0, 1)
+    )
+    band = size[1] // 8
+    sequence = []
+    for idx in range(count):
+        rows = slice((idx % 8) * band, (idx % 8 + 1) * band)
+        pair = [frame.copy() for frame in frames]
+        truth = ground_truth.copy()
+        for frame, changed in zip(pair, other):
+            frame[rows] = changed[rows]
+        truth[rows] = other_truth[rows]
+        sequence.append((pair, truth))
+    return sequence
+
+
+def bench_estimator(
+    size: Tuple[int, int],
+    options: dict,
+    frames: list,
+    ground_truth: np.ndarray,
+    repeat: int,
+    ignore_left: int
+) -> dict:
+    """Время и точность :class:`DisparityEstimator` с заданными параметрами"""
+    estimator = DisparityEstimator(identity_transformation(size), **options)
+    if not estimator.incremental:
+        rectified = estimator.rectify(frames)
+        result = measure(lambda: estimator.match(rectified), repeat)
+        disparity = estimator.match(rectified)
+        result.update(disparity_error(disparity, ground_truth, ignore_left=ignore_left))
+        return result
+
+    # на одной и той же паре инкрементальный режим ничего не пересчитывает,
+    # поэтому замеряется последовательность кадров с меняющейся полосой
+    sequence = [
+        ([frame.copy() for frame in estimator.rectify(pair)], truth)
+        for pair, truth in changing_sequence(size, INCREMENTAL_FRAMES)
+    ]
+    estimator.match(sequence[-1][0])
+    position = 0
+    dirty = []
+
+    def step() -> None:
+        nonlocal position
+        estimator.match(sequence[position % len(sequence)][0])
+        dirty.append(estimator.dirty_fraction)
+        position += 1
+
+    result = measure(step, repeat)
+    # точность - на следующем кадре последовательности после замеров
+    rectified, truth = sequence[position % len(sequence)]
+    disparity = estimator.match(rectified)
+    result.update(disparity_error(disparity, truth, ignore_left=ignore_left))
+    result["dirty_fraction"] = float(np.mean(dirty))
+    return result
+
+
+def bench_size(
+    size: Tuple[int, int],
+    stages: List[str],
+    repeat: int,
+    pairs: int,
+    workdir: Path
+) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    frames, ground_truth = make_stereo_pair(size, seed=0)
+    estimator = DisparityEstimator(identity_transformation(size))
+    config = estimator.config
+    ignore_left = config.min_disparity + config.num_disparities
+    rectifier = estimator.rectifier
+
+    grays = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+    if "cvtColor" in stages:
+        results["cvtColor"] = measure(
+            lambda: [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames], repeat
+        )
+    if "remap" in stages:
+        maps = identity_transformation(size)
+        results["remap"] = measure(
+            lambda: [
+                cv2.remap(grays[0], maps.left_undistortion_map, maps.left_rectification_map,
+                          cv2.INTER_LINEAR),
+                cv2.remap(grays[1], maps.right_undistortion_map, maps.right_rectification_map,
+                          cv2.INTER_LINEAR),
+            ],
+            repeat
+        )
+    if "rectify" in stages:
+        results["rectify"] = measure(lambda: rectifier(frames), repeat)
+
+    rectified = estimator.rectify(frames)
+    raw = None
+    if "sgbm" in stages or "wls" in stages:
+        for name, mode in MODES.items():
+            estimator.set_mode(mode)
+            result = measure(lambda: estimator.match(rectified), repeat)
+            disparity = estimator.match(rectified)
+            result.update(disparity_error(disparity, ground_truth, ignore_left=ignore_left))
+            results[f"sgbm_{name}"] = result
+        estimator.set_mode(cv2.STEREO_SGBM_MODE_HH)
+        raw = (estimator.match(rectified) * 16).astype(np.int16)
+
+    if "wls" in stages:
+        mode = cv2.STEREO_SGBM_MODE_HH
+        wls_filter, left_matcher = estimator.registry.get_wls_filter(mode)
+        left = left_matcher.compute(*rectified).astype(np.int16)
+        right = estimator.registry.get_right_matcher(mode).compute(rectified[1], rectified[0])
+        result = measure(
+            lambda: wls_filter.filter(left, rectified[0], disparity_map_right=right), repeat
+        )
+        filtered = wls_filter.filter(left, rectified[0], disparity_map_right=right)
+        result.update(
+            disparity_error(filtered.astype(np.float32) / 16, ground_truth, ignore_left=ignore_left)
+        )
+        results["wls"] = result
+
+    if "estimator" in stages:
+        for name, options in ESTIMATORS.items():
+            results[f"estimator_{name}"] = bench_estimator(
+                size, options, frames, ground_truth, repeat, ignore_left
+            )
+
+    if raw is None:
+        raw = np.round(ground_truth * 16).astype(np.int16)
+    q_matrix = synthetic_q_matrix(size)
+    if "reproject" in stages:
+        result = measure(lambda: reproject_points(raw, q_matrix), repeat)
+        result["reference"] = measure(lambda: cv2.reprojectImageTo3D(raw, q_matrix), repeat)["time"]
+        results["reproject"] = result
+    if "depth_lut" in stages:
+        lut = DepthLUT(q_matrix)
+        results["depth_lut"] = measure(lambda: lut(raw), repeat)
+
+    rectification = RectificationData(
+        np.eye(3), np.eye(3), np.eye(3, 4), np.eye(3, 4), q_matrix, np.zeros(4), np.zeros(4)
+    )
+    if "save_ply" in stages:
+        reconstructor = StereoReconstructor(rectification)
+        results["save_ply"] = measure(
+            lambda: reconstructor.save_point_cloud((frames, raw), workdir / "cloud.ply"), repeat
+        )
+    if "save_npz" in stages:
+        results["save_npz"] = measure(
+            lambda: np.savez_compressed(workdir / "disparity.npz", disparity=raw), repeat
+        )
+    if "save_store" in stages:
+        (workdir / "store").mkdir(exist_ok=True)
+        with DisparityStore(workdir / "store") as store:
+            results["save_store"] = measure(lambda: store.append(raw), repeat)
+
+    if "dataset_load" in stages:
+        folder = workdir / f"frames_{size[0]}x{size[1]}"
+        folder.mkdir(exist_ok=True)
+        manifest = Manifest(folder)
+        for idx in range(pairs):
+            names = [f"{idx}_left.png", f"{idx}_right.png"]
+            for name, frame in zip(names, frames):
+                write_image(str(folder / name), frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            manifest.append(ManifestEntry(idx, names, shape=list(frames[0].shape), dtype="uint8"))
+        result = measure(lambda: FramesDataset(folder), repeat)
+        result["lazy_iterate"] = measure(
+            lambda: [pair for pair in FramesDataset(folder, lazy=True, prefetch=4)], repeat
+        )["time"]
+        results["dataset_load"] = result
+
+    if "calibration" in stages:
+        results["calibration"] = bench_calibration(size, pairs, workdir)
+    return results
+
+
+def bench_calibration(size: Tuple[int, int], pairs: int, workdir: Path) -> dict:
+    baseline = 3.0
+    views, camera_matrix = make_chessboard_pairs(size, count=max(pairs, 8), baseline=baseline)
+    folder = workdir / f"chessboard_{size[0]}x{size[1]}"
+    folder.mkdir(exist_ok=True)
+    manifest = Manifest(folder)
+    for idx, view in enumerate(views):
+        names = [f"{idx}_left.png", f"{idx}_right.png"]
+        for name, frame in zip(names, view):
+            write_image(str(folder / name), frame)
+        manifest.append(ManifestEntry(idx, names, shape=list(view[0].shape), dtype="uint8"))
+
+    calibrator = StereoCalibrator(FramesDataset(folder, lazy=True), (9, 6), 1.0)
+    start = time.perf_counter()
+    calibration_data, _, _ = calibrator.calibrate()
+    elapsed = time.perf_counter() - start
+    return {
+        "time": elapsed,
+        "min": elapsed,
+        "reprojection_error": float(calibration_data.reprojection_error),
+        "baseline_error": float(
+            abs(np.linalg.norm(calibration_data.translation_vector) - baseline) / baseline
+        ),
+        "focal_error": float(
+            abs(calibration_data.camera_matrix_left[0, 0] - camera_matrix[0, 0])
+            / camera_matrix[0, 0]
+        ),
+        "rejected": len(calibrator.rejected),
+    }
+
+
+def run(args: argparse.Namespace) -> None:
+    stages = args.stages or list(STAGES)
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "threads": cv2.getNumThreads(),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for text in args.sizes:
+            size = parse_size(text)
+            print(f"{text}...")
+            report["results"][text] = bench_size(
+                size, stages, args.repeat, args.pairs, Path(workdir)
+            )
+            for stage, result in report["results"][text].items():
+                extra = "".join(
+                    f" {key}={value:.4f}" for key, value in result.items()
+                    if key not in ("time", "min")
+                )
+                print(f"  {stage:>21} {result['time'] * 1000:9.2f} мс{extra}")
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+# метрики точности, которые ухудшаются при росте, и при уменьшении
+LOWER_IS_BETTER = ("bad", "mae", "reprojection_error", "baseline_error", "focal_error")
+HIGHER_IS_BETTER = ("density",)
+
+
+def compare(args: argparse.Namespace) -> None:
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    with open(args.candidate, encoding="utf-8") as file:
+        candidate = json.load(file)["results"]
+
+    regressions = 0
+    print(f"{'размер':>10} {'этап':>21} {'было, мс':>9} {'стало, мс':>9} {'x':>6}")
+    for size in baseline:
+        if size not in candidate:
+            continue
+        for stage, old in baseline[size].items():
+            new = candidate[size].get(stage)
+            if new is None:
+                continue
+            ratio = new["time"] / old["time"] if old["time"] else float("inf")
+            flags = []
+            if ratio > 1 + args.threshold:
+                flags.append("медленнее")
+            for key in LOWER_IS_BETTER:
+                if key in old and key in new and new[key] - old[key] > args.accuracy_tolerance:
+                    flags.append(f"{key} {old[key]:.4f} -> {new[key]:.4f}")
+            for key in HIGHER_IS_BETTER:
+                if key in old and key in new and old[key] - new[key] > args.accuracy_tolerance:
+                    flags.append(f"{key} {old[key]:.4f} -> {new[key]:.4f}")
+            regressions += bool(flags)
+            print(
+                f"{size:>10} {stage:>21} {old['time'] * 1000:9.2f} {new['time'] * 1000:9.2f} "
+                f"{ratio:6.2f} {'РЕГРЕССИЯ: ' + ', '.join(flags) if flags else ''}"
+            )
+    if regressions:
+        print(f"Регрессий: {regressions}")
+        sys.exit(1)
+    print("Регрессий нет")
+
+
+parser = argparse.ArgumentParser(
+    description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter
+)
+subparsers = parser.add_subparsers(dest="command", required=True)
+
+run_parser = subparsers.add_parser("run", help="Замерить этапы и записать JSON")
+run_parser.add_argument(
+    "--sizes", nargs="+", default=["640x480", "1280x720", "1920x1080"],
+    help="Разрешения кадров в формате ШxВ"
+)
+run_parser.add_argument(
+    "--stages", nargs="+", choices=STAGES, default=None, help="Этапы. По умолчанию - все"
+)
+run_parser.add_argument("--repeat", type=int, default=5, help="Количество повторов каждого замера")
+run_parser.add_argument(
+    "--pairs", type=int, default=8, help="Количество пар в датасетах для загрузки и калибровки"
+)
+run_parser.add_argument("--output", type=str, default="benchmark.json", help="Файл результатов")
+run_parser.set_defaults(func=run)
+
+compare_parser = subparsers.add_parser("compare", help="Сравнить два запуска")
+compare_parser.add_argument("baseline", type=str, help="JSON предыдущего запуска")
+compare_parser.add_argument("candidate", type=str, help="JSON нового запуска")
+compare_parser.add_argument(
+    "--threshold", type=float, default=0.1,
+    help="Допустимое относительное замедление этапа, по умолчанию 10%%"
+)
+compare_parser.add_argument(
+    "--accuracy-tolerance", type=float, default=0.005,
+    help="Допустимое ухудшение метрик точности (доли плохих пикселей, плотности и т.п.)"
+)
+compare_parser.set_defaults(func=compare)
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,46 @@
+import argparse
+from pathlib import Path
+
+from stereocam.datasets import DisparityDataset, DisparityStore
+
+
+DESCRIPTION = (
+    "Этот скрипт переводит папку с картами диспаратности в формате .npz\n"
+    "в отображаемое в память хранилище (файлы disparity_*.bin + manifest.jsonl).\n"
+    "Записи индекса для старых .npz заменяются записями хранилища,\n"
+    "сами .npz файлы не удаляются."
+)
+
+parser = argparse.ArgumentParser(description=DESCRIPTION)
+parser.add_argument(
+    "folder",
+    type=str,
+    help="Путь к папке, в которой сохранены карты диспаратности"
+)
+parser.add_argument(
+    "--codec",
+    choices=["zlib", "lz4"],
+    default=None,
+    help="Кодек сжатия. По умолчанию карты не сжимаются"
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    default=256,
+    help="Количество карт в одном файле хранилища"
+)
+args = parser.parse_args()
+
+folder = Path(args.folder)
+dataset = DisparityDataset(folder, lazy=True)
+entries = dataset.entries or [None] * len(dataset)
+with DisparityStore(folder, args.codec, args.chunk_size) as store:
+    for index, entry in enumerate(entries):
+        if entry is not None and entry.offset is not None:
+            continue
+        store.append(
+            dataset.get_disparity(index),
+            entry.id if entry is not None else index,
+            entry.timestamp if entry is not None else None
+        )
+print(f"{folder}: {len(dataset)} карт диспаратности")
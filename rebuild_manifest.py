@@ -0,0 +1,29 @@
+import argparse
+from pathlib import Path
+
+from stereocam.datasets import Manifest
+
+
+DESCRIPTION = (
+    "Этот скрипт строит индекс manifest.jsonl для папок, записанных без него.\n"
+    "Кадры объединяются в пары по именам {n}_left / {n}_right,\n"
+    "карты диспаратности - по именам {n}.npz.\n"
+    "Если в папке есть подпапка frames, индекс строится для обеих папок."
+)
+
+parser = argparse.ArgumentParser(description=DESCRIPTION)
+parser.add_argument(
+    "folder",
+    type=str,
+    help="Папка с кадрами или картами диспаратности"
+)
+args = parser.parse_args()
+
+folder = Path(args.folder)
+frames_folder = folder / "frames"
+if frames_folder.is_dir():
+    entries = Manifest(folder).rebuild_disparities()
+    print(f"{folder}: {len(entries)} карт диспаратности")
+    folder = frames_folder
+entries = Manifest(folder).rebuild_frames()
+print(f"{folder}: {len(entries)} пар кадров")
@@ -0,0 +1,221 @@
+import os
+import time
+import shutil
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Union
+
+import cv2
+import numpy as np
+from pathlib import Path
+
+from .calibration import TransformationMap
+from .datasets.frames import FramesDataset
+from .datasets.manifest import Manifest, ManifestEntry
+from .datasets.store import DisparityStore
+from .disparity_estimator import DisparityEstimator
+
+
+@dataclass
+class BatchReport:
+    """
+    Итоги пакетного расчета карт диспаратности
+
+    Аттрибуты
+    ---------
+    processed: :class:`int`
+        Количество рассчитанных карт
+    skipped: :class:`int`
+        Количество пар, карты которых уже были рассчитаны
+    seconds: :class:`float`
+        Время работы
+    """
+    processed: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def maps_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+
+def compute_disparities(
+    frames_folder: Union[str, Path],
+    transformation: Union[str, Path, TransformationMap],
+    output: Union[str, Path],
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    mode: int = cv2.STEREO_SGBM_MODE_HH,
+    store: bool = False,
+    codec: Optional[str] = None,
+    overwrite: bool = False
+) -> BatchReport:
+    """
+    Рассчитывает отфильтрованные карты диспаратности для всех пар папки с кадрами
+
+    Результат - папка, которую открывает :class:`DisparityDataset`:
+    карты {id}.npz (или хранилище :class:`DisparityStore`) с индексом manifest.jsonl
+    и папка frames с исходными кадрами (жесткие ссылки, если это возможно).
+    Карты совпадают с сохраняемыми :meth:`StereoPair.save_disparity`.
+
+    Пары распределяются по пулу процессов, в каждом процессе создается свой
+    :class:`DisparityEstimator`. Процессы сами читают кадры с диска,
+    в работе одновременно находится не больше max_pending пар.
+    Уже рассчитанные карты пропускаются, поэтому прерванную обработку
+    можно продолжить повторным запуском.
+
+    Параметры
+    ---------
+    frames_folder: :class:`str` | :class:`Path`
+        Папка :class:`FramesDataset` с парами кадров
+    transformation: :class:`str` | :class:`Path` | :class:`TransformationMap`
+        Карты ректификации или путь к transformation_map.npz
+    output: :class:`str` | :class:`Path`
+        Папка для карт диспаратности
+    workers: Optional[:class:`int`]
+        Количество процессов. По умолчанию - число ядер, 1 - в текущем процессе
+    max_pending: Optional[:class:`int`]
+        Максимальное количество пар в работе. По умолчанию - 2 на процесс
+    mode: :class:`int`
+        Режим SGBM
+    store: :class:`bool`
+        Записывать карты в :class:`DisparityStore` вместо отдельных .npz
+    codec: Optional[:class:`str`]
+        Кодек сжатия хранилища
+    overwrite: :class:`bool`
+        Пересчитывать уже рассчитанные карты
+
+    Возвращает
+    ----------
+    :class:`BatchReport`
+        Количество рассчитанных карт и время работы
+    """
+    frames_folder = Path(frames_folder)
+    output = Path(output)
+    if not isinstance(transformation, TransformationMap):
+        transformation = TransformationMap.load(transformation)
+    dataset = FramesDataset(frames_folder, lazy=True, cache_size=0)
+    output_frames = output / "frames"
+    output_frames.mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+
+    manifest = Manifest(output)
+    done = set()
+    if manifest.exists() and not overwrite:
+        done = {entry.id for entry in manifest.read()}
+    ids = [entry.id for entry in dataset.entries] or list(range(len(dataset)))
+    indices = [idx for idx in range(len(dataset)) if ids[idx] not in done]
+
+    report = BatchReport(skipped=len(dataset) - len(indices))
+    disparity_store = DisparityStore(output, codec) if store else None
+    started = time.perf_counter()
+
+    def finish(index: int, result: Union[np.ndarray, ManifestEntry]) -> None:
+        # сначала кадры, затем карта: после сбоя пара будет рассчитана заново
+        entry = _link_frames(dataset, index, ids[index], output_frames)
+        if disparity_store is not None:
+            disparity_store.append(result, entry.id, entry.timestamp)
+        else:
+            manifest.append(result)
+        report.processed += 1
+
+    try:
+        if workers == 1:
+            _init_worker(frames_folder, transformation, mode, output, store, threads=None)
+            for idx in indices:
+                finish(idx, _compute_index(idx, ids[idx]))
+        else:
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_init_worker,
+                initargs=(frames_folder, transformation, mode, output, store, 1)
+            ) as pool:
+                pending: Dict[Future, int] = {}
+                for idx in indices:
+                    if len(pending) >= max_pending:
+                        _finish_completed(pending, finish)
+                    pending[pool.submit(_compute_index, idx, ids[idx])] = idx
+                while pending:
+                    _finish_completed(pending, finish)
+    finally:
+        if disparity_store is not None:
+            disparity_store.close()
+
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _finish_completed(pending: Dict[Future, int], finish: Callable) -> None:
+    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+    for future in done:
+        finish(pending.pop(future), future.result())
+
+
+def _link_frames(
+    dataset: FramesDataset,
+    index: int,
+    entry_id: int,
+    folder: Path
+) -> ManifestEntry:
+    names = []
+    for path in dataset.pairs[index]:
+        target = folder / path.name
+        if not target.exists():
+            try:
+                os.link(path, target)
+            except OSError:
+                # другой диск или файловая система без жестких ссылок
+                shutil.copy2(path, target)
+        names.append(path.name)
+    if dataset.entries:
+        source = dataset.entries[index]
+        entry = ManifestEntry(entry_id, names, source.timestamp, source.shape, source.dtype)
+    else:
+        entry = ManifestEntry(entry_id, names, dataset.pairs[index][0].stat().st_mtime)
+    Manifest(folder).append(entry)
+    return entry
+
+
+# состояние процесса пула: датасет и оценщик создаются один раз на процесс
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(
+    frames_folder: Path,
+    transformation: TransformationMap,
+    mode: int,
+    output: Path,
+    store: bool,
+    threads: Optional[int]
+) -> None:
+    if threads is not None:
+        # параллельность дают процессы, внутренние потоки OpenCV только мешают друг другу
+        cv2.setNumThreads(threads)
+    estimator = DisparityEstimator(transformation)
+    estimator.set_mode(mode)
+    _worker["dataset"] = FramesDataset(frames_folder, lazy=True, cache_size=0)
+    _worker["estimator"] = estimator
+    _worker["output"] = output
+    _worker["store"] = store
+
+
+def _compute_index(index: int, entry_id: int) -> Union[np.ndarray, ManifestEntry]:
+    dataset: FramesDataset = _worker["dataset"]
+    estimator: DisparityEstimator = _worker["estimator"]
+    disparity = estimator.get_filtered_disparity(dataset[index])
+    if _worker["store"]:
+        # хранилище пишет только основной процесс
+        return disparity
+
+    path: Path = _worker["output"] / f"{entry_id}.npz"
+    temporary = path.with_name(f"{entry_id}.tmp.npz")
+    np.savez_compressed(temporary, disparity=disparity)
+    temporary.replace(path)
+    return ManifestEntry(
+        id=entry_id,
+        files=[path.name],
+        timestamp=time.time(),
+        shape=list(disparity.shape),
+        dtype=str(disparity.dtype)
+    )
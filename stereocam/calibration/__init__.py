@@ -1,2 +1,3 @@
 from .calibrator import StereoCalibrator
+from .corners import CornerCache
 from .models import *
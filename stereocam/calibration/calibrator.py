@@ -1,8 +1,14 @@
-from typing import Tuple, TYPE_CHECKING
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Optional, Tuple, Union, TYPE_CHECKING
+
+import pathlib
 
 import cv2
 import numpy as np
 
+from .corners import CornerCache, find_chessboard_corners, find_corners_in_file
 from .models import CalibrationData, RectificationData, TransformationMap
 
 if TYPE_CHECKING:
@@ -22,39 +28,128 @@ class StereoCalibrator:
         Например, 9x6 углов (9, 6)
     square_size: :class:`int`
         Длина квадрата доски в см.
+    workers: Optional[:class:`int`]
+        Количество процессов для поиска углов. По умолчанию - число ядер,
+        1 - искать в текущем процессе
+    detection_width: Optional[:class:`int`]
+        Ширина уменьшенной копии кадра, на которой ищется доска.
+        None - искать в полном разрешении
+    cache: Optional[:class:`str` | :class:`Path` | :class:`CornerCache`]
+        Кэш найденных углов. Если указан, углы ищутся только на новых
+        или измененных изображениях
+    rebuild_cache: :class:`bool`
+        Очистить кэш и найти углы на всех изображениях заново
+
+    Аттрибуты
+    ---------
+    rejected: List[:class:`int`]
+        Номера пар датасета, на которых доска не найдена хотя бы на одном кадре.
+        Заполняется в :meth:`calibrate`, такие пары в калибровке не участвуют
     """
     def __init__(
         self,
         dataset: "FramesDataset",
         pattern_size: Tuple[int],
-        square_size: int
+        square_size: int,
+        workers: Optional[int] = None,
+        detection_width: Optional[int] = 640,
+        cache: Optional[Union[str, pathlib.Path, CornerCache]] = None,
+        rebuild_cache: bool = False
     ) -> None:
         self.dataset = dataset
         self.pattern_size = pattern_size
         self.square_size = square_size
-        self.img_size = (dataset.images[0].shape[1], dataset.images[0].shape[0])
+        self.workers = workers or os.cpu_count() or 1
+        self.detection_width = detection_width
+        self.img_size = dataset.image_size
         self.criteria = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 100, 1e-5)
+        self.rejected: List[int] = []
+        if cache is not None and not isinstance(cache, CornerCache):
+            cache = CornerCache(cache)
+        if cache is not None and rebuild_cache:
+            cache.clear()
+        self.cache = cache
 
         pattern_points = np.zeros((np.prod(self.pattern_size), 3), np.float32)
         pattern_points[:, :2] = np.indices(self.pattern_size).T.reshape(-1, 2)
+        self._pattern_points = pattern_points
         self.pattern_points = [pattern_points] * len(dataset)
 
     def find_corners(
         self,
         image: cv2.typing.MatLike
-    ):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        _, corners = cv2.findChessboardCorners(gray, self.pattern_size)
-        corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), self.criteria)
+    ) -> Optional[np.ndarray]:
+        return find_chessboard_corners(
+            image,
+            self.pattern_size,
+            self.detection_width,
+            criteria=self.criteria
+        )
 
-        return corners
+    def detect_corners(self) -> Tuple[List[Optional[np.ndarray]], List[Optional[np.ndarray]]]:
+        """
+        Ищет углы доски на всех кадрах датасета
+
+        Кадры распределяются по пулу процессов, каждый процесс сам читает
+        изображение с диска, поэтому между процессами передаются только пути и углы.
+        Если задан кэш, обрабатываются только изображения, которых в нем нет.
+
+        Возвращает
+        ----------
+        Tuple[List[Optional[:class:`ndarray`]]]
+            Углы на левых и правых кадрах. None - доска не найдена
+        """
+        paths = [str(path) for pair in self.dataset.pairs for path in pair]
+        corners: List[Optional[np.ndarray]] = [None] * len(paths)
+        missing = list(range(len(paths)))
+        if self.cache is not None:
+            keys = [
+                CornerCache.key(path, self.pattern_size, self.detection_width, self.criteria)
+                for path in paths
+            ]
+            missing = [idx for idx in missing if keys[idx] not in self.cache]
+            for idx in set(range(len(paths))) - set(missing):
+                corners[idx] = self.cache.get(keys[idx])
+
+        detected = self._find_corners_in_files([paths[idx] for idx in missing])
+        for idx, found in zip(missing, detected):
+            corners[idx] = found
+            if self.cache is not None:
+                self.cache.put(keys[idx], found)
+        if self.cache is not None:
+            self.cache.save()
+        return corners[0::2], corners[1::2]
+
+    def _find_corners_in_files(self, paths: List[str]) -> List[Optional[np.ndarray]]:
+        args = (
+            paths,
+            repeat(self.pattern_size),
+            repeat(self.detection_width),
+            repeat(self.criteria)
+        )
+        if self.workers == 1 or len(paths) < 2:
+            return list(map(find_corners_in_file, *args))
+        chunksize = max(1, len(paths) // (self.workers * 4))
+        with ProcessPoolExecutor(self.workers) as pool:
+            return list(pool.map(find_corners_in_file, *args, chunksize=chunksize))
 
     def calibrate(self) -> Tuple[CalibrationData, RectificationData, TransformationMap]:
-        left_pts = []
-        right_pts = []
-        for left_image, right_image in self.dataset:
-            left_pts.append(self.find_corners(left_image))
-            right_pts.append(self.find_corners(right_image))
+        left_corners, right_corners = self.detect_corners()
+        self.rejected = [
+            idx for idx, (left, right) in enumerate(zip(left_corners, right_corners))
+            if left is None or right is None
+        ]
+        left_pts = [
+            left for left, right in zip(left_corners, right_corners)
+            if left is not None and right is not None
+        ]
+        right_pts = [
+            right for left, right in zip(left_corners, right_corners)
+            if left is not None and right is not None
+        ]
+        if not left_pts:
+            raise ValueError("Доска не найдена ни на одной паре кадров")
+        self.pattern_points = [self._pattern_points] * len(left_pts)
 
         _, mtx_l, dist_l, _, _ = cv2.calibrateCamera(
             self.pattern_points, left_pts, self.img_size, None, None
@@ -0,0 +1,176 @@
+import hashlib
+from typing import Dict, Optional, Tuple, Union
+
+import pathlib
+import cv2
+import numpy as np
+
+
+DEFAULT_CRITERIA = (cv2.TERM_CRITERIA_MAX_ITER + cv2.TERM_CRITERIA_EPS, 100, 1e-5)
+DETECTION_FLAGS = (
+    cv2.CALIB_CB_ADAPTIVE_THRESH
+    + cv2.CALIB_CB_NORMALIZE_IMAGE
+    + cv2.CALIB_CB_FAST_CHECK
+)
+
+
+def find_chessboard_corners(
+    image: cv2.typing.MatLike,
+    pattern_size: Tuple[int, int],
+    detection_width: Optional[int] = 640,
+    refine: bool = True,
+    criteria: Tuple = DEFAULT_CRITERIA,
+    fallback: bool = True
+) -> Optional[np.ndarray]:
+    """
+    Ищет углы шахматной доски
+
+    Доска ищется на уменьшенной копии изображения, найденные углы
+    масштабируются обратно и уточняются cornerSubPix в полном разрешении.
+
+    Параметры
+    ---------
+    image: :class:`MatLike`
+        Изображение BGR или в оттенках серого
+    pattern_size: Tuple[:class:`int`]
+        Количество внутренних углов доски
+    detection_width: Optional[:class:`int`]
+        Ширина копии для поиска. None - искать в полном разрешении
+    refine: :class:`bool`
+        Уточнять ли углы cornerSubPix
+    criteria: Tuple
+        Критерий остановки cornerSubPix
+    fallback: :class:`bool`
+        Повторить поиск в полном разрешении, если на уменьшенной копии доска не найдена
+
+    Возвращает
+    ----------
+    Optional[:class:`ndarray`]
+        Углы в координатах исходного изображения или None, если доска не найдена
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    scale = detection_scale(gray.shape[1], detection_width)
+    small = gray if scale == 1.0 else cv2.resize(
+        gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+    )
+
+    found, corners = cv2.findChessboardCorners(small, pattern_size, flags=DETECTION_FLAGS)
+    if not found and fallback and scale != 1.0:
+        scale = 1.0
+        found, corners = cv2.findChessboardCorners(gray, pattern_size, flags=DETECTION_FLAGS)
+    if not found:
+        return None
+
+    corners = (corners / scale).astype(np.float32)
+    if refine:
+        corners = refine_chessboard_corners(gray, corners, scale, criteria)
+    return corners
+
+
+def detection_scale(width: int, detection_width: Optional[int]) -> float:
+    """Коэффициент уменьшения кадра шириной width для поиска доски"""
+    if detection_width is None or width <= detection_width:
+        return 1.0
+    return detection_width / width
+
+
+def refine_chessboard_corners(
+    gray: cv2.typing.MatLike,
+    corners: np.ndarray,
+    scale: float = 1.0,
+    criteria: Tuple = DEFAULT_CRITERIA
+) -> np.ndarray:
+    """
+    Уточняет углы, найденные на уменьшенной в scale раз копии, в полном разрешении
+    """
+    # окно поиска должно покрывать ошибку масштабирования
+    half = max(5, int(np.ceil(2 / scale)) + 3)
+    return cv2.cornerSubPix(gray, corners, (half, half), (-1, -1), criteria)
+
+
+def find_corners_in_file(
+    path: Union[str, pathlib.Path],
+    pattern_size: Tuple[int, int],
+    detection_width: Optional[int] = 640,
+    criteria: Tuple = DEFAULT_CRITERIA
+) -> Optional[np.ndarray]:
+    """
+    Читает изображение с диска и ищет на нем углы доски
+
+    Используется пулом процессов: в процесс передается только путь,
+    а не декодированное изображение
+    """
+    gray = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None
+    return find_chessboard_corners(gray, pattern_size, detection_width, criteria=criteria)
+
+
+class CornerCache:
+    """
+    Кэш найденных углов доски на диске
+
+    Ключ записи - хэш содержимого изображения, размер доски и параметры поиска,
+    поэтому при повторной калибровке обрабатываются только новые
+    или измененные изображения. Кадры, на которых доска не найдена,
+    тоже запоминаются.
+
+    Параметры
+    ---------
+    path: :class:`str` | :class:`Path`
+        Путь к .npz файлу кэша
+    """
+    def __init__(self, path: Union[str, pathlib.Path]) -> None:
+        self.path = pathlib.Path(path)
+        self._entries: Dict[str, np.ndarray] = {}
+        self._changed = False
+        if self.path.is_file():
+            with np.load(self.path) as data:
+                self._entries = {key: data[key] for key in data.files}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def key(
+        path: Union[str, pathlib.Path],
+        pattern_size: Tuple[int, int],
+        detection_width: Optional[int],
+        criteria: Tuple
+    ) -> str:
+        """Ключ записи для изображения и параметров поиска"""
+        digest = hashlib.sha1()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(repr((tuple(pattern_size), detection_width, tuple(criteria))).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Углы из кэша. None - доска на изображении не найдена"""
+        corners = self._entries[key]
+        return corners if corners.size else None
+
+    def put(self, key: str, corners: Optional[np.ndarray]) -> None:
+        if corners is None:
+            corners = np.empty((0, 1, 2), np.float32)
+        self._entries[key] = corners
+        self._changed = True
+
+    def clear(self) -> None:
+        """Удаляет все записи"""
+        self._entries = {}
+        self._changed = True
+
+    def save(self) -> None:
+        """Записывает кэш на диск, если он изменился"""
+        if not self._changed:
+            return
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "wb") as file:
+            np.savez(file, **self._entries)
+        temporary.replace(self.path)
+        self._changed = False
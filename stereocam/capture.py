@@ -0,0 +1,226 @@
+import time
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+import cv2
+
+from .types import ImagePair
+
+if TYPE_CHECKING:
+    from .sources import FrameSource
+
+
+@dataclass
+class StampedPair:
+    """
+    Синхронизированная пара кадров
+
+    Аттрибуты
+    ---------
+    frames: :class:`ImagePair`
+        Левый и правый кадр
+    timestamps: Tuple[:class:`float`]
+        Моменты вызова grab() для каждой камеры (time.monotonic, в секундах)
+    index: :class:`int`
+        Порядковый номер пары с момента запуска захвата
+    """
+    frames: ImagePair
+    timestamps: Tuple[float, float]
+    index: int
+
+    @property
+    def timestamp(self) -> float:
+        """Среднее время захвата пары"""
+        return sum(self.timestamps) / len(self.timestamps)
+
+    @property
+    def skew(self) -> float:
+        """Рассинхронизация между камерами в секундах"""
+        return abs(self.timestamps[0] - self.timestamps[1])
+
+
+class StereoCapture:
+    """
+    Фоновый синхронизированный захват кадров с двух источников
+
+    На каждый источник запускается отдельный поток.
+    Потоки одновременно вызывают grab(), и только после этого декодируют кадры
+    через retrieve(), поэтому время декодирования не увеличивает рассинхронизацию.
+    Готовые пары попадают в кольцевой буфер, из которого читатель всегда
+    получает самую свежую пару и никогда не получает одну пару дважды.
+
+    Подходит для любых :class:`VideoCapture`, в том числе для видеофайлов.
+    Источники :class:`FrameSource`, отдающие пару целиком (склеенный поток,
+    папка с кадрами), читаются одним потоком.
+
+    Параметры
+    ---------
+    captures: List[:class:`VideoCapture`] | :class:`FrameSource`
+        Левый и правый источник
+    buffer_size: :class:`int`
+        Размер кольцевого буфера пар
+    max_skew: Optional[:class:`float`]
+        Максимально допустимая рассинхронизация в секундах.
+        Пары с большей рассинхронизацией отбрасываются
+
+    Аттрибуты
+    ---------
+    dropped: :class:`int`
+        Количество пар, отброшенных из-за рассинхронизации
+    """
+    def __init__(
+        self,
+        captures: Union[List[cv2.VideoCapture], "FrameSource"],
+        buffer_size: int = 2,
+        max_skew: Optional[float] = None
+    ) -> None:
+        self.source: Optional["FrameSource"] = None
+        if not isinstance(captures, list):
+            self.source = captures
+            captures = list(captures.captures)
+            if not captures:
+                captures = [self.source]
+        if len(captures) not in (1, 2) or (len(captures) == 1 and self.source is None):
+            raise ValueError("Необходимо ровно два источника")
+        self.captures = captures
+        self.max_skew = max_skew
+        self.dropped = 0
+
+        self._buffer: deque = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._slots: List[Optional[Tuple[float, bool, Optional[cv2.typing.MatLike]]]] = [None, None]
+        self._barrier = threading.Barrier(len(captures), action=self._publish)
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._finished = False
+        self._produced = 0
+        self._last_read = -1
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def finished(self) -> bool:
+        """Истина, если один из источников закончился (например, конец видеофайла)"""
+        return self._finished
+
+    def start(self) -> "StereoCapture":
+        """Запускает потоки захвата"""
+        if self._running:
+            return self
+        self._running = True
+        self._finished = False
+        self._barrier.reset()
+        if len(self.captures) == 1:
+            self._threads = [threading.Thread(target=self._read_loop, daemon=True)]
+        else:
+            self._threads = [
+                threading.Thread(target=self._grab_loop, args=(idx,), daemon=True)
+                for idx in range(len(self.captures))
+            ]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Останавливает потоки захвата и дожидается их завершения"""
+        self._running = False
+        self._barrier.abort()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._condition:
+            self._condition.notify_all()
+
+    def __enter__(self) -> "StereoCapture":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def latest(self) -> Optional[StampedPair]:
+        """Возвращает последнюю захваченную пару без ожидания, даже если она уже была прочитана"""
+        with self._condition:
+            return self._buffer[-1] if self._buffer else None
+
+    def read(self, timeout: Optional[float] = None) -> Optional[StampedPair]:
+        """
+        Возвращает самую свежую, еще не прочитанную пару
+
+        Если новой пары нет, ждет ее появления.
+
+        Параметры
+        ---------
+        timeout: Optional[:class:`float`]
+            Максимальное время ожидания в секундах
+
+        Возвращает
+        ----------
+        Optional[:class:`StampedPair`]
+            Пара кадров или None, если время ожидания истекло
+            или захват остановлен
+        """
+        with self._condition:
+            ready = self._condition.wait_for(
+                lambda: self._has_new() or not self._running,
+                timeout
+            )
+            if not ready or not self._has_new():
+                return None
+            pair = self._buffer[-1]
+            self._last_read = pair.index
+            return pair
+
+    def _has_new(self) -> bool:
+        return bool(self._buffer) and self._buffer[-1].index > self._last_read
+
+    def _grab_loop(self, idx: int) -> None:
+        capture = self.captures[idx]
+        while self._running:
+            try:
+                # оба потока вызывают grab() одновременно
+                self._barrier.wait()
+                timestamp = time.monotonic()
+                grabbed = capture.grab()
+                frame = capture.retrieve()[1] if grabbed else None
+                self._slots[idx] = (timestamp, grabbed, frame)
+                # после второго барьера пара публикуется в буфер
+                self._barrier.wait()
+            except threading.BrokenBarrierError:
+                break
+
+    def _read_loop(self) -> None:
+        # пара приходит целиком, поэтому синхронизировать нечего
+        while self._running:
+            timestamp = time.monotonic()
+            grabbed = self.source.grab()
+            frames = self.source.retrieve() if grabbed else [None, None]
+            self._slots = [
+                (timestamp, grabbed and frame is not None, frame) for frame in frames
+            ]
+            self._publish()
+
+    def _publish(self) -> None:
+        # выполняется ровно одним потоком, когда оба кадра готовы
+        if not self._running or self._slots[0] is None or self._slots[1] is None:
+            return
+        (left_ts, left_ok, left), (right_ts, right_ok, right) = self._slots
+        self._slots = [None, None]
+        if not (left_ok and right_ok):
+            self._finished = True
+            self._running = False
+            with self._condition:
+                self._condition.notify_all()
+            return
+
+        pair = StampedPair([left, right], (left_ts, right_ts), self._produced)
+        self._produced += 1
+        if self.max_skew is not None and pair.skew > self.max_skew:
+            self.dropped += 1
+            return
+        with self._condition:
+            self._buffer.append(pair)
+            self._condition.notify_all()
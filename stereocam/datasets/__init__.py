@@ -1,2 +1,4 @@
 from .disparities import DisparityDataset
 from .frames import FramesDataset
+from .manifest import Manifest, ManifestEntry
+from .store import DisparityStore
@@ -6,6 +6,8 @@ import cv2
 import numpy as np
 
 from .frames import FramesDataset
+from .manifest import Manifest, ManifestEntry
+from .store import DisparityStore
 from ..abc import AbstractDataset
 from ..types import MapImagesPair
 from ..calibration import DisparityMap
@@ -14,45 +16,99 @@ from ..calibration import DisparityMap
 class DisparityDataset(AbstractDataset):
     def __init__(
         self,
-        path: Union[str, pathlib.Path]
+        path: Union[str, pathlib.Path],
+        lazy: bool = False,
+        cache_size: int = 512 * 2 ** 20,
+        prefetch: int = 0
     ) -> None:
+        """
+        Класс для работы с сохраненными картами диспаратности
+
+        Параметры
+        ---------
+        path: :class:`str` | :class:`Path`
+            Путь к папке с картами диспаратности и папкой frames
+        lazy: :class:`bool`
+            Ленивая загрузка кадров и карт, см. :class:`FramesDataset`
+        cache_size: :class:`int`
+            Максимальный размер кеша декодированных кадров в байтах (для lazy)
+        prefetch: :class:`int`
+            Сколько следующих пар кадров декодировать заранее (для lazy)
+
+        Список карт читается из индекса manifest.jsonl, если он есть в папке
+        """
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.prefetch = prefetch
         super().__init__(path)
 
     def __len__(self):
-        return len(self.disparities)
+        return len(self.disparity_paths)
 
     def __iter__(self) -> "DisparityIterator":
-        return DisparityIterator(self.frames, self.disparities)
+        return DisparityIterator(self)
 
     def __getitem__(self, index) -> Sequence:
         if index < 0 or index >= len(self):
             raise IndexError("Индекс вне диапазона")
-        return self.frames[index], self.disparities[index].disparity
+        return self.frames[index], self.get_disparity(index)
+
+    def get_disparity(self, index: int) -> np.ndarray:
+        """
+        Возвращает карту диспаратности без декодирования кадров
+
+        Карты из :class:`DisparityStore` без кодека возвращаются
+        как :class:`numpy.memmap` без копирования
+        """
+        entry = self.entries[index] if self.entries else None
+        if entry is not None and entry.offset is not None:
+            return self.store.read(entry)
+        if self.lazy:
+            return DisparityMap.load(self.disparity_paths[index]).disparity
+        return self.disparities[index].disparity
 
     def _load(self):
         self.frames_folder = self.folder / "frames"
-        self.frames = FramesDataset(self.frames_folder)
-        file_paths = sorted(self.folder.glob("*.npz"), key=lambda f: f.stat().st_mtime)
-        self.disparities = [DisparityMap.load(disparity) for disparity in file_paths]
+        self.frames = FramesDataset(
+            self.frames_folder,
+            lazy=self.lazy,
+            cache_size=self.cache_size,
+            prefetch=self.prefetch
+        )
+        manifest = Manifest(self.folder)
+        self.store = DisparityStore(self.folder)
+        self.entries: List[ManifestEntry] = []
+        if manifest.exists():
+            self.entries = manifest.read()
+            file_paths = [self.folder / entry.files[0] for entry in self.entries]
+        else:
+            file_paths = sorted(self.folder.glob("*.npz"), key=lambda f: f.stat().st_mtime)
+        self.disparity_paths = file_paths
+        if not self.lazy:
+            # карты из хранилища и так отображаются в память, загружаем только .npz
+            self.disparities = [
+                None if entry is not None and entry.offset is not None
+                else DisparityMap.load(path)
+                for entry, path in zip(self.entries or [None] * len(file_paths), file_paths)
+            ]
 
 
 class DisparityIterator(Iterator):
     def __init__(
         self,
-        frames: FramesDataset,
-        disparites: List[DisparityMap]
+        dataset: DisparityDataset
     ) -> None:
-        self.frames = frames
-        self.disparities = disparites
+        self.dataset = dataset
         self.pos = 0
 
     def __next__(self) -> MapImagesPair:
-        if self.pos >= len(self.frames):
+        if self.pos >= len(self.dataset):
             raise StopIteration
-        frame_pair = self.frames[self.pos]
-        disparity_map = self.disparities[self.pos].disparity
+        frames = self.dataset.frames
+        frames.prefetch_pairs(range(self.pos + 1, self.pos + 1 + frames.prefetch))
+        map_images_pair = self.dataset[self.pos]
         self.pos += 1
-        return frame_pair, disparity_map
+        return map_images_pair
 
     def __iter__(self):
         return self
@@ -1,18 +1,28 @@
-from typing import Union, List, Sequence
+from typing import Dict, Iterable, Optional, Tuple, Union, List, Sequence
+from collections import OrderedDict
 from collections.abc import Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import pathlib
+import threading
 import cv2
 
-from ..stereo_pair import StereoPair
+from .manifest import Manifest, ManifestEntry
 from ..abc import AbstractDataset
 from ..types import ImagePair
 
 
+# расширения, которые читает cv2.imread; остальные файлы папки без индекса пропускаются
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+
+
 class FramesDataset(AbstractDataset):
     def __init__(
         self,
-        path: Union[str, pathlib.Path]
+        path: Union[str, pathlib.Path],
+        lazy: bool = False,
+        cache_size: int = 512 * 2 ** 20,
+        prefetch: int = 0
     ) -> None:
         """
         Класс для работы с датасетом
@@ -21,37 +31,127 @@ class FramesDataset(AbstractDataset):
         ---------
         path: :class:`str` | :class:`Path`
             Путь к папке с датасетом
+        lazy: :class:`bool`
+            Ленивая загрузка. При загрузке строится только список пар,
+            изображения декодируются при обращении и хранятся в LRU кеше
+        cache_size: :class:`int`
+            Максимальный размер кеша декодированных пар в байтах (для lazy)
+        prefetch: :class:`int`
+            Сколько следующих пар декодировать заранее в фоновых потоках
+            при итерировании (для lazy)
 
         Аттрибуты
         ---------
         folder: :class:`Path`
             Путь к папке с датасетом
+        pairs: List[Tuple[:class:`Path`]]
+            Пути к левому и правому изображению каждой пары
+        entries: List[:class:`ManifestEntry`]
+            Записи индекса (manifest.jsonl), если он есть в папке
+
+        Если в папке есть индекс manifest.jsonl, список пар читается из него.
+        Иначе файлы сортируются по времени изменения, как в старых датасетах.
+        Индекс для таких папок строится скриптом rebuild_manifest.py
         """
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self._cache: "OrderedDict[int, ImagePair]" = OrderedDict()
+        self._cache_bytes = 0
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
         super().__init__(path)
 
     def __iter__(self) -> "FramesIterator":
-        return FramesIterator(self.images)
+        return FramesIterator(self)
 
     def __len__(self) -> int:
-        return len(self.images) // 2
+        return len(self.pairs)
 
     def __getitem__(self, index: int) -> Sequence:
         if index < 0 or index >= len(self):
             raise IndexError("Индекс вне диапазона")
-        return self.images[index * 2:index * 2 + 2]
+        if not self.lazy:
+            return self.images[index * 2:index * 2 + 2]
+        return self._get_cached(index)
+
+    @property
+    def image_size(self) -> Tuple[int, int]:
+        """Ширина и высота изображений датасета (декодируется только первая пара)"""
+        if self.entries and self.entries[0].shape is not None:
+            height, width = self.entries[0].shape[:2]
+            return width, height
+        image = self[0][0]
+        return image.shape[1], image.shape[0]
 
     def _load(self) -> None:
-        file_paths = sorted(self.folder.glob("*"), key=lambda f: f.stat().st_mtime)
-        self.images = [cv2.imread(str(image)) for image in file_paths]
-        images_amount = len(self.images)
+        manifest = Manifest(self.folder)
+        self.entries: List[ManifestEntry] = []
+        if manifest.exists():
+            self.entries = manifest.read()
+            file_paths = [self.folder / name for entry in self.entries for name in entry.files]
+        else:
+            file_paths = sorted(
+                (
+                    path for path in self.folder.iterdir()
+                    if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+                ),
+                key=lambda f: f.stat().st_mtime
+            )
+        images_amount = len(file_paths)
         amount_valid = (images_amount != 0 and images_amount % 2 == 0)
         if not amount_valid:
             raise ValueError(f"Неккоректное количество изображений {images_amount}")
+        self.pairs = [tuple(file_paths[idx:idx + 2]) for idx in range(0, images_amount, 2)]
+        if not self.lazy:
+            self.images = [cv2.imread(str(image)) for image in file_paths]
+
+    def _decode(self, index: int) -> ImagePair:
+        return [cv2.imread(str(image)) for image in self.pairs[index]]
+
+    def _get_cached(self, index: int) -> ImagePair:
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return list(self._cache[index])
+            future = self._pending.get(index)
+
+        pair = future.result() if future is not None else self._decode(index)
+        self._store(index, pair)
+        return list(pair)
+
+    def _store(self, index: int, pair: ImagePair) -> None:
+        with self._lock:
+            self._pending.pop(index, None)
+            if index in self._cache:
+                return
+            self._cache[index] = pair
+            self._cache_bytes += sum(image.nbytes for image in pair if image is not None)
+            # вытесняем давно не используемые пары, но не только что добавленную
+            while self._cache_bytes > self.cache_size and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= sum(image.nbytes for image in evicted if image is not None)
+
+    def prefetch_pairs(self, indices: Iterable[int]) -> None:
+        """Запускает фоновое декодирование пар, которых еще нет в кеше"""
+        if not self.lazy or self.prefetch <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.prefetch)
+            for index in indices:
+                if 0 <= index < len(self) and index not in self._cache \
+                        and index not in self._pending:
+                    self._pending[index] = self._executor.submit(self._decode, index)
 
     def show(self) -> None:
         """Показывает все изображения внутри датасета
         Для переключения изображений достаточно нажать кнопку на клавиатуре
         """
+        # stereo_pair сам пишет индекс датасета, поэтому импортируем его здесь
+        from ..stereo_pair import StereoPair
+
         for frames in FramesDataset("dataset"):
             for idx, frame in enumerate(frames):
                 cv2.imshow(StereoPair._sides[idx], frame)
@@ -61,16 +161,19 @@ class FramesDataset(AbstractDataset):
 class FramesIterator(Iterator):
     def __init__(
         self,
-        images: ImagePair
+        dataset: FramesDataset
     ) -> None:
-        self.images = images
+        self.dataset = dataset
         self.pos = 0
 
     def __next__(self) -> ImagePair:
-        if self.pos + 1 >= len(self.images):
+        if self.pos >= len(self.dataset):
             raise StopIteration
-        pair = self.images[self.pos:self.pos + 2]
-        self.pos += 2
+        self.dataset.prefetch_pairs(
+            range(self.pos + 1, self.pos + 1 + self.dataset.prefetch)
+        )
+        pair = self.dataset[self.pos]
+        self.pos += 1
         return pair
 
     def __iter__(self) -> "FramesIterator":
@@ -0,0 +1,134 @@
+import re
+import json
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Union
+
+import pathlib
+
+MANIFEST_NAME = "manifest.jsonl"
+
+_FRAME_PATTERN = re.compile(r"^(\d+)_(left|right)\.\w+$")
+_DISPARITY_PATTERN = re.compile(r"^(\d+)\.npz$")
+_lock = threading.Lock()
+
+
+@dataclass
+class ManifestEntry:
+    """
+    Запись индекса датасета
+
+    Аттрибуты
+    ---------
+    id: :class:`int`
+        Номер пары
+    files: List[:class:`str`]
+        Имена файлов относительно папки датасета.
+        Для кадров - левый и правый, для карт диспаратности - один файл
+    timestamp: Optional[:class:`float`]
+        Время захвата (unix time)
+    shape: Optional[List[:class:`int`]]
+        Размерность массива
+    dtype: Optional[:class:`str`]
+        Тип элементов массива
+    offset: Optional[:class:`int`]
+        Смещение в байтах внутри файла хранилища (см. :class:`DisparityStore`)
+    length: Optional[:class:`int`]
+        Длина записи в байтах внутри файла хранилища
+    codec: Optional[:class:`str`]
+        Кодек сжатия записи. None - данные не сжаты
+    """
+    id: int
+    files: List[str]
+    timestamp: Optional[float] = None
+    shape: Optional[List[int]] = None
+    dtype: Optional[str] = None
+    offset: Optional[int] = None
+    length: Optional[int] = None
+    codec: Optional[str] = None
+
+
+class Manifest:
+    """
+    Индекс датасета в файле manifest.jsonl
+
+    Каждая строка файла - одна запись :class:`ManifestEntry`.
+    Новые записи дописываются в конец, поэтому сохранение кадра
+    не требует перезаписи индекса. При чтении для повторяющихся id
+    остается последняя запись.
+
+    Параметры
+    ---------
+    folder: :class:`str` | :class:`Path`
+        Папка датасета
+    """
+    def __init__(self, folder: Union[str, pathlib.Path]) -> None:
+        self.folder = pathlib.Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def read(self) -> List[ManifestEntry]:
+        """Читает записи, упорядоченные по id"""
+        entries: Dict[int, ManifestEntry] = {}
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    entry = ManifestEntry(**json.loads(line))
+                    entries[entry.id] = entry
+        return [entries[key] for key in sorted(entries)]
+
+    def append(self, entry: ManifestEntry) -> None:
+        """Дописывает запись в конец индекса"""
+        line = json.dumps(asdict(entry), ensure_ascii=False) + "\n"
+        with _lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(line)
+
+    def write(self, entries: List[ManifestEntry]) -> None:
+        """Перезаписывает индекс целиком"""
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "w", encoding="utf-8") as file:
+            for entry in entries:
+                file.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+        temporary.replace(self.path)
+
+    def rebuild_frames(self) -> List[ManifestEntry]:
+        """
+        Строит индекс папки с кадрами по именам файлов {n}_left / {n}_right
+
+        Пары, у которых нет одного из кадров, пропускаются.
+        """
+        sides: Dict[int, Dict[str, pathlib.Path]] = {}
+        for path in self.folder.iterdir():
+            match = _FRAME_PATTERN.match(path.name)
+            if match is not None:
+                sides.setdefault(int(match.group(1)), {})[match.group(2)] = path
+        entries = [
+            ManifestEntry(
+                id=n,
+                files=[pair["left"].name, pair["right"].name],
+                timestamp=pair["left"].stat().st_mtime
+            )
+            for n, pair in sorted(sides.items())
+            if "left" in pair and "right" in pair
+        ]
+        self.write(entries)
+        return entries
+
+    def rebuild_disparities(self) -> List[ManifestEntry]:
+        """Строит индекс папки с картами диспаратности по именам файлов {n}.npz"""
+        entries = []
+        for path in self.folder.iterdir():
+            match = _DISPARITY_PATTERN.match(path.name)
+            if match is not None:
+                entries.append(
+                    ManifestEntry(
+                        id=int(match.group(1)),
+                        files=[path.name],
+                        timestamp=path.stat().st_mtime
+                    )
+                )
+        entries.sort(key=lambda entry: entry.id)
+        self.write(entries)
+        return entries
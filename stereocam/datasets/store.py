@@ -0,0 +1,169 @@
+import time
+import zlib
+import threading
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import pathlib
+import numpy as np
+
+from .manifest import Manifest, ManifestEntry
+
+
+def _lz4() -> Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    try:
+        import lz4.frame
+    except ImportError as error:
+        raise ImportError("Для кодека lz4 установите пакет lz4: pip install lz4") from error
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+# кодеки возвращают пару функций (сжатие, распаковка)
+CODECS: Dict[str, Callable[[], Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]]] = {
+    "zlib": lambda: (lambda data: zlib.compress(data, 1), zlib.decompress),
+    "lz4": _lz4,
+}
+
+
+class DisparityStore:
+    """
+    Хранилище карт диспаратности в больших файлах-чанках
+
+    Карты записываются подряд в файлы disparity_{n}.bin, положение каждой карты
+    хранится в индексе manifest.jsonl. Без кодека файл чанка заранее выделяется
+    на chunk_size карт, а при чтении карты отдаются как представления
+    :class:`numpy.memmap` без копирования. С кодеком каждая карта сжимается
+    отдельно и при чтении распаковывается.
+
+    Параметры
+    ---------
+    folder: :class:`str` | :class:`Path`
+        Папка с картами диспаратности
+    codec: Optional[:class:`str`]
+        Кодек сжатия: None, "zlib" (уровень 1) или "lz4" (нужен пакет lz4)
+    chunk_size: :class:`int`
+        Количество карт в одном файле
+    """
+    def __init__(
+        self,
+        folder: Union[str, pathlib.Path],
+        codec: Optional[str] = None,
+        chunk_size: int = 256
+    ) -> None:
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Неизвестный кодек {codec}")
+        self.folder = pathlib.Path(folder)
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.manifest = Manifest(self.folder)
+        self._compress = CODECS[codec]()[0] if codec is not None else None
+        self._lock = threading.Lock()
+        self._file = None
+        self._chunk: Optional[pathlib.Path] = None
+        self._chunk_capacity = 0
+        self._position = 0
+        self._count = 0
+        self._maps: Dict[str, np.memmap] = {}
+
+    def append(
+        self,
+        disparity: np.ndarray,
+        entry_id: Optional[int] = None,
+        timestamp: Optional[float] = None
+    ) -> ManifestEntry:
+        """
+        Дописывает карту в хранилище и в индекс
+
+        Параметры
+        ---------
+        disparity: :class:`ndarray`
+            Карта диспаратности
+        entry_id: Optional[:class:`int`]
+            Номер карты. По умолчанию - порядковый номер записи в этом хранилище
+        timestamp: Optional[:class:`float`]
+            Время захвата (unix time). По умолчанию - текущее время
+        """
+        disparity = np.ascontiguousarray(disparity)
+        if self._compress is None:
+            data = disparity.reshape(-1).view(np.uint8).data
+        else:
+            data = self._compress(disparity.tobytes())
+        with self._lock:
+            if entry_id is None:
+                entry_id = self._count
+            if self._file is None or self._position + len(data) > self._chunk_capacity:
+                self._open_chunk(disparity.nbytes)
+            offset = self._position
+            self._file.seek(offset)
+            self._file.write(data)
+            self._position += len(data)
+            self._count += 1
+            entry = ManifestEntry(
+                id=entry_id,
+                files=[self._chunk.name],
+                timestamp=time.time() if timestamp is None else timestamp,
+                shape=list(disparity.shape),
+                dtype=str(disparity.dtype),
+                offset=offset,
+                length=len(data),
+                codec=self.codec
+            )
+            self._file.flush()
+            self.manifest.append(entry)
+        return entry
+
+    def _open_chunk(self, frame_bytes: int) -> None:
+        self._close_chunk()
+        number = 0
+        while (self.folder / f"disparity_{number:04d}.bin").exists():
+            number += 1
+        self._chunk = self.folder / f"disparity_{number:04d}.bin"
+        self._chunk_capacity = frame_bytes * self.chunk_size
+        self._position = 0
+        self._file = open(self._chunk, "w+b")
+        if self.codec is None:
+            # заранее выделяем место под весь чанк
+            self._file.truncate(self._chunk_capacity)
+
+    def _close_chunk(self) -> None:
+        if self._file is None:
+            return
+        # отрезаем неиспользованную часть заранее выделенного файла
+        self._file.truncate(self._position)
+        self._file.close()
+        self._file = None
+
+    def close(self) -> None:
+        """Закрывает текущий чанк"""
+        with self._lock:
+            self._close_chunk()
+
+    def __enter__(self) -> "DisparityStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def read(self, entry: ManifestEntry) -> np.ndarray:
+        """
+        Читает карту по записи индекса
+
+        Без кодека возвращает представление :class:`numpy.memmap` без копирования
+        """
+        shape = tuple(entry.shape)
+        dtype = np.dtype(entry.dtype)
+        if entry.codec is None:
+            chunk = self._map(entry.files[0], entry.offset + entry.length)
+            view = chunk[entry.offset:entry.offset + entry.length]
+            return view.view(dtype).reshape(shape)
+        decompress = CODECS[entry.codec]()[1]
+        with open(self.folder / entry.files[0], "rb") as file:
+            file.seek(entry.offset)
+            data = file.read(entry.length)
+        return np.frombuffer(decompress(data), dtype).reshape(shape)
+
+    def _map(self, name: str, size: int) -> np.memmap:
+        chunk = self._maps.get(name)
+        if chunk is None or chunk.size < size:
+            # чанк мог вырасти с момента прошлого отображения
+            chunk = self._maps[name] = np.memmap(self.folder / name, np.uint8, mode="r")
+        return chunk
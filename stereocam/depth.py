@@ -0,0 +1,101 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class DepthLUT:
+    """
+    Таблица перевода сырой диспаратности SGBM в глубину
+
+    SGBM возвращает диспаратность int16 в 1/16 пикселя, поэтому глубина -
+    функция всего 65536 возможных значений. Таблица строится один раз
+    по матрице Q, после чего глубина каждого пикселя - одно обращение к таблице.
+
+    Подходит для матриц Q из cv2.stereoRectify, у которых глубина
+    не зависит от координат пикселя: Z = Q[2, 3] / (Q[3, 2] * d + Q[3, 3]).
+
+    Параметры
+    ---------
+    q_matrix: :class:`ndarray`
+        Матрица 4x4 перевода диспаратности в глубину
+    dtype: :class:`numpy.dtype`
+        Тип результата: float32 или uint16
+    scale: :class:`float`
+        Множитель перевода из единиц калибровки в единицы результата,
+        например в миллиметры для uint16
+    min_disparity: :class:`int`
+        Минимальная диспаратность SGBM в пикселях. Значения меньше нее
+        (в том числе признак отсутствия диспаратности) дают глубину 0
+
+    Пиксели без диспаратности, с неположительной диспаратностью
+    и с глубиной вне диапазона uint16 получают значение 0.
+    """
+    def __init__(
+        self,
+        q_matrix: np.ndarray,
+        dtype: np.dtype = np.float32,
+        scale: float = 1.0,
+        min_disparity: int = 0
+    ) -> None:
+        q = np.asarray(q_matrix, np.float64)
+        if np.any(q[2, :3]) or np.any(q[3, :2]):
+            raise ValueError("Глубина по этой матрице Q зависит от координат пикселя")
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.uint16):
+            raise ValueError("Поддерживаются только float32 и uint16")
+
+        raw = np.arange(-2 ** 15, 2 ** 15, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            depth = scale * q[2, 3] / (q[3, 2] * raw / 16 + q[3, 3])
+        valid = (raw >= max(min_disparity * 16, 1)) & np.isfinite(depth) & (depth > 0)
+        if self.dtype == np.uint16:
+            depth = np.rint(depth)
+            valid &= depth <= np.iinfo(np.uint16).max
+        depth[~valid] = 0
+        # индекс таблицы - значение int16, прочитанное как uint16
+        self.table = np.roll(depth.astype(self.dtype), -2 ** 15)
+
+    def __call__(self, disparity: np.ndarray) -> np.ndarray:
+        """
+        Переводит сырую карту диспаратности int16 в глубину
+
+        Параметры
+        ---------
+        disparity: :class:`ndarray`
+            Карта диспаратности int16 в 1/16 пикселя
+        """
+        if disparity.dtype != np.int16:
+            raise TypeError("Нужна сырая карта диспаратности int16")
+        return np.take(self.table, disparity.view(np.uint16))
+
+
+@dataclass
+class RegionDepth:
+    """
+    Результат запроса диспаратности и глубины для области кадра
+
+    Аттрибуты
+    ---------
+    region: Tuple[:class:`int`]
+        Область (x, y, w, h) в координатах карты диспаратности, обрезанная по кадру
+    disparity: :class:`ndarray`
+        Диспаратность области в пикселях, как у :meth:`DisparityEstimator.match`
+    valid: :class:`ndarray`
+        Маска пикселей с найденной диспаратностью
+    depth: Optional[:class:`ndarray`]
+        Глубина (Z) пикселей области, 0 - для пикселей без диспаратности.
+        None, если матрица Q неизвестна
+    """
+    region: Tuple[int, int, int, int]
+    disparity: np.ndarray
+    valid: np.ndarray
+    depth: Optional[np.ndarray] = None
+
+    @property
+    def median_depth(self) -> float:
+        """Медианная глубина пикселей области с найденной диспаратностью, nan - если таких нет"""
+        if self.depth is None:
+            return float("nan")
+        values = self.depth[self.depth > 0]
+        return float(np.median(values)) if values.size else float("nan")
@@ -1,10 +1,16 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import cv2
 import numpy as np
 
-from .calibration import TransformationMap
-from .sgbm_config import SGBMConfig
+from .calibration import RectificationData, TransformationMap
+from .depth import RegionDepth
+from .governor import QualityLevel
+from .point_cloud import reproject_points
+from .rectifier import Rectifier
+from .sgbm_config import MatcherRegistry, SGBMConfig
+from .telemetry import Telemetry
 from .types import ImagePair
 
 
@@ -16,21 +22,98 @@ class DisparityEstimator:
     ---------
     transformation: :class:`TransformationMap`
         Датакласс, содержащий в себе массивы для ремаппинга
+    rectification: Optional[:class:`RectificationData`]
+        Данные ректификации. Если указаны - кадры и карта диспаратности
+        обрезаются по пересечению валидных областей камер (см. :attr:`roi`)
+    stripes: :class:`int`
+        Количество горизонтальных полос, на которые делится пара кадров
+        для параллельного сопоставления. 1 - без разбиения
+    overlap: Optional[:class:`int`]
+        Перекрытие полос в строках. По умолчанию 8 * block_size
+    workers: Optional[:class:`int`]
+        Количество потоков для сопоставления полос и тайлов. По умолчанию равно stripes
+    pyramid_levels: :class:`int`
+        Количество уровней пирамиды для грубого поиска. 0 - поиск во всем диапазоне.
+        Если больше нуля, диспаратность сначала считается на уменьшенной в 2 ** pyramid_levels
+        паре, затем каждый тайл сопоставляется в полном разрешении в суженном диапазоне
+    tile_size: Tuple[:class:`int`]
+        Ширина и высота тайла для режима пирамиды
+    disparity_margin: :class:`int`
+        Запас в пикселях, добавляемый к диапазону диспаратности тайла
+    incremental: :class:`bool`
+        Инкрементальный режим для неподвижных камер. Пересчитываются только
+        блоки, изменившиеся с прошлого кадра (с запасом в один блок),
+        остальная карта берется из предыдущего результата
+    change_block: :class:`int`
+        Размер блока в пикселях для поиска изменений
+    change_threshold: :class:`float`
+        Средняя абсолютная разница яркости, при которой блок считается изменившимся
+    refresh_interval: :class:`int`
+        Через сколько кадров карта пересчитывается целиком, чтобы ошибки не накапливались
+    telemetry: Optional[:class:`Telemetry`]
+        Замеры времени этапов cvtColor, remap, match, match_right и wls
+
+    Полосы, пирамида и инкрементальный режим действуют и в :meth:`get_filtered_disparity`:
+    левая карта для WLS считается так же, как в :meth:`match`, но своим матчером,
+    а правая карта тоже делится на полосы. Инкрементальный режим хранит
+    предыдущий кадр отдельно для обычной карты и карты для WLS.
+
+    При разбиении на полосы результат отличается от расчета одним вызовом
+    только вблизи границ полос: при перекрытии по умолчанию не более 1%
+    валидных пикселей расходятся больше чем на 1 пиксель.
 
     Аттрибуты
     ---------
+    rectification: Optional[:class:`RectificationData`]
+        Данные ректификации, матрица Q которых используется в :meth:`query`
     matcher: :class:`StereoMatcher`
         Реализация алгоритма для сопоставления изображений
+    rectifier: :class:`Rectifier`
+        Ректификация кадров в переиспользуемые буферы
     mode: :class:`int`
         Режим алгоритма SGBM
+    dirty_fraction: :class:`float`
+        Доля пересчитанных блоков на последнем кадре в инкрементальном режиме
     """
     def __init__(
         self,
-        tranformation: TransformationMap
+        tranformation: TransformationMap,
+        rectification: Optional[RectificationData] = None,
+        stripes: int = 1,
+        overlap: Optional[int] = None,
+        workers: Optional[int] = None,
+        pyramid_levels: int = 0,
+        tile_size: Tuple[int, int] = (256, 256),
+        disparity_margin: int = 16,
+        incremental: bool = False,
+        change_block: int = 64,
+        change_threshold: float = 4.0,
+        refresh_interval: int = 100,
+        telemetry: Optional[Telemetry] = None
     ) -> None:
         self.transformation = tranformation
+        self.rectification = rectification
+        self.rectifier = Rectifier(tranformation, rectification, telemetry=telemetry)
+        self.telemetry = self.rectifier.telemetry
         self.mode = cv2.STEREO_SGBM_MODE_SGBM_3WAY
-        self.matcher = SGBMConfig.from_path('sgbm_config.yml').get_matcher(self.mode)
+        self.registry = MatcherRegistry('sgbm_config.yml')
+        self.stripes = stripes
+        self._overlap = overlap
+        self.workers = workers or stripes
+        self.pyramid_levels = pyramid_levels
+        self.tile_size = tile_size
+        self.disparity_margin = disparity_margin
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.incremental = incremental
+        self.change_block = change_block
+        self.change_threshold = change_threshold
+        self.refresh_interval = refresh_interval
+        self.dirty_fraction = 1.0
+        # состояние инкрементального режима отдельно для обычной карты и карты для WLS
+        self._previous: Dict[bool, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._previous_version: Dict[bool, int] = {}
+        self._since_refresh: Dict[bool, int] = {}
+        self._level: Optional[QualityLevel] = None
 
     def compute(
         self,
@@ -39,44 +122,451 @@ class DisparityEstimator:
         """
         Вычисляет карту диспаратности
 
+        Входные кадры не изменяются
+
         Параметры
         ---------
         frames: :class:`Image`
             Левый и правый кадр
 
+        Возвращает
+        ----------
+        :class:`ndarray`
+            Карта диспаратности в координатах :attr:`roi`
+        """
+        return self.match(self.rectify(frames))
+
+    @property
+    def config(self) -> SGBMConfig:
+        """Актуальный конфиг SGBM, перечитывается при изменении файла"""
+        return self.registry.config
+
+    @property
+    def matcher(self) -> cv2.StereoMatcher:
+        """Матчер текущего потока для текущего режима"""
+        return self.registry.get_matcher(self.mode)
+
+    @property
+    def overlap(self) -> int:
+        """Перекрытие полос и тайлов в пикселях"""
+        if self._overlap is not None:
+            return self._overlap
+        return 8 * self.config.block_size
+
+    @overlap.setter
+    def overlap(self, value: Optional[int]) -> None:
+        self._overlap = value
+
+    @property
+    def roi(self) -> Tuple[int, int, int, int]:
+        """Область (x, y, w, h) ректифицированного кадра, для которой считается диспаратность"""
+        return self.rectifier.roi
+
+    def rectify(
+        self,
+        frames: ImagePair
+    ) -> ImagePair:
+        """
+        Ректифицирует кадры и переводит их в оттенки серого
+
+        Результат пишется в переиспользуемые буферы :attr:`rectifier`
+        и остается валидным до следующего вызова
+
+        Параметры
+        ---------
+        frames: :class:`ImagePair`
+            Левый и правый кадр
+
+        Возвращает
+        ----------
+        :class:`ImagePair`
+            Ректифицированные кадры в оттенках серого
+        """
+        return self.rectifier(frames)
+
+    def match(
+        self,
+        frames: ImagePair
+    ) -> np.ndarray:
+        """
+        Сопоставляет ректифицированные кадры
+
+        Параметры
+        ---------
+        frames: :class:`ImagePair`
+            Ректифицированные кадры в оттенках серого
+
         Возвращает
         ----------
         :class:`ndarray`
             Карта диспаратности
         """
-        # трансформируем левый и правый кадр
-        frames[0] = cv2.remap(
-            frames[0],
-            self.transformation.left_undistortion_map,
-            self.transformation.left_rectification_map,
-            cv2.INTER_LINEAR
+        with self.telemetry.stage("match"):
+            disparity = self._compute_raw(*frames)
+
+        return disparity.astype(np.float32) / 16.0
+
+    def query(
+        self,
+        frames: ImagePair,
+        regions: Sequence[Sequence[int]],
+        q_matrix: Optional[np.ndarray] = None
+    ) -> List[RegionDepth]:
+        """
+        Считает диспаратность и глубину только для заданных областей
+
+        Каждая область сопоставляется отдельно (см. :meth:`_match_region`):
+        вокруг нее берется запас в :attr:`overlap` пикселей, а по горизонтали -
+        еще и диапазон поиска (влево дважды), чтобы проверка disp12MaxDiff
+        видела те же столбцы, что и при полном расчете. Несколько небольших
+        областей обходятся дешевле полного кадра. От :meth:`match` результат
+        отличается только в отдельных пикселях: из-за агрегации стоимостей
+        вдоль строк SGBM валидность в среднем расходится меньше чем в 0.1% пикселей
+        (у отдельных небольших областей - до нескольких процентов),
+        а значения больше чем на 1 пиксель - еще реже.
+
+        Параметры
+        ---------
+        frames: :class:`ImagePair`
+            Ректифицированные кадры в оттенках серого (результат :meth:`rectify`)
+        regions: Sequence[Sequence[:class:`int`]]
+            Области (x, y, w, h) или точки (x, y) в координатах карты диспаратности
+        q_matrix: Optional[:class:`ndarray`]
+            Матрица 4x4 перевода диспаратности в глубину.
+            По умолчанию - из :attr:`rectification`
+
+        Возвращает
+        ----------
+        List[:class:`RegionDepth`]
+            Результаты в порядке запросов. Для точки - область 1x1
+        """
+        if q_matrix is None and self.rectification is not None:
+            q_matrix = self.rectification.disparity_to_depth_matrix
+        height, width = frames[0].shape[:2]
+        boxes = []
+        for region in regions:
+            x, y, w, h = region if len(region) == 4 else (*region, 1, 1)
+            x0, y0 = max(0, int(x)), max(0, int(y))
+            x1, y1 = min(width, int(x + w)), min(height, int(y + h))
+            if x1 <= x0 or y1 <= y0:
+                raise ValueError(f"Область {tuple(region)} вне кадра")
+            boxes.append((x0, y0, x1, y1))
+
+        config = self.config
+        offset_x, offset_y = self.roi[:2]
+        results: List[Optional[RegionDepth]] = [None] * len(boxes)
+
+        def match_box(idx: int) -> None:
+            x0, y0, x1, y1 = boxes[idx]
+            raw = self._match_region(
+                *frames,
+                (y0, y1),
+                (x0, x1),
+                config.min_disparity,
+                config.num_disparities,
+                exact_validity=True
+            )
+            valid = raw >= config.min_disparity * 16
+            disparity = raw.astype(np.float32) / 16.0
+            depth = None
+            if q_matrix is not None:
+                depth = np.zeros(raw.shape, np.float32)
+                # Q задана для всего ректифицированного кадра
+                points, mask = reproject_points(
+                    disparity, q_matrix, valid, (offset_x + x0, offset_y + y0)
+                )
+                depth[mask] = points[:, 2]
+            results[idx] = RegionDepth((x0, y0, x1 - x0, y1 - y0), disparity, valid, depth)
+
+        with self.telemetry.stage("query"):
+            self._run_parallel(match_box, range(len(boxes)))
+        return results
+
+    def reset(self) -> None:
+        """Сбрасывает сохраненный кадр инкрементального режима"""
+        self._previous.clear()
+        self._since_refresh.clear()
+
+    def _get_matcher(
+        self,
+        wls: bool = False,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> cv2.StereoMatcher:
+        # левый матчер WLS настроен фильтром иначе, поэтому его карта считается отдельно
+        if wls:
+            return self.registry.get_wls_matcher(self.mode, min_disparity, num_disparities)
+        return self.registry.get_matcher(self.mode, min_disparity, num_disparities)
+
+    def _compute_raw(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        wls: bool = False
+    ) -> np.ndarray:
+        # SGBM возвращает диспаратность в 1/16 пикселя (int16)
+        if self.incremental:
+            return self._compute_incremental(left, right, wls)
+        return self._compute_full(left, right, wls)
+
+    def _compute_incremental(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        wls: bool = False
+    ) -> np.ndarray:
+        previous = self._previous.get(wls)
+        refresh = (
+            previous is None
+            or previous[0].shape != left.shape
+            or self._since_refresh[wls] >= self.refresh_interval
+            or self._previous_version[wls] != self.registry.version
         )
+        if not refresh:
+            dirty = self._find_dirty_blocks(left, right, previous[0], previous[1])
+            self.dirty_fraction = float(dirty.mean())
+            # если изменилась большая часть кадра, дешевле пересчитать его целиком
+            refresh = self.dirty_fraction > 0.5
 
-        frames[1] = cv2.remap(
-            frames[1],
-            self.transformation.right_undistortion_map,
-            self.transformation.right_rectification_map,
-            cv2.INTER_LINEAR
+        if refresh:
+            disparity = self._compute_full(left, right, wls)
+            self.dirty_fraction = 1.0
+            self._since_refresh[wls] = 0
+            self._previous_version[wls] = self.registry.version
+        else:
+            disparity = previous[2].copy()
+            count, _, stats, _ = cv2.connectedComponentsWithStats(dirty, connectivity=8)
+            block = self.change_block
+            height, width = left.shape[:2]
+
+            def match_component(idx: int) -> None:
+                x, y, w, h = stats[idx, :4] * block
+                rows = (y, min(height, y + h))
+                columns = (x, min(width, x + w))
+                disparity[rows[0]:rows[1], columns[0]:columns[1]] = self._match_region(
+                    left,
+                    right,
+                    rows,
+                    columns,
+                    self.config.min_disparity,
+                    self.config.num_disparities,
+                    wls=wls
+                )
+
+            # нулевая компонента - неизменившийся фон
+            self._run_parallel(match_component, range(1, count))
+            self._since_refresh[wls] += 1
+
+        self._store_previous(left, right, disparity, wls)
+        return disparity
+
+    def _store_previous(
+        self,
+        left: np.ndarray,
+        right: np.ndarray,
+        disparity: np.ndarray,
+        wls: bool = False
+    ) -> None:
+        # кадры лежат в буферах ректификации, поэтому копируем их в свои
+        previous = self._previous.get(wls)
+        if previous is None or previous[0].shape != left.shape:
+            self._previous[wls] = (left.copy(), right.copy(), disparity)
+            return
+        np.copyto(previous[0], left)
+        np.copyto(previous[1], right)
+        self._previous[wls] = (previous[0], previous[1], disparity)
+
+    def _find_dirty_blocks(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        previous_left: np.ndarray,
+        previous_right: np.ndarray
+    ) -> np.ndarray:
+        """Возвращает сетку изменившихся блоков (uint8, 1 - блок нужно пересчитать)"""
+        height, width = left.shape[:2]
+        block = self.change_block
+        grid = (-(-width // block), -(-height // block))
+
+        def changed(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+            difference = cv2.absdiff(current, previous)
+            means = cv2.resize(difference, grid, interpolation=cv2.INTER_AREA)
+            if means.ndim == 3:
+                means = means.max(axis=2)
+            return (means > self.change_threshold).astype(np.uint8)
+
+        dirty = changed(left, previous_left)
+        # изменение правого кадра в столбце x влияет на пиксели левого кадра в x + d
+        right_dirty = changed(right, previous_right)
+        reach = -(-(self.config.min_disparity + self.config.num_disparities) // block)
+        kernel = np.zeros((1, 2 * reach + 1), np.uint8)
+        kernel[0, :reach + 1] = 1
+        dirty |= cv2.dilate(right_dirty, kernel, anchor=(reach, 0))
+        # запас в один блок вокруг изменений
+        return cv2.dilate(dirty, np.ones((3, 3), np.uint8))
+
+    def _compute_full(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        wls: bool = False
+    ) -> np.ndarray:
+        if self.pyramid_levels > 0:
+            return self._compute_pyramid(left, right, wls)
+        return self._compute_stripes(lambda: self._get_matcher(wls), left, right)
+
+    def _compute_stripes(
+        self,
+        get_matcher: Callable[[], cv2.StereoMatcher],
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike
+    ) -> np.ndarray:
+        if self.stripes <= 1:
+            return get_matcher().compute(left, right)
+
+        height = left.shape[0]
+        bounds = np.linspace(0, height, self.stripes + 1).astype(int)
+        disparity = np.empty(left.shape[:2], np.int16)
+
+        def match_stripe(idx: int) -> None:
+            top, bottom = bounds[idx], bounds[idx + 1]
+            start = max(0, top - self.overlap)
+            stop = min(height, bottom + self.overlap)
+            # у каждого потока свой экземпляр матчера: SGBM хранит внутренние буферы
+            stripe = get_matcher().compute(left[start:stop], right[start:stop])
+            disparity[top:bottom] = stripe[top - start:bottom - start]
+
+        self._run_parallel(match_stripe, range(self.stripes))
+
+        return disparity
+
+    def _run_parallel(self, func: Callable, items: Iterable) -> None:
+        if self.workers <= 1:
+            for item in items:
+                func(item)
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        list(self._executor.map(func, items))
+
+    def _match_region(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        rows: Tuple[int, int],
+        columns: Tuple[int, int],
+        min_disparity: int,
+        num_disparities: int,
+        exact_validity: bool = False,
+        wls: bool = False
+    ) -> np.ndarray:
+        """
+        Сопоставляет прямоугольную область левого кадра в заданном диапазоне диспаратности
+
+        Правый кадр сдвигается на min_disparity, поэтому матчер ищет в диапазоне
+        0..num_disparities и не тратит время на столбцы, которые все равно невалидны.
+        Область расширяется на перекрытие по вертикали и горизонтали, а влево -
+        еще и на диапазон поиска. Невалидные пиксели получают то же значение,
+        что и при полном расчете.
+
+        Проверке disp12MaxDiff нужна карта правого кадра, которая у краев участка
+        считается по неполному диапазону, поэтому у краев области валидность
+        может отличаться от полного расчета. С exact_validity участок расширяется
+        еще на диапазон поиска в обе стороны и валидность совпадает с полным
+        расчетом почти везде, но сопоставление становится заметно дороже.
+        """
+        top, bottom = rows
+        x0, x1 = columns
+        height, width = left.shape[:2]
+        invalid = (self.config.min_disparity - 1) * 16
+        result = np.full((bottom - top, x1 - x0), invalid, np.int16)
+
+        start_y = max(0, top - self.overlap)
+        stop_y = min(height, bottom + self.overlap)
+        # столбец x левого кадра сопоставляется со столбцами x - min_disparity - d правого
+        context = num_disparities if exact_validity else 0
+        start_x = max(0, min_disparity, x0 - self.overlap - num_disparities - context)
+        stop_x = min(width, width + min_disparity, x1 + self.overlap + context)
+        if stop_x - start_x <= num_disparities:
+            return result
+
+        matcher = self._get_matcher(wls, 0, num_disparities)
+        region = matcher.compute(
+            np.ascontiguousarray(left[start_y:stop_y, start_x:stop_x]),
+            np.ascontiguousarray(
+                right[start_y:stop_y, start_x - min_disparity:stop_x - min_disparity]
+            )
         )
+        region = region[top - start_y:bottom - start_y]
+        invalid_mask = region < 0
+        region = region + np.int16(min_disparity * 16)
+        region[invalid_mask] = invalid
+
+        first, last = max(x0, start_x), min(x1, stop_x)
+        if first < last:
+            result[:, first - x0:last - x0] = region[:, first - start_x:last - start_x]
+        return result
 
-        for idx, frame in enumerate(frames):
-            frames[idx] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def _compute_pyramid(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        wls: bool = False
+    ) -> np.ndarray:
+        scale = 2 ** self.pyramid_levels
+        full_min = self.config.min_disparity
+        full_max = full_min + self.config.num_disparities
 
-        disparity = self.matcher.compute(*frames)
+        # грубая карта на уменьшенной паре
+        small = [
+            cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+            for image in (left, right)
+        ]
+        coarse_min = int(np.floor(full_min / scale))
+        coarse_num = max(16, int(np.ceil(self.config.num_disparities / scale / 16)) * 16)
+        coarse_matcher = self.registry.get_matcher(self.mode, coarse_min, coarse_num)
+        coarse = coarse_matcher.compute(*small)
+        coarse_valid = coarse >= coarse_min * 16
+        coarse = coarse.astype(np.float32) * (scale / 16.0)
 
-        return disparity.astype(np.float32) / 16.0
+        height, width = left.shape[:2]
+        tile_width, tile_height = self.tile_size
+        tiles = [
+            (y, x)
+            for y in range(0, height, tile_height)
+            for x in range(0, width, tile_width)
+        ]
+        disparity = np.empty((height, width), np.int16)
+
+        def match_tile(tile: Tuple[int, int]) -> None:
+            y, x = tile
+            bottom, right_edge = min(height, y + tile_height), min(width, x + tile_width)
+            window = (
+                slice(y // scale, -(-bottom // scale)),
+                slice(x // scale, -(-right_edge // scale))
+            )
+            values = coarse[window][coarse_valid[window]]
+            if values.size < coarse_valid[window].size // 4:
+                # грубая карта ненадежна - ищем во всем диапазоне
+                low, high = full_min, full_max
+            else:
+                low = max(full_min, int(np.floor(values.min())) - self.disparity_margin)
+                high = min(full_max, int(np.ceil(values.max())) + self.disparity_margin)
+            num = max(16, int(np.ceil((high - low) / 16)) * 16)
+            low = max(full_min, min(low, full_max - num))
+            disparity[y:bottom, x:right_edge] = self._match_region(
+                left, right, (y, bottom), (x, right_edge), low, num, wls=wls
+            )
+
+        self._run_parallel(match_tile, tiles)
+
+        return disparity
 
     def set_mode(self, mode: int) -> None:
         """Меняет режим алгоритма"""
         if mode == self.mode:
             return
         self.mode = mode
-        self.matcher = SGBMConfig.from_path('sgbm_config.yml').get_matcher(self.mode)
 
     def get_filtered_disparity(
         self,
@@ -95,19 +585,94 @@ class DisparityEstimator:
         :class:`ndarray`
             Карта диспаратности
         """
-        for idx, frame in enumerate(frames):
-            frames[idx] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in frames]
+        return self._filter_wls(*frames)
 
-        right_matcher = cv2.ximgproc.createRightMatcher(self.matcher)
+    def match_level(
+        self,
+        frames: ImagePair,
+        level: QualityLevel
+    ) -> np.ndarray:
+        """
+        Сопоставляет ректифицированные кадры на заданном уровне качества
 
-        disparity_left = self.matcher.compute(*frames).astype(np.int16)
-        disparity_right = right_matcher.compute(*frames[::-1]).astype(np.int16)
-        wls_filter = cv2.ximgproc.createDisparityWLSFilter(matcher_left=self.matcher)
-        wls_filter.setLambda(8000)
-        wls_filter.setSigmaColor(1.5)
+        Пара уменьшается в level.downscale раз, диапазон поиска сужается
+        до level.num_disparities, при level.wls применяется WLS фильтр.
+        Карта возвращается в размере кадров и в пикселях исходного разрешения.
+        Уровень без уменьшения, сужения и фильтра считается так же, как :meth:`match`
 
-        return wls_filter.filter(
-            disparity_left,
-            frames[0],
-            disparity_map_right=disparity_right
-        )
+        Параметры
+        ---------
+        frames: :class:`ImagePair`
+            Ректифицированные кадры в оттенках серого
+        level: :class:`QualityLevel`
+            Уровень качества, например :attr:`QualityGovernor.level`
+
+        Возвращает
+        ----------
+        :class:`ndarray`
+            Карта диспаратности
+        """
+        if level != self._level:
+            # сохраненная карта инкрементального режима посчитана с другими параметрами
+            self.reset()
+            self._level = level
+        self.set_mode(level.mode)
+        scale = level.downscale
+        if scale == 1 and level.num_disparities is None and not level.wls:
+            return self.match(frames)
+
+        min_disparity = num_disparities = None
+        if scale > 1 or level.num_disparities is not None:
+            num = level.num_disparities or self.config.num_disparities
+            num_disparities = max(16, int(np.ceil(num / scale / 16)) * 16)
+            min_disparity = int(np.floor(self.config.min_disparity / scale))
+        left, right = frames
+        if scale > 1:
+            left, right = (
+                cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+                for image in frames
+            )
+
+        if level.wls:
+            disparity = self._filter_wls(left, right, min_disparity, num_disparities)
+        else:
+            with self.telemetry.stage("match"):
+                matcher = self.registry.get_matcher(self.mode, min_disparity, num_disparities)
+                disparity = matcher.compute(left, right)
+        disparity = disparity.astype(np.float32) * np.float32(scale / 16.0)
+        if scale > 1:
+            height, width = frames[0].shape[:2]
+            disparity = cv2.resize(disparity, (width, height), interpolation=cv2.INTER_NEAREST)
+        return disparity
+
+    def _filter_wls(
+        self,
+        left: cv2.typing.MatLike,
+        right: cv2.typing.MatLike,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> np.ndarray:
+        search = (min_disparity, num_disparities)
+
+        with self.telemetry.stage("match"):
+            if min_disparity is None and num_disparities is None:
+                # полосы, пирамида и инкрементальный режим - как в match
+                disparity_left = self._compute_raw(left, right, wls=True)
+            else:
+                disparity_left = self._compute_stripes(
+                    lambda: self._get_matcher(True, *search), left, right
+                )
+            disparity_left = disparity_left.astype(np.int16)
+        with self.telemetry.stage("match_right"):
+            disparity_right = self._compute_stripes(
+                lambda: self.registry.get_right_matcher(self.mode, *search), right, left
+            ).astype(np.int16)
+        wls_filter, _ = self.registry.get_wls_filter(self.mode, *search)
+
+        with self.telemetry.stage("wls"):
+            return wls_filter.filter(
+                disparity_left,
+                left,
+                disparity_map_right=disparity_right
+            )
@@ -0,0 +1,185 @@
+from typing import Optional, Tuple, Union
+
+import pathlib
+import numpy as np
+
+from .point_cloud import PlyWriter
+
+
+# 21 бит на ось, начало координат - в середине диапазона
+_AXIS_BITS = 21
+_BIAS = 1 << (_AXIS_BITS - 1)
+
+
+class VoxelMap:
+    """
+    Разреженная воксельная карта для объединения облаков нескольких кадров
+
+    Хранятся только занятые воксели: отсортированный массив ключей
+    (координаты вокселя, упакованные в int64) и накопленные суммы
+    координат и цветов точек. Экспортируется среднее положение и цвет
+    точек каждого вокселя, поэтому перекрывающиеся кадры не увеличивают модель.
+
+    Параметры
+    ---------
+    voxel_size: :class:`float`
+        Размер вокселя в единицах облака
+    max_voxels: Optional[:class:`int`]
+        Максимальное количество вокселей. При превышении вытесняются воксели,
+        которые видели в наименьшем числе кадров, а среди них - давно не видевшиеся
+
+    Аттрибуты
+    ---------
+    frames: :class:`int`
+        Количество добавленных кадров
+    """
+    def __init__(self, voxel_size: float, max_voxels: Optional[int] = None) -> None:
+        self.voxel_size = voxel_size
+        self.max_voxels = max_voxels
+        self.frames = 0
+        self._keys = np.zeros(0, np.int64)
+        self._sums = np.zeros((0, 3), np.float64)
+        self._colors = np.zeros((0, 3), np.float64)
+        self._weights = np.zeros(0, np.float64)
+        self._hits = np.zeros(0, np.int32)
+        self._last_seen = np.zeros(0, np.int32)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def nbytes(self) -> int:
+        """Память, занятая вокселями, в байтах"""
+        return sum(
+            array.nbytes for array in (
+                self._keys, self._sums, self._colors, self._weights, self._hits, self._last_seen
+            )
+        )
+
+    def integrate(
+        self,
+        points: np.ndarray,
+        colors: Optional[np.ndarray] = None,
+        pose: Optional[np.ndarray] = None
+    ) -> int:
+        """
+        Добавляет точки кадра в карту
+
+        Параметры
+        ---------
+        points: :class:`ndarray`
+            Координаты Nx3 в системе координат камеры
+        colors: Optional[:class:`ndarray`]
+            Цвета RGB uint8 Nx3. По умолчанию - белый
+        pose: Optional[:class:`ndarray`]
+            Матрица 4x4 перехода из системы координат камеры в систему карты.
+            Для неподвижной установки не нужна
+
+        Возвращает
+        ----------
+        :class:`int`
+            Количество вокселей, затронутых кадром
+        """
+        points = np.asarray(points, np.float64)
+        if pose is not None:
+            pose = np.asarray(pose, np.float64)
+            points = points @ pose[:3, :3].T + pose[:3, 3]
+        if colors is None:
+            colors = np.full((len(points), 3), 255, np.uint8)
+
+        keys, inside = self._pack(points)
+        points, colors = points[inside], colors[inside]
+        frame_keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        count = len(frame_keys)
+        sums = np.stack(
+            [np.bincount(inverse, points[:, axis], count) for axis in range(3)], axis=1
+        )
+        color_sums = np.stack(
+            [np.bincount(inverse, colors[:, axis], count) for axis in range(3)], axis=1
+        )
+        weights = np.bincount(inverse, minlength=count).astype(np.float64)
+
+        idx = np.searchsorted(self._keys, frame_keys)
+        found = idx < len(self._keys)
+        found[found] = self._keys[idx[found]] == frame_keys[found]
+
+        existing = idx[found]
+        self._sums[existing] += sums[found]
+        self._colors[existing] += color_sums[found]
+        self._weights[existing] += weights[found]
+        self._hits[existing] += 1
+        self._last_seen[existing] = self.frames
+
+        # np.insert сохраняет порядок: новые ключи встают перед idx
+        new = ~found
+        positions = idx[new]
+        self._keys = np.insert(self._keys, positions, frame_keys[new])
+        self._sums = np.insert(self._sums, positions, sums[new], axis=0)
+        self._colors = np.insert(self._colors, positions, color_sums[new], axis=0)
+        self._weights = np.insert(self._weights, positions, weights[new])
+        self._hits = np.insert(self._hits, positions, 1)
+        self._last_seen = np.insert(self._last_seen, positions, self.frames)
+
+        self.frames += 1
+        if self.max_voxels is not None and len(self) > self.max_voxels:
+            self._evict(self.max_voxels)
+        return count
+
+    def to_points(self, min_hits: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Текущая модель: среднее положение и цвет точек каждого вокселя
+
+        Параметры
+        ---------
+        min_hits: :class:`int`
+            Минимальное количество кадров, в которых был виден воксель.
+            Больше 1 - отбрасывает шум, встретившийся в одном кадре
+
+        Возвращает
+        ----------
+        Tuple[:class:`ndarray`]
+            Координаты float32 Nx3 и цвета uint8 Nx3
+        """
+        keep = self._hits >= min_hits
+        weights = self._weights[keep, None]
+        points = (self._sums[keep] / weights).astype(np.float32)
+        colors = np.rint(self._colors[keep] / weights).astype(np.uint8)
+        return points, colors
+
+    def export(self, fp: Union[str, pathlib.Path], min_hits: int = 1) -> int:
+        """
+        Записывает текущую модель в .ply файл
+
+        Возвращает
+        ----------
+        :class:`int`
+            Количество записанных точек
+        """
+        points, colors = self.to_points(min_hits)
+        with PlyWriter(fp) as writer:
+            writer.write(points, colors)
+        return writer.count
+
+    def _pack(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        coordinates = np.floor(points / self.voxel_size)
+        coordinates += _BIAS
+        inside = np.all((coordinates >= 0) & (coordinates < 1 << _AXIS_BITS), axis=1)
+        coordinates = coordinates[inside].astype(np.int64)
+        keys = (
+            coordinates[:, 0]
+            | (coordinates[:, 1] << _AXIS_BITS)
+            | (coordinates[:, 2] << 2 * _AXIS_BITS)
+        )
+        return keys, inside
+
+    def _evict(self, size: int) -> None:
+        # сортировка по (кадров с вокселем, последний кадр), остаются size последних
+        order = np.lexsort((self._last_seen, self._hits))
+        keep = np.sort(order[-size:])
+        self._keys = self._keys[keep]
+        self._sums = self._sums[keep]
+        self._colors = self._colors[keep]
+        self._weights = self._weights[keep]
+        self._hits = self._hits[keep]
+        self._last_seen = self._last_seen[keep]
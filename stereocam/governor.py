@@ -0,0 +1,193 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Sequence
+
+import cv2
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    """
+    Уровень качества карты диспаратности
+
+    Аттрибуты
+    ---------
+    name: :class:`str`
+        Название уровня
+    mode: :class:`int`
+        Режим SGBM
+    downscale: :class:`int`
+        Во сколько раз уменьшается пара перед сопоставлением.
+        Карта возвращается в исходном размере
+    num_disparities: Optional[:class:`int`]
+        Диапазон поиска в пикселях исходного кадра. None - из конфига
+    wls: :class:`bool`
+        Применять WLS фильтр
+    """
+    name: str
+    mode: int = cv2.STEREO_SGBM_MODE_SGBM_3WAY
+    downscale: int = 1
+    num_disparities: Optional[int] = None
+    wls: bool = False
+
+    @property
+    def disparity_step(self) -> float:
+        """Шаг значений диспаратности в пикселях исходного кадра"""
+        return self.downscale / 16
+
+
+# от лучшего качества к самому быстрому
+DEFAULT_LEVELS = (
+    QualityLevel("hh_wls", cv2.STEREO_SGBM_MODE_HH, wls=True),
+    QualityLevel("sgbm_wls", cv2.STEREO_SGBM_MODE_SGBM, wls=True),
+    QualityLevel("sgbm", cv2.STEREO_SGBM_MODE_SGBM),
+    QualityLevel("3way", cv2.STEREO_SGBM_MODE_SGBM_3WAY),
+    QualityLevel("3way_half", cv2.STEREO_SGBM_MODE_SGBM_3WAY, downscale=2),
+    QualityLevel("3way_quarter", cv2.STEREO_SGBM_MODE_SGBM_3WAY, downscale=4),
+)
+
+
+class QualityGovernor:
+    """
+    Выбор уровня качества по измеренной задержке кадров
+
+    С target_fps задержкой считается интервал между готовыми кадрами,
+    с target_latency - время от захвата пары до готовой карты.
+    Если средняя задержка последних window кадров превышает бюджет,
+    выбирается следующий, более быстрый уровень. Если она опускается ниже
+    upgrade_ratio от бюджета, через hold кадров пробуется более качественный уровень.
+    Если повышение не продержалось hold кадров, выдержка перед следующей
+    попыткой удваивается (но не больше max_hold) и возвращается к hold
+    после удачного повышения. Так уровень, который не укладывается в бюджет,
+    пробуется все реже, а не каждые hold кадров.
+
+    Кроме того, при переходах между соседними уровнями запоминается отношение
+    их задержек. Повышение, для которого ожидаемая по этому отношению задержка
+    превышает бюджет, не пробуется, пока на уровне не пройдет max_hold кадров.
+
+    Параметры
+    ---------
+    levels: Sequence[:class:`QualityLevel`]
+        Уровни от лучшего качества к самому быстрому
+    target_fps: Optional[:class:`float`]
+        Целевая частота кадров
+    target_latency: Optional[:class:`float`]
+        Бюджет времени на кадр в секундах. Задается вместо target_fps
+    window: :class:`int`
+        Количество кадров, по которым усредняется время
+    upgrade_ratio: :class:`float`
+        Доля бюджета, ниже которой качество повышается
+    hold: :class:`int`
+        Минимальное количество кадров на уровне перед повышением качества
+    max_hold: Optional[:class:`int`]
+        Наибольшая выдержка после неудачных повышений. По умолчанию - 16 * hold
+    start_level: :class:`int`
+        Начальный уровень
+
+    Аттрибуты
+    ---------
+    index: :class:`int`
+        Номер текущего уровня
+    latency: :class:`bool`
+        Бюджет задан через target_latency
+    """
+    def __init__(
+        self,
+        levels: Sequence[QualityLevel] = DEFAULT_LEVELS,
+        target_fps: Optional[float] = None,
+        target_latency: Optional[float] = None,
+        window: int = 8,
+        upgrade_ratio: float = 0.6,
+        hold: int = 30,
+        max_hold: Optional[int] = None,
+        start_level: int = 0
+    ) -> None:
+        if (target_fps is None) == (target_latency is None):
+            raise ValueError("Нужно указать либо target_fps, либо target_latency")
+        if not levels:
+            raise ValueError("Нужен хотя бы один уровень")
+        self.levels: List[QualityLevel] = list(levels)
+        self.latency = target_latency is not None
+        self.budget = target_latency if self.latency else 1.0 / target_fps
+        self.window = window
+        self.upgrade_ratio = upgrade_ratio
+        self.hold = hold
+        self.max_hold = max_hold if max_hold is not None else 16 * hold
+        self.index = start_level
+        self._durations: Deque[float] = deque(maxlen=window)
+        self._frames_on_level = 0
+        self._hold = hold
+        # текущий уровень получен повышением и еще не продержался hold кадров
+        self._upgraded = False
+        # последняя средняя задержка каждого уровня
+        self._averages: Dict[int, float] = {}
+        # отношение задержки уровня i к задержке уровня i + 1
+        self._ratios: Dict[int, float] = {}
+
+    @property
+    def level(self) -> QualityLevel:
+        """Текущий уровень"""
+        return self.levels[self.index]
+
+    def update(self, seconds: float, level: Optional[QualityLevel] = None) -> QualityLevel:
+        """
+        Учитывает задержку очередного кадра
+
+        Параметры
+        ---------
+        seconds: :class:`float`
+            Задержка кадра в секундах
+        level: Optional[:class:`QualityLevel`]
+            Уровень, на котором был обработан кадр. Кадры, обработанные
+            до смены уровня, не учитываются
+
+        Возвращает
+        ----------
+        :class:`QualityLevel`
+            Уровень для следующего кадра
+        """
+        if level is not None and level != self.level:
+            return self.level
+        self._durations.append(seconds)
+        self._frames_on_level += 1
+        if self._upgraded and self._frames_on_level >= self.hold:
+            self._upgraded = False
+            self._hold = self.hold
+        if len(self._durations) < self.window:
+            return self.level
+
+        average = sum(self._durations) / len(self._durations)
+        self._averages[self.index] = average
+        if average > self.budget and self.index < len(self.levels) - 1:
+            if self._upgraded:
+                self._hold = min(2 * self._hold, self.max_hold)
+            self._switch(self.index + 1, upgraded=False)
+        elif (
+            average < self.budget * self.upgrade_ratio
+            and self.index > 0
+            and self._frames_on_level >= self._hold
+            and (
+                self._predict_upgrade() <= self.budget
+                or self._frames_on_level >= self.max_hold
+            )
+        ):
+            self._switch(self.index - 1, upgraded=True)
+        return self.level
+
+    def _predict_upgrade(self) -> float:
+        # задержка следующего, более качественного уровня при текущей нагрузке;
+        # 0 - отношение задержек еще не измерено и повышение нужно пробовать
+        ratio = self._ratios.get(self.index - 1)
+        if ratio is None:
+            return 0.0
+        return self._averages[self.index] * ratio
+
+    def _switch(self, index: int, upgraded: bool) -> None:
+        better = min(self.index, index)
+        if better + 1 in self._averages and better in self._averages:
+            self._ratios[better] = self._averages[better] / self._averages[better + 1]
+        self.index = index
+        self._upgraded = upgraded
+        # замеры прежнего уровня ничего не говорят о новом
+        self._durations.clear()
+        self._frames_on_level = 0
@@ -2,8 +2,11 @@ import numpy as np
 
 
 class NpzMixin:
-    def save(self, filename: str) -> None:
-        np.savez_compressed(filename, **self.__dict__)
+    def save(self, filename: str, compressed: bool = True) -> None:
+        if compressed:
+            np.savez_compressed(filename, **self.__dict__)
+        else:
+            np.savez(filename, **self.__dict__)
 
     @classmethod
     def load(cls, filename: str):
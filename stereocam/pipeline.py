@@ -0,0 +1,322 @@
+import enum
+import time
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import cv2
+import numpy as np
+
+from .capture import StampedPair
+from .disparity_estimator import DisparityEstimator
+from .governor import QualityGovernor, QualityLevel
+from .telemetry import Telemetry
+from .types import ImagePair
+
+
+class DropPolicy(enum.Enum):
+    """
+    Поведение конвейера, когда следующая стадия не успевает обрабатывать кадры
+
+    BLOCK - стадия ждет освобождения очереди, кадры не теряются
+    DROP_OLDEST - из очереди выбрасывается самый старый кадр (всегда обрабатывается свежий)
+    DROP_NEWEST - выбрасывается новый кадр
+    """
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+
+
+@dataclass
+class PipelineItem:
+    """
+    Кадр, проходящий через конвейер
+
+    Аттрибуты
+    ---------
+    index: :class:`int`
+        Порядковый номер пары, полученной от источника
+    timestamp: :class:`float`
+        Время захвата пары (time.monotonic). Для источников без времени
+        захвата - время получения пары конвейером
+    frames: :class:`ImagePair`
+        Исходные кадры
+    rectified: Optional[:class:`ImagePair`]
+        Ректифицированные кадры в оттенках серого
+    disparity: Optional[:class:`ndarray`]
+        Карта диспаратности
+    level: Optional[:class:`QualityLevel`]
+        Уровень качества, на котором посчитана карта, если конвейер работает с регулятором
+    """
+    index: int
+    timestamp: float
+    frames: ImagePair
+    rectified: Optional[ImagePair] = None
+    disparity: Optional[np.ndarray] = None
+    level: Optional[QualityLevel] = None
+
+
+Sink = Callable[[PipelineItem], Optional[bool]]
+
+_STOP = object()
+
+
+class DisparityPipeline:
+    """
+    Конвейер для расчета карты диспаратности в реальном времени
+
+    Захват, ректификация, сопоставление и приемник (отображение, запись)
+    работают в отдельных потоках и связаны ограниченными очередями.
+    OpenCV отпускает GIL в remap и SGBM, поэтому стадии выполняются параллельно.
+
+    Параметры
+    ---------
+    source: Iterable[:class:`ImagePair`]
+        Источник пар кадров, например :meth:`StereoPair.stream` или :class:`FramesDataset`.
+        Для :class:`StampedPair` задержка считается от времени захвата пары
+    estimator: :class:`DisparityEstimator`
+        Экземпляр класса DisparityEstimator, который высчитывает карту диспаратности
+    sink: Callable[[:class:`PipelineItem`], Optional[:class:`bool`]]
+        Приемник готовых карт. Если возвращает False - конвейер останавливается
+    queue_size: :class:`int`
+        Размер очереди между стадиями
+    drop_policy: :class:`DropPolicy`
+        Поведение при переполнении очереди
+    governor: Optional[:class:`QualityGovernor`]
+        Регулятор качества. Если указан, уровень качества каждого кадра
+        выбирается по предыдущим кадрам, дошедшим до приемника: по интервалу
+        между ними (target_fps) или по задержке от захвата (target_latency)
+
+    Аттрибуты
+    ---------
+    dropped: Dict[:class:`str`, :class:`int`]
+        Количество выброшенных кадров перед каждой стадией
+    processed: :class:`int`
+        Количество кадров, переданных в приемник
+    """
+    _stages = ["rectify", "match", "sink"]
+
+    def __init__(
+        self,
+        source: Iterable[Union[ImagePair, StampedPair]],
+        estimator: DisparityEstimator,
+        sink: Sink,
+        queue_size: int = 2,
+        drop_policy: DropPolicy = DropPolicy.DROP_OLDEST,
+        governor: Optional[QualityGovernor] = None
+    ) -> None:
+        self.source = source
+        self.estimator = estimator
+        self.governor = governor
+        self.sink = sink
+        self.drop_policy = drop_policy
+        self.queues: Dict[str, queue.Queue] = {
+            stage: queue.Queue(maxsize=queue_size) for stage in self._stages
+        }
+        self.dropped = {stage: 0 for stage in self._stages}
+        self.processed = 0
+        # ректифицированные кадры живут в буферах оценщика, пока находятся
+        # в очередях сопоставления и приемника, поэтому их нужно хватить на все очереди
+        estimator.rectifier.reserve(2 * queue_size + 3)
+
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._error: Optional[BaseException] = None
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self) -> "DisparityPipeline":
+        """Запускает все стадии, включая приемник, в фоновых потоках"""
+        self._start_workers()
+        sink_thread = threading.Thread(target=self._guard, args=(self._sink_loop,), daemon=True)
+        self._threads.append(sink_thread)
+        sink_thread.start()
+        return self
+
+    def run(self) -> None:
+        """
+        Запускает конвейер и выполняет приемник в текущем потоке
+
+        Нужен для приемников, работающих с окнами OpenCV (imshow, waitKey),
+        которые должны вызываться из главного потока.
+        Возвращает управление, когда источник закончился или приемник вернул False.
+        """
+        self._start_workers()
+        try:
+            self._guard(self._sink_loop)
+        finally:
+            self.stop()
+            self.join()
+
+    def stop(self) -> None:
+        """Останавливает конвейер"""
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+        Дожидается завершения всех стадий
+
+        Если в одной из стадий возникло исключение, оно пробрасывается.
+        """
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self) -> "DisparityPipeline":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+        self.join()
+
+    def _start_workers(self) -> None:
+        if self.running:
+            raise RuntimeError("Конвейер уже запущен")
+        self._stop.clear()
+        workers = [
+            (self._capture_loop, ()),
+            (self._worker_loop, (self._rectify, "rectify", "match")),
+            (self._worker_loop, (self._match, "match", "sink")),
+        ]
+        self._threads = [
+            threading.Thread(target=self._guard, args=(target, *args), daemon=True)
+            for target, args in workers
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _guard(self, target: Callable, *args) -> None:
+        try:
+            target(*args)
+        except BaseException as error:
+            if self._error is None:
+                self._error = error
+            self._stop.set()
+
+    def _capture_loop(self) -> None:
+        for index, frames in enumerate(self.source):
+            if self._stop.is_set():
+                return
+            if isinstance(frames, StampedPair):
+                item = PipelineItem(index, frames.timestamp, list(frames.frames))
+            else:
+                item = PipelineItem(index, time.monotonic(), frames)
+            self._put("rectify", item)
+        self._put("rectify", _STOP, force=True)
+
+    def _rectify(self, item: PipelineItem) -> PipelineItem:
+        item.rectified = self.estimator.rectify(item.frames)
+        return item
+
+    def _match(self, item: PipelineItem) -> PipelineItem:
+        if self.governor is None:
+            item.disparity = self.estimator.match(item.rectified)
+            return item
+        item.level = self.governor.level
+        item.disparity = self.estimator.match_level(item.rectified, item.level)
+        return item
+
+    def _worker_loop(
+        self,
+        func: Callable[[PipelineItem], PipelineItem],
+        inbox: str,
+        outbox: str
+    ) -> None:
+        while True:
+            item = self._get(inbox)
+            if item is _STOP:
+                self._put(outbox, _STOP, force=True)
+                return
+            self._put(outbox, func(item))
+
+    def _sink_loop(self) -> None:
+        delivered = 0.0
+        while True:
+            item = self._get("sink")
+            if item is _STOP:
+                return
+            self.processed += 1
+            keep_running = self.sink(item)
+            now = time.monotonic()
+            if self.governor is not None:
+                # учитываются все стадии и приемник, а не только сопоставление.
+                # Интервал отсчитывается от захвата, если конвейер ждал источник
+                since = item.timestamp if self.governor.latency else max(item.timestamp, delivered)
+                self.governor.update(now - since, item.level)
+            delivered = now
+            if keep_running is False:
+                self._stop.set()
+                return
+
+    def _get(self, name: str):
+        # опрашиваем очередь с таймаутом, чтобы реагировать на остановку
+        while not self._stop.is_set():
+            try:
+                return self.queues[name].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _put(self, name: str, item, force: bool = False) -> None:
+        inbox = self.queues[name]
+        if force or self.drop_policy is DropPolicy.BLOCK:
+            while not self._stop.is_set():
+                try:
+                    inbox.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        elif self.drop_policy is DropPolicy.DROP_NEWEST:
+            try:
+                inbox.put_nowait(item)
+            except queue.Full:
+                self.dropped[name] += 1
+        else:
+            while True:
+                try:
+                    inbox.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        inbox.get_nowait()
+                        self.dropped[name] += 1
+                    except queue.Empty:
+                        pass
+
+
+def show_disparity(
+    item: PipelineItem,
+    window: str = "Disparity",
+    telemetry: Optional[Telemetry] = None
+) -> bool:
+    """
+    Приемник, показывающий карту диспаратности в окне
+
+    Если передана telemetry, поверх карты выводятся задержки и FPS этапов
+    и уровень качества карты.
+    Возвращает False, если была нажата q
+    """
+    visualization = cv2.normalize(
+        item.disparity,
+        None,
+        alpha=0,
+        beta=255,
+        norm_type=cv2.NORM_MINMAX,
+        dtype=cv2.CV_8U
+    )
+    if telemetry is not None:
+        telemetry.overlay(visualization)
+        if item.level is not None:
+            cv2.putText(
+                visualization, item.level.name, (8, visualization.shape[0] - 8),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.45, 255, 1, cv2.LINE_AA
+            )
+    cv2.imshow(window, visualization)
+    pressed_key = cv2.waitKey(1) & 0xFF
+    return pressed_key != ord('q')
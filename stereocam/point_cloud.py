@@ -0,0 +1,341 @@
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+import pathlib
+import numpy as np
+
+
+VERTEX_DTYPE = np.dtype([
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("z", "<f4"),
+    ("red", "u1"),
+    ("green", "u1"),
+    ("blue", "u1"),
+])
+
+# ширина поля с количеством вершин: количество дописывается в заголовок при закрытии
+_COUNT_WIDTH = 12
+
+
+def valid_mask(disparity: np.ndarray) -> np.ndarray:
+    """Маска пикселей с найденной диспаратностью"""
+    return disparity > disparity.min()
+
+
+def reproject_points(
+    disparity: np.ndarray,
+    q_matrix: np.ndarray,
+    mask: Optional[np.ndarray] = None,
+    offset: Tuple[int, int] = (0, 0),
+    disparity_scale: float = 1.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Восстанавливает трехмерные координаты пикселей карты диспаратности
+
+    В отличие от cv2.reprojectImageTo3D координаты считаются только
+    для пикселей из маски. Значения диспаратности умножаются на disparity_scale,
+    при 1.0 они используются как есть, так же как в cv2.reprojectImageTo3D.
+
+    Параметры
+    ---------
+    disparity: :class:`ndarray`
+        Карта диспаратности
+    q_matrix: :class:`ndarray`
+        Матрица 4x4 перевода диспаратности в глубину
+    mask: Optional[:class:`ndarray`]
+        Пиксели, для которых нужны координаты. По умолчанию - :func:`valid_mask`
+    offset: Tuple[:class:`int`]
+        Координаты (x, y) левого верхнего угла карты в ректифицированном кадре,
+        если карта вырезана по области интереса
+    disparity_scale: :class:`float`
+        Множитель перевода значений карты в пиксели, 1 / 16 для сырой карты SGBM int16
+
+    Возвращает
+    ----------
+    Tuple[:class:`ndarray`]
+        Координаты точек float32 Nx3 и маска пикселей, для которых они получены.
+        Точки на бесконечности в результат не попадают
+    """
+    if mask is None:
+        mask = valid_mask(disparity)
+    ys, xs = np.nonzero(mask)
+    q = np.asarray(q_matrix, np.float32)
+    x = xs.astype(np.float32) + np.float32(offset[0])
+    y = ys.astype(np.float32) + np.float32(offset[1])
+    d = disparity[ys, xs].astype(np.float32)
+    if disparity_scale != 1.0:
+        d *= np.float32(disparity_scale)
+
+    w = q[3, 0] * x + q[3, 1] * y + q[3, 2] * d + q[3, 3]
+    finite = w != 0
+    if not finite.all():
+        x, y, d, w = x[finite], y[finite], d[finite], w[finite]
+        mask = np.zeros_like(mask)
+        mask[ys[finite], xs[finite]] = True
+    w = np.float32(1.0) / w
+
+    points = np.empty((len(w), 3), np.float32)
+    for axis in range(3):
+        np.multiply(
+            q[axis, 0] * x + q[axis, 1] * y + q[axis, 2] * d + q[axis, 3],
+            w,
+            out=points[:, axis]
+        )
+    return points, mask
+
+
+def iter_point_chunks(
+    disparity: np.ndarray,
+    q_matrix: np.ndarray,
+    colors: Optional[np.ndarray] = None,
+    mask: Optional[np.ndarray] = None,
+    offset: Tuple[int, int] = (0, 0),
+    rows: int = 64,
+    disparity_scale: float = 1.0
+) -> Iterator[Tuple[np.ndarray, Optional[np.ndarray]]]:
+    """
+    Восстанавливает точки полосами по rows строк
+
+    Позволяет записывать облако, не держа в памяти все точки сразу.
+
+    Параметры
+    ---------
+    colors: Optional[:class:`ndarray`]
+        Изображение RGB того же размера, что и карта
+
+    Возвращает
+    ----------
+    Iterator[Tuple[:class:`ndarray`, Optional[:class:`ndarray`]]]
+        Координаты точек полосы и их цвета
+    """
+    if mask is None:
+        mask = valid_mask(disparity)
+    for top in range(0, disparity.shape[0], rows):
+        band = slice(top, top + rows)
+        points, band_mask = reproject_points(
+            disparity[band],
+            q_matrix,
+            mask[band],
+            (offset[0], offset[1] + top),
+            disparity_scale
+        )
+        yield points, None if colors is None else colors[band][band_mask]
+
+
+class PlyWriter:
+    """
+    Потоковая запись облака точек в бинарный .ply файл (little endian)
+
+    Вершины дописываются порциями через :meth:`write`,
+    количество вершин записывается в заголовок при закрытии.
+
+    Параметры
+    ---------
+    fp: :class:`str` | :class:`Path` | :class:`BinaryIO`
+        Путь к файлу или открытый файл с возможностью перемотки
+    """
+    def __init__(self, fp: Union[str, pathlib.Path, BinaryIO]) -> None:
+        self._own = not hasattr(fp, "write")
+        self._file = open(fp, "wb") if self._own else fp
+        self.count = 0
+        header = (
+            "ply\n"
+            "format binary_little_endian 1.0\n"
+            "element vertex "
+        ).encode("ascii")
+        self._file.write(header)
+        self._count_position = self._file.tell()
+        self._file.write(
+            (
+                f"{0:0{_COUNT_WIDTH}d}\n"
+                "property float x\n"
+                "property float y\n"
+                "property float z\n"
+                "property uchar red\n"
+                "property uchar green\n"
+                "property uchar blue\n"
+                "end_header\n"
+            ).encode("ascii")
+        )
+
+    def write(self, points: np.ndarray, colors: Optional[np.ndarray] = None) -> None:
+        """
+        Дописывает вершины
+
+        Параметры
+        ---------
+        points: :class:`ndarray`
+            Координаты Nx3
+        colors: Optional[:class:`ndarray`]
+            Цвета RGB uint8 Nx3. По умолчанию - белый
+        """
+        vertices = np.empty(len(points), VERTEX_DTYPE)
+        vertices["x"], vertices["y"], vertices["z"] = points[:, 0], points[:, 1], points[:, 2]
+        if colors is None:
+            vertices["red"] = vertices["green"] = vertices["blue"] = 255
+        else:
+            vertices["red"], vertices["green"], vertices["blue"] = (
+                colors[:, 0], colors[:, 1], colors[:, 2]
+            )
+        self._file.write(vertices.data)
+        self.count += len(vertices)
+
+    def close(self) -> None:
+        """Записывает количество вершин в заголовок и закрывает файл"""
+        end = self._file.tell()
+        self._file.seek(self._count_position)
+        self._file.write(f"{self.count:0{_COUNT_WIDTH}d}".encode("ascii"))
+        self._file.seek(end)
+        if self._own:
+            self._file.close()
+        else:
+            self._file.flush()
+
+    def __enter__(self) -> "PlyWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_ply(fp: Union[str, pathlib.Path]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Читает облако, записанное :class:`PlyWriter`
+
+    Возвращает
+    ----------
+    Tuple[:class:`ndarray`]
+        Координаты float32 Nx3 и цвета uint8 Nx3
+    """
+    with open(fp, "rb") as file:
+        count = 0
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"{fp}: не найден конец заголовка")
+            if line.startswith(b"element vertex"):
+                count = int(line.split()[-1])
+            if line.strip() == b"end_header":
+                break
+        vertices = np.fromfile(file, VERTEX_DTYPE, count)
+    points = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1)
+    colors = np.stack([vertices["red"], vertices["green"], vertices["blue"]], axis=1)
+    return points, colors
+
+
+def _voxel_coordinates(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    coordinates = np.floor(points / np.float32(voxel_size)).astype(np.int64)
+    # сдвиг на 1 оставляет место для соседей с отрицательным смещением
+    coordinates -= coordinates.min(axis=0) - 1
+    if coordinates.size and coordinates.max() >= (1 << 21) - 1:
+        raise ValueError("Слишком маленький размер вокселя для размеров облака")
+    return coordinates
+
+
+def _pack(coordinates: np.ndarray) -> np.ndarray:
+    # 21 бит на ось - ключ вокселя помещается в int64
+    return coordinates[:, 0] | (coordinates[:, 1] << 21) | (coordinates[:, 2] << 42)
+
+
+def voxel_downsample(
+    points: np.ndarray,
+    colors: Optional[np.ndarray] = None,
+    voxel_size: float = 1.0,
+    weights: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+    Прореживает облако по воксельной сетке
+
+    Точки, попавшие в один воксель, заменяются средним положением и цветом.
+    Координаты вокселей упаковываются в один ключ int64, точки группируются
+    по ключу, суммы считаются через bincount.
+
+    Параметры
+    ---------
+    points: :class:`ndarray`
+        Координаты Nx3
+    colors: Optional[:class:`ndarray`]
+        Цвета uint8 Nx3
+    voxel_size: :class:`float`
+        Размер вокселя в единицах облака
+    weights: Optional[:class:`ndarray`]
+        Веса точек, например количество исходных точек в вокселе
+        при повторном прореживании
+
+    Возвращает
+    ----------
+    Tuple[:class:`ndarray`]
+        Координаты, цвета и веса (количество исходных точек) вокселей
+    """
+    if not len(points):
+        return points, colors, np.zeros(0, np.float32)
+    keys = _pack(_voxel_coordinates(points, voxel_size))
+    _, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    if weights is None:
+        weights = np.ones(len(points), np.float32)
+    total = np.bincount(inverse, weights)
+
+    def average(values: np.ndarray) -> np.ndarray:
+        return np.stack(
+            [np.bincount(inverse, values[:, axis] * weights) / total for axis in range(3)],
+            axis=1
+        )
+
+    voxel_points = average(points).astype(np.float32)
+    voxel_colors = None
+    if colors is not None:
+        voxel_colors = np.rint(average(colors)).astype(np.uint8)
+    return voxel_points, voxel_colors, total.astype(np.float32)
+
+
+def statistical_outlier_mask(
+    points: np.ndarray,
+    voxel_size: float,
+    std_ratio: float = 2.0
+) -> np.ndarray:
+    """
+    Маска точек, не являющихся выбросами
+
+    Для каждой точки считается количество точек в ее вокселе и 26 соседних.
+    Точки, у которых эта плотность меньше средней более чем на std_ratio
+    стандартных отклонений, считаются выбросами. В отличие от поиска
+    k ближайших соседей не требует дерева поиска.
+
+    Параметры
+    ---------
+    points: :class:`ndarray`
+        Координаты Nx3
+    voxel_size: :class:`float`
+        Размер вокселя, в пределах которого считается плотность
+    std_ratio: :class:`float`
+        Порог в стандартных отклонениях
+    """
+    if not len(points):
+        return np.zeros(0, bool)
+    coordinates = _voxel_coordinates(points, voxel_size)
+    keys, inverse, counts = np.unique(
+        _pack(coordinates), return_inverse=True, return_counts=True
+    )
+    inverse = inverse.reshape(-1)
+    # координаты каждого вокселя берем у первой попавшей в него точки
+    first = np.empty(len(keys), np.int64)
+    first[inverse[::-1]] = np.arange(len(inverse))[::-1]
+    voxels = coordinates[first]
+
+    density = np.zeros(len(keys), np.int64)
+    for offset in np.indices((3, 3, 3)).reshape(3, -1).T - 1:
+        neighbours = _pack(voxels + offset)
+        idx = np.minimum(np.searchsorted(keys, neighbours), len(keys) - 1)
+        density += np.where(keys[idx] == neighbours, counts[idx], 0)
+
+    density = density[inverse]
+    return density >= density.mean() - std_ratio * density.std()
+
+
+def lod_path(fp: Union[str, pathlib.Path], level: int) -> pathlib.Path:
+    """Путь к файлу уровня детализации level. Уровень 0 - сам fp"""
+    fp = pathlib.Path(fp)
+    if level == 0:
+        return fp
+    return fp.with_name(f"{fp.stem}_lod{level}{fp.suffix}")
@@ -0,0 +1,123 @@
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .calibration import RectificationData, TransformationMap
+from .telemetry import NULL_TELEMETRY, Telemetry
+from .types import ImagePair
+
+
+class Rectifier:
+    """
+    Ректификация кадров в переиспользуемые буферы
+
+    Кадр сначала переводится в оттенки серого, после чего ремаппится
+    уже одноканальное изображение. Карты ремаппинга заранее обрезаются
+    по пересечению валидных областей обеих камер, поэтому на выходе нет
+    невалидных краев и на них не тратится время.
+    Входные кадры не изменяются. После прогрева новые изображения не создаются:
+    результат пишется по кругу в один из заранее выделенных буферов.
+
+    Параметры
+    ---------
+    transformation: :class:`TransformationMap`
+        Датакласс, содержащий в себе массивы для ремаппинга
+    rectification: Optional[:class:`RectificationData`]
+        Данные ректификации. Если указаны - выход обрезается
+        по пересечению left_valid_roi и right_valid_roi
+    buffers: :class:`int`
+        Количество буферов. Результат остается валидным,
+        пока не будет выполнено еще buffers ректификаций
+    telemetry: Optional[:class:`Telemetry`]
+        Замеры времени этапов cvtColor и remap
+
+    Аттрибуты
+    ---------
+    roi: Tuple[:class:`int`]
+        Область (x, y, w, h) ректифицированного кадра, которая попадает на выход
+    """
+    def __init__(
+        self,
+        transformation: TransformationMap,
+        rectification: Optional[RectificationData] = None,
+        buffers: int = 1,
+        telemetry: Optional[Telemetry] = None
+    ) -> None:
+        self.telemetry = telemetry or NULL_TELEMETRY
+        height, width = transformation.left_undistortion_map.shape[:2]
+        self.roi = self._valid_roi((width, height), rectification)
+        x, y, w, h = self.roi
+        self.maps = [
+            (
+                np.ascontiguousarray(undistortion[y:y + h, x:x + w]),
+                np.ascontiguousarray(rectification_map[y:y + h, x:x + w]),
+            )
+            for undistortion, rectification_map in (
+                (transformation.left_undistortion_map, transformation.left_rectification_map),
+                (transformation.right_undistortion_map, transformation.right_rectification_map),
+            )
+        ]
+        self._gray: List[Optional[np.ndarray]] = [None, None]
+        self._buffers: List[ImagePair] = []
+        self._slot = 0
+        self.reserve(buffers)
+
+    @staticmethod
+    def _valid_roi(
+        size: Tuple[int, int],
+        rectification: Optional[RectificationData]
+    ) -> Tuple[int, int, int, int]:
+        width, height = size
+        if rectification is None:
+            return 0, 0, width, height
+        rois = [
+            tuple(int(value) for value in roi)
+            for roi in (rectification.left_valid_roi, rectification.right_valid_roi)
+        ]
+        x0 = max(roi[0] for roi in rois)
+        y0 = max(roi[1] for roi in rois)
+        x1 = min(roi[0] + roi[2] for roi in rois)
+        y1 = min(roi[1] + roi[3] for roi in rois)
+        if x1 <= x0 or y1 <= y0:
+            # пустое пересечение - используем кадр целиком
+            return 0, 0, width, height
+        return x0, y0, x1 - x0, y1 - y0
+
+    def reserve(self, buffers: int) -> None:
+        """Увеличивает количество буферов до buffers"""
+        _, _, width, height = self.roi
+        while len(self._buffers) < buffers:
+            self._buffers.append([np.empty((height, width), np.uint8) for _ in range(2)])
+
+    def __call__(self, frames: ImagePair) -> ImagePair:
+        """
+        Ректифицирует кадры
+
+        Параметры
+        ---------
+        frames: :class:`ImagePair`
+            Левый и правый кадр (BGR или оттенки серого)
+
+        Возвращает
+        ----------
+        :class:`ImagePair`
+            Ректифицированные кадры в оттенках серого, обрезанные по :attr:`roi`
+        """
+        output = self._buffers[self._slot]
+        self._slot = (self._slot + 1) % len(self._buffers)
+        grays = []
+        with self.telemetry.stage("cvtColor"):
+            for idx, frame in enumerate(frames):
+                if frame.ndim == 3:
+                    gray = self._gray[idx]
+                    if gray is None or gray.shape != frame.shape[:2]:
+                        gray = self._gray[idx] = np.empty(frame.shape[:2], np.uint8)
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+                else:
+                    gray = frame
+                grays.append(gray)
+        with self.telemetry.stage("remap"):
+            for idx, gray in enumerate(grays):
+                cv2.remap(gray, *self.maps[idx], cv2.INTER_LINEAR, dst=output[idx])
+        return list(output)
@@ -1,4 +1,7 @@
-from typing import Union
+import time
+import threading
+import warnings
+from typing import Dict, NamedTuple, Optional, Tuple, Union
 from pathlib import Path
 
 import cv2
@@ -6,6 +9,10 @@ import yaml
 
 
 class SGBMConfig():
+    # параметры WLS фильтра, если они не заданы в конфиге
+    wls_lambda = 8000.0
+    wls_sigma_color = 1.5
+
     def __init__(self, **kwds) -> None:
         self.__dict__.update(kwds)
 
@@ -19,10 +26,30 @@ class SGBMConfig():
 
         return cls(**data)
 
-    def get_matcher(self, mode: int) -> cv2.StereoMatcher:
+    @property
+    def key(self) -> Tuple:
+        """Содержимое конфига в виде хешируемого ключа"""
+        return tuple(sorted(self.__dict__.items()))
+
+    def get_matcher(
+        self,
+        mode: int,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> cv2.StereoMatcher:
+        """
+        Создает матчер SGBM
+
+        Диапазон поиска можно переопределить, например, для сопоставления
+        отдельного участка изображения с суженным диапазоном
+        """
+        if min_disparity is None:
+            min_disparity = self.min_disparity
+        if num_disparities is None:
+            num_disparities = self.num_disparities
         return cv2.StereoSGBM_create(
-            minDisparity=self.min_disparity,
-            numDisparities=self.num_disparities,
+            minDisparity=min_disparity,
+            numDisparities=num_disparities,
             blockSize=self.block_size,
             P1=8 * 1 * self.block_size ** 2,
             P2=32 * 1 * self.block_size ** 2,
@@ -33,3 +60,174 @@ class SGBMConfig():
             preFilterCap=self.pre_filter_cap,
             mode=mode  # Режим задается программой
         )
+
+    def get_wls_filter(self, matcher: cv2.StereoMatcher):
+        """Создает WLS фильтр для левого матчера"""
+        wls_filter = cv2.ximgproc.createDisparityWLSFilter(matcher_left=matcher)
+        wls_filter.setLambda(self.wls_lambda)
+        wls_filter.setSigmaColor(self.wls_sigma_color)
+        return wls_filter
+
+
+class _ConfigSnapshot(NamedTuple):
+    # конфиг, его ключ и версия меняются только вместе
+    config: SGBMConfig
+    key: Tuple
+    version: int
+
+
+class MatcherRegistry:
+    """
+    Кеш матчеров и WLS фильтров с отслеживанием изменений конфига
+
+    Каждый объект OpenCV создается один раз для пары (содержимое конфига, режим)
+    и затем переиспользуется. Матчеры SGBM хранят внутренние буферы, поэтому
+    у каждого потока свой набор объектов.
+
+    Файл конфига перечитывается, только если изменилось время его модификации,
+    а время проверяется не чаще чем раз в check_interval секунд.
+    Это позволяет подбирать параметры, не перезапуская захват.
+    Конфиг, его ключ и версия заменяются одним снимком под блокировкой,
+    а каждый вызов читает снимок один раз, поэтому перезагрузка из другого
+    потока не смешивает объекты старого и нового конфига.
+
+    Параметры
+    ---------
+    path: :class:`str` | :class:`Path`
+        Путь к файлу конфига
+    check_interval: :class:`float`
+        Минимальный интервал между проверками файла в секундах
+
+    Аттрибуты
+    ---------
+    version: :class:`int`
+        Увеличивается при каждой перезагрузке конфига
+    """
+    def __init__(
+        self,
+        path: Union[Path, str] = 'sgbm_config.yml',
+        check_interval: float = 1.0
+    ) -> None:
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._mtime = self.path.stat().st_mtime_ns
+        config = SGBMConfig.from_path(self.path)
+        self._snapshot = _ConfigSnapshot(config, config.key, 0)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def config(self) -> SGBMConfig:
+        """Актуальный конфиг"""
+        return self._current().config
+
+    @property
+    def version(self) -> int:
+        """Номер версии конфига"""
+        return self._snapshot.version
+
+    def _current(self) -> _ConfigSnapshot:
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            with self._lock:
+                self._checked = now
+                self._reload()
+        return self._snapshot
+
+    def _reload(self) -> None:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            config = SGBMConfig.from_path(self.path)
+        except Exception as error:
+            # файл мог быть прочитан во время сохранения - оставляем прежний конфиг
+            warnings.warn(f"Не удалось перечитать {self.path}: {error}")
+            return
+        snapshot = self._snapshot
+        if config.key != snapshot.key:
+            self._snapshot = _ConfigSnapshot(config, config.key, snapshot.version + 1)
+
+    def _cache(self, snapshot: _ConfigSnapshot) -> Dict:
+        # после перезагрузки конфига объекты старой версии больше не нужны
+        if getattr(self._local, "version", None) != snapshot.version:
+            self._local.cache = {}
+            self._local.version = snapshot.version
+        return self._local.cache
+
+    def get_matcher(
+        self,
+        mode: int,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> cv2.StereoMatcher:
+        """Возвращает матчер текущего потока для актуального конфига"""
+        snapshot = self._current()
+        key = ("matcher", snapshot.key, mode, min_disparity, num_disparities)
+        cache = self._cache(snapshot)
+        if key not in cache:
+            cache[key] = snapshot.config.get_matcher(mode, min_disparity, num_disparities)
+        return cache[key]
+
+    def get_wls_matcher(
+        self,
+        mode: int,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> cv2.StereoMatcher:
+        """
+        Возвращает левый матчер для WLS фильтрации
+
+        createDisparityWLSFilter меняет параметры переданного матчера
+        (отключает проверку левый-правый и фильтр пятен), поэтому
+        у фильтра свой матчер, а :meth:`get_matcher` остается неизменным
+        """
+        return self.get_wls_filter(mode, min_disparity, num_disparities)[1]
+
+    def get_right_matcher(
+        self,
+        mode: int,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> cv2.StereoMatcher:
+        """Возвращает правый матчер для WLS фильтрации"""
+        snapshot = self._current()
+        key = ("right", snapshot.key, mode, min_disparity, num_disparities)
+        cache = self._cache(snapshot)
+        if key not in cache:
+            # правый матчер копирует параметры левого, уже измененные фильтром
+            _, left_matcher = self._wls(snapshot, mode, min_disparity, num_disparities)
+            cache[key] = cv2.ximgproc.createRightMatcher(left_matcher)
+        return cache[key]
+
+    def get_wls_filter(
+        self,
+        mode: int,
+        min_disparity: Optional[int] = None,
+        num_disparities: Optional[int] = None
+    ) -> Tuple[cv2.ximgproc.DisparityWLSFilter, cv2.StereoMatcher]:
+        """
+        Возвращает WLS фильтр с параметрами из конфига и его левый матчер
+
+        Фильтр и матчер берутся из одного снимка конфига
+        """
+        return self._wls(self._current(), mode, min_disparity, num_disparities)
+
+    def _wls(
+        self,
+        snapshot: _ConfigSnapshot,
+        mode: int,
+        min_disparity: Optional[int],
+        num_disparities: Optional[int]
+    ) -> Tuple[cv2.ximgproc.DisparityWLSFilter, cv2.StereoMatcher]:
+        key = ("wls", snapshot.key, mode, min_disparity, num_disparities)
+        cache = self._cache(snapshot)
+        if key not in cache:
+            matcher = snapshot.config.get_matcher(mode, min_disparity, num_disparities)
+            cache[key] = (snapshot.config.get_wls_filter(matcher), matcher)
+        return cache[key]
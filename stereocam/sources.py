@@ -0,0 +1,260 @@
+import abc
+import sys
+from typing import List, Optional, Sequence, Union
+
+import pathlib
+import cv2
+
+from .datasets.frames import FramesDataset
+from .types import ImagePair
+
+
+def default_backend() -> int:
+    """
+    Backend захвата камер для текущей платформы
+
+    DirectShow доступен только в Windows, в Linux используется V4L2,
+    в macOS - AVFoundation.
+    """
+    if sys.platform.startswith("win"):
+        return cv2.CAP_DSHOW
+    if sys.platform.startswith("linux"):
+        return cv2.CAP_V4L2
+    if sys.platform == "darwin":
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+
+class FrameSource(abc.ABC):
+    """
+    Источник пар кадров для :class:`StereoPair`
+
+    Аттрибуты
+    ---------
+    captures: List[:class:`VideoCapture`]
+        Независимые потоки левого и правого кадра. Если они есть,
+        :class:`StereoCapture` захватывает их в отдельных потоках одновременно.
+        Пустой список - пара читается целиком через :meth:`grab` и :meth:`retrieve`
+    live: :class:`bool`
+        Истина для камер. Записанные источники можно читать без потери кадров
+        с любой скоростью
+    """
+    captures: List[cv2.VideoCapture] = []
+    live = False
+
+    def grab(self) -> bool:
+        """
+        Захватывает следующую пару, не декодируя ее
+
+        Возвращает False, если источник закончился
+        """
+        grabbed = [capture.grab() for capture in self.captures]
+        return all(grabbed)
+
+    def retrieve(self) -> ImagePair:
+        """Декодирует пару, захваченную :meth:`grab`"""
+        return [capture.retrieve()[1] for capture in self.captures]
+
+    def read(self) -> Optional[ImagePair]:
+        """
+        Следующая пара кадров
+
+        Возвращает
+        ----------
+        Optional[:class:`ImagePair`]
+            Левый и правый кадр или None, если источник закончился
+        """
+        # сначала захватываем кадры обоих потоков, и только потом декодируем
+        if not self.grab():
+            return None
+        frames = self.retrieve()
+        if any(frame is None for frame in frames):
+            return None
+        return frames
+
+    def release(self) -> None:
+        """Освобождает устройства и файлы"""
+        for capture in self.captures:
+            capture.release()
+
+    def __iter__(self):
+        while True:
+            frames = self.read()
+            if frames is None:
+                return
+            yield frames
+
+    def __enter__(self) -> "FrameSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class DeviceSource(FrameSource):
+    """
+    Две камеры
+
+    Параметры
+    ---------
+    device_ids: List[:class:`int`]
+        Индексы левой и правой камеры
+    backend: Optional[:class:`int`]
+        Backend захвата (cv2.CAP_*). По умолчанию - :func:`default_backend`
+    """
+    live = True
+
+    def __init__(self, device_ids: Sequence[int], backend: Optional[int] = None) -> None:
+        if len(device_ids) != 2:
+            raise ValueError("Необходимо ровно два индекса камер")
+        if backend is None:
+            backend = default_backend()
+        self.captures = [cv2.VideoCapture(device_id, backend) for device_id in device_ids]
+
+
+class VideoFileSource(FrameSource):
+    """
+    Два видеофайла, записанные левой и правой камерой
+
+    Кадры читаются с максимальной скоростью, без пауз между кадрами.
+
+    Параметры
+    ---------
+    left: :class:`str` | :class:`Path`
+        Видео левой камеры
+    right: :class:`str` | :class:`Path`
+        Видео правой камеры
+    """
+    def __init__(
+        self,
+        left: Union[str, pathlib.Path],
+        right: Union[str, pathlib.Path]
+    ) -> None:
+        self.captures = [cv2.VideoCapture(str(path)) for path in (left, right)]
+        for path, capture in zip((left, right), self.captures):
+            if not capture.isOpened():
+                raise IOError(f"Не удалось открыть видео {path}")
+
+
+class DatasetSource(FrameSource):
+    """
+    Пары кадров из папки :class:`FramesDataset`
+
+    Параметры
+    ---------
+    dataset: :class:`FramesDataset` | :class:`str` | :class:`Path`
+        Датасет или путь к папке. Папка открывается лениво,
+        следующие пары декодируются заранее в фоновых потоках
+    loop: :class:`bool`
+        Повторять датасет бесконечно, например для нагрузочного тестирования
+    """
+    def __init__(
+        self,
+        dataset: Union[FramesDataset, str, pathlib.Path],
+        loop: bool = False
+    ) -> None:
+        if not isinstance(dataset, FramesDataset):
+            dataset = FramesDataset(dataset, lazy=True, prefetch=4)
+        self.dataset = dataset
+        self.loop = loop
+        self._iterator = iter(dataset)
+        self._frames: Optional[ImagePair] = None
+
+    def grab(self) -> bool:
+        try:
+            self._frames = next(self._iterator)
+        except StopIteration:
+            if not self.loop or not len(self.dataset):
+                self._frames = None
+                return False
+            self._iterator = iter(self.dataset)
+            self._frames = next(self._iterator)
+        return True
+
+    def retrieve(self) -> ImagePair:
+        return list(self._frames)
+
+    def release(self) -> None:
+        self._frames = None
+
+
+class SideBySideSource(FrameSource):
+    """
+    Один поток, в котором левый и правый кадр склеены по горизонтали
+
+    Такой поток отдают многие стереокамеры с одним USB подключением.
+    Кадр разделяется на левую и правую половины без копирования:
+    кадры пары - представления (views) одного массива.
+
+    Параметры
+    ---------
+    source: :class:`int` | :class:`str` | :class:`Path`
+        Индекс камеры или путь к видеофайлу
+    backend: Optional[:class:`int`]
+        Backend захвата камеры. По умолчанию - :func:`default_backend`
+    """
+    def __init__(
+        self,
+        source: Union[int, str, pathlib.Path],
+        backend: Optional[int] = None
+    ) -> None:
+        if isinstance(source, int):
+            self.live = True
+            if backend is None:
+                backend = default_backend()
+            self._capture = cv2.VideoCapture(source, backend)
+        else:
+            self._capture = cv2.VideoCapture(str(source))
+        if not self._capture.isOpened():
+            raise IOError(f"Не удалось открыть источник {source}")
+
+    def grab(self) -> bool:
+        return self._capture.grab()
+
+    def retrieve(self) -> ImagePair:
+        frame = self._capture.retrieve()[1]
+        if frame is None:
+            return [None, None]
+        half = frame.shape[1] // 2
+        return [frame[:, :half], frame[:, half:2 * half]]
+
+    def release(self) -> None:
+        self._capture.release()
+
+
+def open_source(
+    spec: Sequence[str],
+    side_by_side: bool = False,
+    loop: bool = False
+) -> FrameSource:
+    """
+    Создает источник по аргументам командной строки
+
+    - два индекса камер - :class:`DeviceSource`
+    - два видеофайла - :class:`VideoFileSource`
+    - папка с кадрами - :class:`DatasetSource`
+    - индекс камеры или видеофайл с side_by_side - :class:`SideBySideSource`
+
+    Параметры
+    ---------
+    spec: Sequence[:class:`str`]
+        Аргументы, описывающие источник
+    side_by_side: :class:`bool`
+        Левый и правый кадр склеены в одном потоке
+    loop: :class:`bool`
+        Повторять папку с кадрами бесконечно
+    """
+    spec = list(spec)
+    if side_by_side:
+        if len(spec) != 1:
+            raise ValueError("Для склеенного потока нужен один источник")
+        return SideBySideSource(int(spec[0]) if spec[0].isdigit() else spec[0])
+    if len(spec) == 1:
+        if not pathlib.Path(spec[0]).is_dir():
+            raise ValueError(f"{spec[0]} не является папкой с кадрами")
+        return DatasetSource(spec[0], loop=loop)
+    if len(spec) == 2:
+        if all(item.isdigit() for item in spec):
+            return DeviceSource([int(item) for item in spec])
+        return VideoFileSource(*spec)
+    raise ValueError("Источник задается двумя камерами, двумя видео или папкой с кадрами")
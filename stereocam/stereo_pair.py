@@ -1,10 +1,27 @@
-from typing import List, Optional, Tuple
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
 
+from .calibration.corners import (
+    detection_scale,
+    find_chessboard_corners,
+    refine_chessboard_corners
+)
+from .capture import StampedPair, StereoCapture
+from .datasets.manifest import Manifest, ManifestEntry
+from .datasets.store import DisparityStore
 from .disparity_estimator import DisparityEstimator
+from .governor import QualityGovernor
+from .pipeline import DisparityPipeline, DropPolicy, PipelineItem, show_disparity
+from .sources import DeviceSource, FrameSource
+from .telemetry import NULL_TELEMETRY, Telemetry
 from .types import ImagePair
+from .writer import AsyncWriter, write_image
 
 
 class StereoPair:
@@ -12,51 +29,164 @@ class StereoPair:
 
     Параметры
     ---------
-    device_ids: List[:class:`int`]
+    source: List[:class:`int`] | :class:`FrameSource`
             Список индексов камер, которые будут источником видеопотока.
             Нулевому индексу должна соответствовать левая камера, первому - правая.
+            Вместо камер можно передать любой :class:`FrameSource`: пару видеофайлов,
+            папку с кадрами или склеенный поток
+    writer: Optional[:class:`AsyncWriter`]
+            Фоновая запись. Если указана, :meth:`save_frames` и :meth:`save_disparity`
+            только ставят запись в очередь и сразу возвращают управление
+    telemetry: Optional[:class:`Telemetry`]
+            Замеры времени этапов capture, imshow, save_frames, save_disparity,
+            а также display и latency (от захвата пары до показа карты)
 
     Аттрибуты
     ---------
+    source: :class:`FrameSource`
+        Источник пар кадров
     captures: List[:class:`VideoCapture`]
         Список обьектов VideoCapture, для чтения видеопотока.
-        Нулевому индексу соответствует левая камера, первому - правая
+        Нулевому индексу соответствует левая камера, первому - правая.
+        Пустой, если источник отдает пару целиком
+    capture: Optional[:class:`StereoCapture`]
+        Фоновый захват кадров, если он запущен через :meth:`start_capture`
 
     """
 
     _sides = ["left", "right"]
 
-    def __init__(self, device_ids: List[int]) -> None:
+    def __init__(
+        self,
+        source: Union[Sequence[int], FrameSource],
+        writer: Optional[AsyncWriter] = None,
+        telemetry: Optional[Telemetry] = None
+    ) -> None:
+        self.telemetry = telemetry or NULL_TELEMETRY
         self._saved_frames_count = 0
+        self._saved_disparity_count = 0
+        self._save_lock = threading.Lock()
+        self.writer = writer
         self._windows = [side for side in self._sides]
-        self.captures = [cv2.VideoCapture(device_id, cv2.CAP_DSHOW) for device_id in device_ids]
+        if not isinstance(source, FrameSource):
+            source = DeviceSource(source)
+        self.source = source
+        self.captures = source.captures
+        self.capture: Optional[StereoCapture] = None
+
+    def start_capture(
+        self,
+        buffer_size: int = 2,
+        max_skew: Optional[float] = None
+    ) -> StereoCapture:
+        """
+        Запускает фоновый синхронизированный захват кадров
+
+        После запуска :meth:`get_frames` не обращается к камерам,
+        а возвращает самую свежую пару из буфера.
+
+        Параметры
+        ---------
+        buffer_size: :class:`int`
+            Размер кольцевого буфера пар
+        max_skew: Optional[:class:`float`]
+            Максимально допустимая рассинхронизация камер в секундах
+        """
+        if self.capture is None:
+            self.capture = StereoCapture(self.source, buffer_size, max_skew)
+        return self.capture.start()
+
+    def stop_capture(self) -> None:
+        """Останавливает фоновый захват кадров"""
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+
+    def close(self) -> None:
+        """Останавливает захват и освобождает источник"""
+        self.stop_capture()
+        self.source.release()
 
     def get_frames(self) -> ImagePair:
         """
         Считывает кадры с камер
 
+        Если запущен фоновый захват, возвращает самую свежую
+        еще не прочитанную пару, иначе считывает кадры напрямую.
+
         Вовзращает
         ----------
         :class:`ImagePair`
             Список считанных кадров с левой и правой камеры
         """
-        return [capture.read()[1] for capture in self.captures]
+        with self.telemetry.stage("capture"):
+            pair = self._read_pair()
+        if pair is None:
+            raise RuntimeError("Захват кадров остановлен или источник закончился")
+        return list(pair.frames)
+
+    def _read_pair(self) -> Optional[StampedPair]:
+        if self.capture is not None:
+            return self.capture.read()
+        # без фонового захвата кадры захватываются прямо сейчас
+        grabbed = time.monotonic()
+        frames = self.source.read()
+        if frames is None:
+            return None
+        return StampedPair(frames, (grabbed, grabbed), -1)
+
+    def stream(self, stamped: bool = False) -> Iterator[Union[ImagePair, StampedPair]]:
+        """
+        Бесконечный поток пар кадров
+
+        Заканчивается, если фоновый захват остановлен
+        или источник перестал отдавать кадры.
+
+        Параметры
+        ---------
+        stamped: :class:`bool`
+            Отдавать :class:`StampedPair` с временем захвата вместо списка кадров
+        """
+        while True:
+            with self.telemetry.stage("capture"):
+                pair = self._read_pair()
+            if pair is None:
+                return
+            yield pair if stamped else list(pair.frames)
 
-    def show_frames(self) -> None:
+    def show_frames(self, overlay: bool = False, frames: Optional[ImagePair] = None) -> None:
         """
         Показывает кадры с камер
+
+        Параметры
+        ---------
+        overlay: :class:`bool`
+            Выводить поверх левого кадра задержки и FPS этапов
+        frames: Optional[:class:`ImagePair`]
+            Кадры, которые нужно показать. Если не указано - захватываются текущие кадры
         """
-        for window, frame in zip(self._windows, self.get_frames()):
-            cv2.imshow(window, frame)
+        if frames is None:
+            frames = self.get_frames()
+        if overlay:
+            frames[0] = self.telemetry.overlay(frames[0].copy())
+        with self.telemetry.stage("imshow"):
+            for window, frame in zip(self._windows, frames):
+                cv2.imshow(window, frame)
 
-    def show_videos(self) -> None:
+    def show_videos(self, overlay: bool = False) -> None:
         """
         Транслирует видеопоток с камер
 
-        Для закрытия окон достаточно нажать q
+        Для закрытия окон достаточно нажать q.
+        Для записанных источников заканчивается вместе с источником
+
+        Параметры
+        ---------
+        overlay: :class:`bool`
+            Выводить поверх левого кадра задержки и FPS этапов
         """
-        while True:
-            self.show_frames()
+        for frames in self.stream():
+            self.show_frames(overlay, frames)
             pressed_key = cv2.waitKey(1) & 0xFF
             if pressed_key == ord('q'):
                 break
@@ -64,7 +194,8 @@ class StereoPair:
     def save_frames(
         self,
         fp: str,
-        frames: Optional[ImagePair] = None
+        frames: Optional[ImagePair] = None,
+        timestamp: Optional[float] = None
     ) -> None:
         """
         Записывает кадры с камер в хранилище
@@ -77,24 +208,87 @@ class StereoPair:
         frames: Optional[List[:class:`ImagePair`]]
             Список кадров с камер, которые необходимо записать
             Если не указано - захватываются текущие кадры
+
+        timestamp: Optional[:class:`float`]
+            Время захвата кадров (unix time) для индекса датасета.
+            Если не указано - используется текущее время
+
+        Пара также дописывается в индекс папки manifest.jsonl
         """
         if frames is None:
             frames = self.get_frames()
+        if timestamp is None:
+            timestamp = time.time()
+        with self._save_lock:
+            entry_id = self._saved_frames_count
+            self._saved_frames_count += 1
+        if self.writer is None:
+            self._write_frames(fp, frames, entry_id, timestamp, "png", [])
+        else:
+            self.writer.submit(
+                self._write_frames,
+                fp,
+                list(frames),
+                entry_id,
+                timestamp,
+                self.writer.image_format,
+                self.writer.image_params
+            )
+
+    def _write_frames(
+        self,
+        fp: str,
+        frames: ImagePair,
+        entry_id: int,
+        timestamp: float,
+        image_format: str,
+        params: List[int]
+    ) -> None:
+        with self.telemetry.stage("save_frames"):
+            self._write_frame_files(fp, frames, entry_id, timestamp, image_format, params)
+
+    def _write_frame_files(
+        self,
+        fp: str,
+        frames: ImagePair,
+        entry_id: int,
+        timestamp: float,
+        image_format: str,
+        params: List[int]
+    ) -> None:
+        names = []
         for idx, frame in enumerate(frames):
             side = self._sides[idx]
-            cv2.imwrite(f'{fp}/{self._saved_frames_count}_{side}.png', frame)
-        self._saved_frames_count += 1
+            name = f'{entry_id}_{side}.{image_format}'
+            write_image(f'{fp}/{name}', frame, params)
+            names.append(name)
+        # запись в индекс - только после того, как оба файла записаны
+        Manifest(fp).append(
+            ManifestEntry(
+                id=entry_id,
+                files=names,
+                timestamp=timestamp,
+                shape=list(frames[0].shape),
+                dtype=str(frames[0].dtype)
+            )
+        )
 
     def get_chessboard_frames(
             self,
             columns: int,
             rows: int,
+            detection_width: Optional[int] = 640,
+            interval: Optional[float] = None
     ) -> Tuple[ImagePair]:
         """
         Получает кадры с камер с шахматной доской
 
         Этот метод дожидается пока на обоих кадрах не будут найдены углы шахматной доски.
 
+        Доска ищется на уменьшенных копиях кадров. Правый кадр проверяется,
+        только если доска найдена на левом. Когда доска найдена на обоих кадрах,
+        углы параллельно уточняются в полном разрешении.
+
         Параметры
         ---------
         columns :class:`int`
@@ -103,63 +297,111 @@ class StereoPair:
         rows: :class:`int`
             Количество внутренних углов в строках шахматной доски
 
+        detection_width: Optional[:class:`int`]
+            Ширина уменьшенной копии кадра для поиска. None - искать в полном разрешении
+
+        interval: Optional[:class:`float`]
+            Минимальный интервал между попытками в секундах,
+            чтобы поиск не отнимал процессор у показа видео
+
         Возвращает
         ----------
         frames: :class:`ImagesPair`
             Список кадров с камер
         chessboard_corners List[:class:`MatLike`]
-            Найденные углы.
+            Найденные углы в координатах исходных кадров.
         """
-        found = [False, False]
-        chessboard_corners = [None, None]
+        pattern_size = (columns, rows)
+        with ThreadPoolExecutor(len(self._sides)) as pool:
+            while True:
+                started = time.monotonic()
+                frames = self.get_frames()
+                grays = []
+                chessboard_corners = []
+                for frame in frames:
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    corners = find_chessboard_corners(
+                        gray,
+                        pattern_size,
+                        detection_width,
+                        refine=False,
+                        fallback=False
+                    )
+                    if corners is None:
+                        break
+                    grays.append(gray)
+                    chessboard_corners.append(corners)
+                else:
+                    scale = detection_scale(grays[0].shape[1], detection_width)
+                    futures = [
+                        pool.submit(refine_chessboard_corners, gray, corners, scale)
+                        for gray, corners in zip(grays, chessboard_corners)
+                    ]
+                    return frames, [future.result() for future in futures]
 
-        while not all(found):
-            print("Поиск доски...")
-            frames = self.get_frames()
-            for idx, frame in enumerate(frames):
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                found[idx], chessboard_corners[idx] = cv2.findChessboardCorners(
-                    gray,
-                    (columns, rows),
-                    flags=cv2.CALIB_CB_FAST_CHECK
-                )
-
-        return frames, chessboard_corners
+                if interval is not None:
+                    time.sleep(max(0.0, interval - (time.monotonic() - started)))
 
     def show_disparity_map(
         self,
-        disparity_estimator: DisparityEstimator
+        disparity_estimator: DisparityEstimator,
+        on_item: Optional[Callable[[PipelineItem], None]] = None,
+        drop_policy: Optional[DropPolicy] = None,
+        overlay: bool = False,
+        governor: Optional[QualityGovernor] = None
     ) -> None:
         """
         Строит и показывает карту диспаратности
         Для выхода из метода нужно нажать q
 
+        Захват, ректификация и сопоставление выполняются конвейером
+        :class:`DisparityPipeline` в отдельных потоках.
+
         Параметры
         ---------
         disparity_estimator: :class:`DisparityEstimator`
             Экземпляр класса DisparityEstimator, который высчитывает карту диспаратности
+        on_item: Optional[Callable[[:class:`PipelineItem`], None]]
+            Вызывается для каждой готовой карты перед отображением
+        drop_policy: Optional[:class:`DropPolicy`]
+            Поведение конвейера, когда сопоставление не успевает за камерами.
+            По умолчанию для камер выбрасываются старые кадры, а записанные
+            источники обрабатываются без потерь (BLOCK)
+        overlay: :class:`bool`
+            Выводить поверх карты задержки и FPS этапов
+        governor: Optional[:class:`QualityGovernor`]
+            Регулятор качества, удерживающий заданную частоту кадров.
+            Уровень каждой карты - в :attr:`PipelineItem.level`
         """
-        while True:
-            frames = self.get_frames()
-            disparity = disparity_estimator.compute(frames)
-            visualization = cv2.normalize(
-                disparity,
-                None,
-                alpha=0,
-                beta=255,
-                norm_type=cv2.NORM_MINMAX,
-                dtype=cv2.CV_8U
-            )
-            cv2.imshow("Disparity", visualization)
-            pressed_key = cv2.waitKey(1) & 0xFF
-            if pressed_key == ord('q'):
-                break
+        if drop_policy is None:
+            drop_policy = DropPolicy.DROP_OLDEST if self.source.live else DropPolicy.BLOCK
+        telemetry = self.telemetry
+
+        def sink(item: PipelineItem) -> bool:
+            if on_item is not None:
+                on_item(item)
+            with telemetry.stage("display"):
+                shown = show_disparity(item, telemetry=telemetry if overlay else None)
+            telemetry.record("latency", time.monotonic() - item.timestamp)
+            return shown
+
+        pipeline = DisparityPipeline(
+            # время захвата передается в конвейер, чтобы задержка учитывала ожидание в буфере
+            self.stream(stamped=True),
+            disparity_estimator,
+            sink,
+            drop_policy=drop_policy,
+            governor=governor
+        )
+        pipeline.run()
 
     def save_disparity(
         self,
         fp: str,
         disparity_estimator: DisparityEstimator,
-        frames: Optional[ImagePair] = None
+        frames: Optional[ImagePair] = None,
+        store: Optional[DisparityStore] = None,
+        timestamp: Optional[float] = None
     ) -> None:
         """
         Сохраняет карту диспаратности в файл
@@ -177,9 +419,79 @@ class StereoPair:
             для вычисления карты диспаратности
 
             Если не указано - захватываются текущие кадры
+
+        store: Optional[:class:`DisparityStore`]
+            Хранилище, в которое записывается карта вместо отдельного .npz файла.
+            Имя файла из fp тогда используется только как номер карты
+
+        timestamp: Optional[:class:`float`]
+            Время захвата кадров (unix time) для индекса датасета.
+            Если не указано - используется текущее время. Чтобы карта и кадры
+            из :meth:`save_frames` совпадали в индексах, передайте обоим одно время
+
+        Карта также дописывается в индекс папки manifest.jsonl
         """
         disparity_estimator.set_mode(cv2.STEREO_SGBM_MODE_HH)
         if frames is None:
             frames = self.get_frames()
+        if timestamp is None:
+            timestamp = time.time()
+        with self._save_lock:
+            count = self._saved_disparity_count
+            self._saved_disparity_count += 1
+        path = Path(fp)
+        entry_id = int(path.stem) if path.stem.isdigit() else count
+        if self.writer is None:
+            self._write_disparity(path, disparity_estimator, frames, store, entry_id, timestamp)
+        else:
+            # WLS фильтрация тоже выполняется в фоне
+            self.writer.submit(
+                self._write_disparity,
+                path,
+                disparity_estimator,
+                list(frames),
+                store,
+                entry_id,
+                timestamp
+            )
+
+    def _write_disparity(
+        self,
+        path: Path,
+        disparity_estimator: DisparityEstimator,
+        frames: ImagePair,
+        store: Optional[DisparityStore],
+        entry_id: int,
+        timestamp: float
+    ) -> None:
+        with self.telemetry.stage("save_disparity"):
+            self._write_disparity_map(
+                path, disparity_estimator, frames, store, entry_id, timestamp
+            )
+
+    def _write_disparity_map(
+        self,
+        path: Path,
+        disparity_estimator: DisparityEstimator,
+        frames: ImagePair,
+        store: Optional[DisparityStore],
+        entry_id: int,
+        timestamp: float
+    ) -> None:
         disparity = disparity_estimator.get_filtered_disparity(frames)
-        np.savez_compressed(fp, disparity=disparity)
+        if store is not None:
+            store.append(disparity, entry_id, timestamp)
+            return
+        if path.suffix != ".npz":
+            path = path.with_name(path.name + ".npz")
+        np.savez_compressed(path, disparity=disparity)
+
+        Manifest(path.parent).append(
+            ManifestEntry(
+                id=entry_id,
+                files=[path.name],
+                timestamp=timestamp,
+                shape=list(disparity.shape),
+                dtype=str(disparity.dtype)
+            )
+        )
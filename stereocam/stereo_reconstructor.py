@@ -1,51 +1,472 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple, Union
+
 import cv2
 import numpy as np
-import open3d
 from pathlib import Path
 
 from .calibration import RectificationData
-from .types import MapImagesPair
+from .datasets.disparities import DisparityDataset
+from .depth import DepthLUT
+from .fusion import VoxelMap
+from .telemetry import NULL_TELEMETRY, Telemetry
+from .point_cloud import (
+    PlyWriter,
+    iter_point_chunks,
+    lod_path,
+    reproject_points,
+    statistical_outlier_mask,
+    valid_mask,
+    voxel_downsample
+)
+from .types import ImagePair, MapImagesPair
+
+
+@dataclass
+class ReconstructionReport:
+    """
+    Итоги пакетной реконструкции
+
+    Аттрибуты
+    ---------
+    processed: :class:`int`
+        Количество построенных облаков
+    skipped: :class:`int`
+        Количество карт, облака для которых уже были построены
+    points: :class:`int`
+        Суммарное количество записанных точек
+    seconds: :class:`float`
+        Время работы
+    """
+    processed: int = 0
+    skipped: int = 0
+    points: int = 0
+    seconds: float = 0.0
+
+    @property
+    def maps_per_second(self) -> float:
+        return self.processed / self.seconds if self.seconds else 0.0
+
+    @property
+    def points_per_second(self) -> float:
+        return self.points / self.seconds if self.seconds else 0.0
+
+
+def disparity_scale(disparity_map: np.ndarray) -> float:
+    """
+    Множитель перевода значений карты диспаратности в пиксели
+
+    Карта int16 - сырой результат SGBM в 1/16 пикселя, как ее сохраняет
+    :meth:`StereoPair.save_disparity`. Карты с плавающей точкой
+    (результат :meth:`DisparityEstimator.match`) уже заданы в пикселях.
+    """
+    return 1 / 16 if disparity_map.dtype == np.int16 else 1.0
 
 
 class StereoReconstructor:
     """
     Класс для создания облака точек из карты диспаратности
 
+    Облака точек, объединенная модель и карты глубины строятся по одной
+    диспаратности в пикселях (см. :func:`disparity_scale`), поэтому
+    координата Z точек совпадает с картой глубины :meth:`depth_map`.
+
     Параметры
     ---------
     rectification_data: :class:`RectificationData`
         Данные, полученные после стерео ректификации.
+    backend: :class:`str`
+        Способ записи облака: "numpy" - встроенная запись .ply,
+        "open3d" - через open3d (пакет импортируется только при использовании)
+    voxel_size: Optional[:class:`float`]
+        Размер вокселя для прореживания облака в единицах облака.
+        None - сохраняется каждый пиксель карты
+    lod_levels: :class:`int`
+        Количество уровней детализации. Уровень k прорежен вокселем
+        voxel_size * 2^k и записывается в файл {имя}_lod{k}.ply
+    outlier_std: Optional[:class:`float`]
+        Порог отбрасывания выбросов в стандартных отклонениях плотности
+        (см. :func:`statistical_outlier_mask`). Плотность считается в вокселях voxel_size
+    telemetry: Optional[:class:`Telemetry`]
+        Замеры времени этапов reproject и save_ply.
+        В процессы :meth:`reconstruct_dataset` не передаются
     """
+    backends = ("numpy", "open3d")
+
     def __init__(
         self,
         rectification_data: RectificationData,
+        backend: str = "numpy",
+        voxel_size: Optional[float] = None,
+        lod_levels: int = 1,
+        outlier_std: Optional[float] = None,
+        telemetry: Optional[Telemetry] = None
     ) -> None:
+        if backend not in self.backends:
+            raise ValueError(f"Неизвестный способ записи {backend}")
+        if voxel_size is None and (lod_levels > 1 or outlier_std is not None):
+            raise ValueError("Для уровней детализации и отбрасывания выбросов нужен voxel_size")
         self.rectification_data = rectification_data
+        self.backend = backend
+        self.voxel_size = voxel_size
+        self.lod_levels = lod_levels
+        self.outlier_std = outlier_std
+        self.telemetry = telemetry or NULL_TELEMETRY
+        self._depth_luts: Dict[tuple, DepthLUT] = {}
 
-    def save_point_cloud(self, map_images_pair: MapImagesPair, fp: Path) -> None:
+    def __getstate__(self) -> dict:
+        # замеры остаются в основном процессе
+        state = self.__dict__.copy()
+        state["telemetry"] = NULL_TELEMETRY
+        return state
+
+    def save_point_cloud(
+        self,
+        map_images_pair: MapImagesPair,
+        fp: Path,
+        offset: Tuple[int, int] = (0, 0)
+    ) -> int:
         """
         Сохраняет облако точек в .ply файл
 
+        Без прореживания точки пишутся полосами, не держа в памяти все облако.
+        Уровни детализации пишутся от грубого к точному, fp - последним.
+        Каждый файл пишется под временным именем и переименовывается после записи.
+
         Параметры
         ---------
         map_images_pair: :class:`MapImagesPair`
             Кортеж, где первый элемент - список кадров,
             а второй - карта диспаратности
+        offset: Tuple[:class:`int`]
+            Координаты (x, y) карты в кадре, если карта вырезана
+            по области интереса (см. :attr:`DisparityEstimator.roi`)
+
+        Возвращает
+        ----------
+        :class:`int`
+            Количество точек, записанных в fp
         """
+        with self.telemetry.stage("save_ply"):
+            return self._save_point_cloud(map_images_pair, Path(fp), offset)
+
+    def _save_point_cloud(
+        self,
+        map_images_pair: MapImagesPair,
+        fp: Path,
+        offset: Tuple[int, int]
+    ) -> int:
         frames, disparity_map = map_images_pair
-        left_image = frames[0][:disparity_map.shape[0], :disparity_map.shape[1]]
-        left_image = cv2.cvtColor(left_image, cv2.COLOR_BGR2RGB)
+        left_image = self._left_colors(frames, disparity_map, offset)
+        q_matrix = self.rectification_data.disparity_to_depth_matrix
+
+        temporary = fp.with_name(f"{fp.stem}.tmp{fp.suffix}")
+
+        if self.backend == "numpy" and self.voxel_size is None:
+            with PlyWriter(temporary) as writer:
+                for points, colors in iter_point_chunks(
+                    disparity_map,
+                    q_matrix,
+                    left_image,
+                    valid_mask(disparity_map),
+                    offset,
+                    disparity_scale=disparity_scale(disparity_map)
+                ):
+                    writer.write(points, colors)
+            temporary.replace(fp)
+            return writer.count
+
+        with self.telemetry.stage("reproject"):
+            points, mask = reproject_points(
+                disparity_map,
+                q_matrix,
+                offset=offset,
+                disparity_scale=disparity_scale(disparity_map)
+            )
+        colors = left_image[mask]
+        if self.voxel_size is None:
+            self._write(fp, points, colors)
+            return len(points)
+
+        if self.outlier_std is not None:
+            keep = statistical_outlier_mask(points, self.voxel_size, self.outlier_std)
+            points, colors = points[keep], colors[keep]
+
+        levels = []
+        weights = None
+        for level in range(self.lod_levels):
+            # каждый следующий уровень прореживается из предыдущего с учетом весов
+            points, colors, weights = voxel_downsample(
+                points, colors, self.voxel_size * 2 ** level, weights
+            )
+            levels.append((points, colors))
+        for level in reversed(range(self.lod_levels)):
+            self._write(lod_path(fp, level), *levels[level])
+        return len(levels[0][0])
+
+    def _write(self, fp: Path, points: np.ndarray, colors: np.ndarray) -> None:
+        temporary = fp.with_name(f"{fp.stem}.tmp{fp.suffix}")
+        if self.backend == "open3d":
+            self._write_open3d(temporary, points, colors)
+        else:
+            with PlyWriter(temporary) as writer:
+                writer.write(points, colors)
+        temporary.replace(fp)
+
+    def depth_map(
+        self,
+        disparity_map: np.ndarray,
+        dtype: np.dtype = np.float32,
+        scale: float = 1.0,
+        min_disparity: int = 0
+    ) -> np.ndarray:
+        """
+        Строит карту глубины из сырой карты диспаратности int16
+
+        Глубина берется из таблицы :class:`DepthLUT`, построенной по матрице Q,
+        вместо перемножения матриц для каждого пикселя.
+        Пиксели без диспаратности получают значение 0.
+
+        Параметры
+        ---------
+        disparity_map: :class:`ndarray`
+            Карта диспаратности int16 в 1/16 пикселя
+        dtype: :class:`numpy.dtype`
+            float32 или uint16
+        scale: :class:`float`
+            Множитель перевода из единиц калибровки в единицы результата,
+            например в миллиметры для uint16
+        min_disparity: :class:`int`
+            Минимальная диспаратность SGBM в пикселях
+        """
+        key = (np.dtype(dtype).str, scale, min_disparity)
+        lut = self._depth_luts.get(key)
+        if lut is None:
+            lut = self._depth_luts[key] = DepthLUT(
+                self.rectification_data.disparity_to_depth_matrix,
+                dtype,
+                scale,
+                min_disparity
+            )
+        return lut(disparity_map)
+
+    def save_depth_map(
+        self,
+        disparity_map: np.ndarray,
+        fp: Path,
+        dtype: np.dtype = np.float32,
+        scale: float = 1.0,
+        min_disparity: int = 0
+    ) -> Path:
+        """
+        Сохраняет карту глубины: uint16 - в 16-битный .png, float32 - в .npy
+
+        Возвращает
+        ----------
+        :class:`Path`
+            Путь к записанному файлу
+        """
+        depth = self.depth_map(disparity_map, dtype, scale, min_disparity)
+        fp = Path(fp)
+        if depth.dtype == np.uint16:
+            fp = fp.with_suffix(".png")
+            if not cv2.imwrite(str(fp), depth):
+                raise IOError(f"Не удалось записать {fp}")
+        else:
+            fp = fp.with_suffix(".npy")
+            np.save(fp, depth)
+        return fp
 
-        points = cv2.reprojectImageTo3D(
+    def integrate(
+        self,
+        map_images_pair: MapImagesPair,
+        voxel_map: VoxelMap,
+        pose: Optional[np.ndarray] = None,
+        offset: Tuple[int, int] = (0, 0)
+    ) -> int:
+        """
+        Добавляет облако точек кадра в воксельную карту
+
+        Параметры
+        ---------
+        map_images_pair: :class:`MapImagesPair`
+            Кортеж, где первый элемент - список кадров,
+            а второй - карта диспаратности
+        voxel_map: :class:`VoxelMap`
+            Карта, в которую добавляются точки
+        pose: Optional[:class:`ndarray`]
+            Матрица 4x4 положения камеры в системе координат карты
+        offset: Tuple[:class:`int`]
+            Координаты (x, y) карты диспаратности в кадре
+
+        Возвращает
+        ----------
+        :class:`int`
+            Количество добавленных точек
+        """
+        frames, disparity_map = map_images_pair
+        left_image = self._left_colors(frames, disparity_map, offset)
+        points, mask = reproject_points(
             disparity_map,
-            self.rectification_data.disparity_to_depth_matrix
+            self.rectification_data.disparity_to_depth_matrix,
+            offset=offset,
+            disparity_scale=disparity_scale(disparity_map)
         )
+        voxel_map.integrate(points, left_image[mask], pose)
+        return len(points)
 
-        mask = disparity_map > disparity_map.min()
-        points = points[mask]
-        colors = left_image[mask]
+    def fuse_dataset(
+        self,
+        dataset: DisparityDataset,
+        voxel_map: VoxelMap,
+        poses: Optional[np.ndarray] = None
+    ) -> ReconstructionReport:
+        """
+        Объединяет облака всех карт датасета в одну воксельную карту
+
+        Карты читаются по одной, поэтому память ограничена размером воксельной карты.
+
+        Параметры
+        ---------
+        dataset: :class:`DisparityDataset`
+            Датасет карт диспаратности
+        voxel_map: :class:`VoxelMap`
+            Карта, в которую добавляются точки
+        poses: Optional[:class:`ndarray`]
+            Положения камеры Nx4x4 для каждой карты датасета.
+            Для неподвижной установки не нужны
+        """
+        if poses is not None and len(poses) != len(dataset):
+            raise ValueError("Количество положений камеры не совпадает с количеством карт")
+        report = ReconstructionReport()
+        started = time.perf_counter()
+        for idx, map_images_pair in enumerate(dataset):
+            pose = None if poses is None else poses[idx]
+            report.points += self.integrate(map_images_pair, voxel_map, pose)
+            report.processed += 1
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @staticmethod
+    def _left_colors(
+        frames: ImagePair,
+        disparity_map: np.ndarray,
+        offset: Tuple[int, int]
+    ) -> np.ndarray:
+        height, width = disparity_map.shape[:2]
+        left_image = frames[0][offset[1]:offset[1] + height, offset[0]:offset[0] + width]
+        return cv2.cvtColor(left_image, cv2.COLOR_BGR2RGB)
+
+    def reconstruct_dataset(
+        self,
+        dataset: DisparityDataset,
+        folder: Union[str, Path],
+        workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        overwrite: bool = False
+    ) -> ReconstructionReport:
+        """
+        Строит облака точек для всех карт датасета
+
+        Карты распределяются по пулу процессов. Каждый процесс сам читает
+        кадры и карту с диска, поэтому между процессами передаются только номера,
+        а в работе одновременно находится не больше max_pending карт.
+        Облако для карты с номером n записывается в folder/n.ply.
+        Уже построенные облака пропускаются, поэтому прерванную обработку
+        можно продолжить повторным запуском.
+
+        Параметры
+        ---------
+        dataset: :class:`DisparityDataset`
+            Датасет карт диспаратности
+        folder: :class:`str` | :class:`Path`
+            Папка для облаков точек
+        workers: Optional[:class:`int`]
+            Количество процессов. По умолчанию - число ядер, 1 - в текущем процессе
+        max_pending: Optional[:class:`int`]
+            Максимальное количество карт в работе. По умолчанию - 2 на процесс
+        overwrite: :class:`bool`
+            Перестраивать уже существующие облака
+
+        Возвращает
+        ----------
+        :class:`ReconstructionReport`
+            Количество обработанных карт, точек и время работы
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or 2 * workers
+
+        report = ReconstructionReport()
+        indices = [
+            idx for idx in range(len(dataset))
+            if overwrite or not (folder / f"{idx}.ply").exists()
+        ]
+        report.skipped = len(dataset) - len(indices)
+        started = time.perf_counter()
+
+        if workers == 1:
+            for idx in indices:
+                report.points += _save_item(self, dataset, idx, folder)
+                report.processed += 1
+        else:
+            with ProcessPoolExecutor(
+                workers,
+                initializer=_init_worker,
+                initargs=(dataset.folder, self)
+            ) as pool:
+                pending: Set[Future] = set()
+                for idx in indices:
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            report.points += future.result()
+                            report.processed += 1
+                    pending.add(pool.submit(_reconstruct_index, idx, folder))
+                for future in pending:
+                    report.points += future.result()
+                    report.processed += 1
+
+        report.seconds = time.perf_counter() - started
+        return report
+
+    @staticmethod
+    def _write_open3d(fp: Path, points: np.ndarray, colors: np.ndarray) -> None:
+        try:
+            import open3d
+        except ImportError as error:
+            raise ImportError("Для записи через open3d установите пакет open3d") from error
 
         pcd = open3d.geometry.PointCloud()
         pcd.points = open3d.utility.Vector3dVector(points)
         pcd.colors = open3d.utility.Vector3dVector(colors.astype(np.float32) / 255.0)
         open3d.io.write_point_cloud(str(fp), pcd)
+
+
+def _save_item(
+    reconstructor: StereoReconstructor,
+    dataset: DisparityDataset,
+    index: int,
+    folder: Path
+) -> int:
+    # облако пишется под временным именем, поэтому прерванная запись
+    # не считается готовым облаком при повторном запуске
+    return reconstructor.save_point_cloud(dataset[index], folder / f"{index}.ply")
+
+
+# состояние процесса пула: датасет и реконструктор создаются один раз на процесс
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(folder: Path, reconstructor: StereoReconstructor) -> None:
+    # кеш не нужен: каждая пара кадров читается один раз
+    _worker["dataset"] = DisparityDataset(folder, lazy=True, cache_size=0)
+    _worker["reconstructor"] = reconstructor
+
+
+def _reconstruct_index(index: int, folder: Path) -> int:
+    return _save_item(_worker["reconstructor"], _worker["dataset"], index, folder)
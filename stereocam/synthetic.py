@@ -0,0 +1,261 @@
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from .calibration import TransformationMap
+from .types import ImagePair
+
+
+def make_texture(
+    size: Tuple[int, int],
+    rng: np.random.Generator
+) -> np.ndarray:
+    """Случайная цветная текстура, пригодная для сопоставления"""
+    width, height = size
+    noise = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    coarse = cv2.resize(
+        rng.integers(0, 256, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8),
+        (width, height),
+        interpolation=cv2.INTER_LINEAR
+    )
+    texture = cv2.addWeighted(noise, 0.6, coarse, 0.4, 0)
+    return cv2.GaussianBlur(texture, (3, 3), 0)
+
+
+def make_stereo_pair(
+    size: Tuple[int, int] = (640, 480),
+    disparity_range: Tuple[float, float] = (8, 64),
+    shapes: int = 4,
+    seed: int = 0
+) -> Tuple[ImagePair, np.ndarray]:
+    """
+    Создает синтетическую ректифицированную стереопару с известной диспаратностью
+
+    Сцена состоит из наклонной текстурированной плоскости фона и нескольких
+    прямоугольников и эллипсов перед ней. Каждый слой сдвигается на правом кадре
+    на свою диспаратность, ближние слои перекрывают дальние.
+
+    Параметры
+    ---------
+    size: Tuple[:class:`int`]
+        Ширина и высота кадров
+    disparity_range: Tuple[:class:`float`]
+        Минимальная и максимальная диспаратность сцены
+    shapes: :class:`int`
+        Количество фигур перед фоном
+    seed: :class:`int`
+        Зерно генератора случайных чисел
+
+    Возвращает
+    ----------
+    frames: :class:`ImagePair`
+        Левый и правый кадр в формате BGR
+    disparity: :class:`ndarray`
+        Истинная диспаратность для каждого пикселя левого кадра (float32)
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    low, high = disparity_range
+    margin = int(np.ceil(high)) + 1
+
+    xs, ys = np.meshgrid(
+        np.arange(width, dtype=np.float32),
+        np.arange(height, dtype=np.float32)
+    )
+    left = np.zeros((height, width, 3), np.uint8)
+    right = np.zeros((height, width, 3), np.uint8)
+    ground_truth = np.zeros((height, width), np.float32)
+
+    # слои упорядочены от дальнего к ближнему
+    levels = np.sort(rng.uniform(low, high, shapes + 1))
+    levels[0] = low
+    for layer, level in enumerate(levels):
+        texture = make_texture((width + margin, height), rng)
+        if layer == 0:
+            # фон - плоскость с небольшим наклоном
+            slope = (min(high, low + 8) - low) / max(width, height)
+            disparity = (low + slope * (xs + ys)).astype(np.float32)
+            mask = np.full((height, width), 255, np.uint8)
+        else:
+            disparity = np.full((height, width), level, np.float32)
+            mask = np.zeros((height, width), np.uint8)
+            center = (int(rng.integers(width // 8, width * 7 // 8)),
+                      int(rng.integers(height // 8, height * 7 // 8)))
+            axes = (int(rng.integers(width // 16, width // 5)),
+                    int(rng.integers(height // 16, height // 5)))
+            if layer % 2:
+                cv2.rectangle(
+                    mask,
+                    (center[0] - axes[0], center[1] - axes[1]),
+                    (center[0] + axes[0], center[1] + axes[1]),
+                    255,
+                    -1
+                )
+            else:
+                cv2.ellipse(mask, center, axes, 0, 0, 360, 255, -1)
+
+        # пиксель x левого кадра виден на правом кадре в точке x - d
+        left_layer = texture[:, :width]
+        right_layer = cv2.remap(texture, xs + disparity, ys, cv2.INTER_LINEAR)
+        right_mask = cv2.remap(mask, xs + disparity, ys, cv2.INTER_NEAREST)
+
+        left[mask > 0] = left_layer[mask > 0]
+        right[right_mask > 0] = right_layer[right_mask > 0]
+        ground_truth[mask > 0] = disparity[mask > 0]
+
+    return [left, right], ground_truth
+
+
+def identity_transformation(size: Tuple[int, int]) -> TransformationMap:
+    """
+    Карты трансформации, не изменяющие изображение
+
+    Позволяют использовать :class:`DisparityEstimator` с уже ректифицированными кадрами.
+    """
+    camera_matrix = synthetic_camera(size)
+    maps = [
+        cv2.initUndistortRectifyMap(
+            camera_matrix, np.zeros(5), np.eye(3), camera_matrix, size, cv2.CV_16SC2
+        )
+        for _ in range(2)
+    ]
+    return TransformationMap(maps[0][0], maps[0][1], maps[1][0], maps[1][1])
+
+
+def disparity_error(
+    disparity: np.ndarray,
+    ground_truth: np.ndarray,
+    threshold: float = 1.0,
+    ignore_left: int = 0
+) -> dict:
+    """
+    Оценивает точность карты диспаратности относительно истинной
+
+    Параметры
+    ---------
+    disparity: :class:`ndarray`
+        Рассчитанная карта диспаратности в пикселях
+    ground_truth: :class:`ndarray`
+        Истинная диспаратность
+    threshold: :class:`float`
+        Порог ошибки в пикселях для доли плохих пикселей
+    ignore_left: :class:`int`
+        Ширина левой полосы, где сопоставление невозможно (обычно min_disparity + num_disparities)
+
+    Возвращает
+    ----------
+    :class:`dict`
+        bad - доля валидных пикселей с ошибкой больше порога,
+        mae - средняя абсолютная ошибка на валидных пикселях,
+        density - доля валидных пикселей
+    """
+    region = (slice(None), slice(ignore_left, None))
+    disparity = disparity[region]
+    ground_truth = ground_truth[region]
+    valid = disparity > disparity.min()
+    if not valid.any():
+        return {"bad": 1.0, "mae": float("inf"), "density": 0.0}
+    error = np.abs(disparity[valid] - ground_truth[valid])
+    return {
+        "bad": float(np.mean(error > threshold)),
+        "mae": float(error.mean()),
+        "density": float(valid.mean()),
+    }
+
+
+def synthetic_camera(size: Tuple[int, int]) -> np.ndarray:
+    """Матрица камеры с фокусным расстоянием, равным ширине кадра, и центром в середине"""
+    width, height = size
+    return np.array(
+        [[width, 0, width / 2], [0, width, height / 2], [0, 0, 1]],
+        np.float64
+    )
+
+
+def synthetic_q_matrix(size: Tuple[int, int], baseline: float = 1.0) -> np.ndarray:
+    """Матрица Q ректифицированной пары камер :func:`synthetic_camera` с базой baseline"""
+    camera_matrix = synthetic_camera(size)
+    q_matrix = np.zeros((4, 4), np.float64)
+    q_matrix[0, 0] = q_matrix[1, 1] = 1
+    q_matrix[0, 3] = -camera_matrix[0, 2]
+    q_matrix[1, 3] = -camera_matrix[1, 2]
+    q_matrix[2, 3] = camera_matrix[0, 0]
+    q_matrix[3, 2] = 1 / baseline
+    return q_matrix
+
+
+def make_chessboard_pairs(
+    size: Tuple[int, int] = (640, 480),
+    pattern_size: Tuple[int, int] = (9, 6),
+    count: int = 12,
+    baseline: float = 3.0,
+    seed: int = 0
+) -> Tuple[List[ImagePair], np.ndarray]:
+    """
+    Создает снимки шахматной доски с двух камер с известными параметрами
+
+    Обе камеры имеют матрицу :func:`synthetic_camera` без дисторсии,
+    правая камера сдвинута вправо на baseline. Доска в каждом снимке
+    повернута и сдвинута случайно, но видна на обоих кадрах.
+    Единица длины - сторона квадрата доски, как в :class:`StereoCalibrator`.
+
+    Параметры
+    ---------
+    size: Tuple[:class:`int`]
+        Ширина и высота кадров
+    pattern_size: Tuple[:class:`int`]
+        Количество внутренних углов доски
+    count: :class:`int`
+        Количество пар снимков
+    baseline: :class:`float`
+        Расстояние между камерами в сторонах квадрата
+    seed: :class:`int`
+        Зерно генератора случайных чисел
+
+    Возвращает
+    ----------
+    pairs: List[:class:`ImagePair`]
+        Пары кадров BGR
+    camera_matrix: :class:`ndarray`
+        Истинная матрица обеих камер
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    columns, rows = pattern_size
+    camera_matrix = synthetic_camera(size)
+
+    # квадраты доски занимают [-1, columns] x [-1, rows], вокруг - белое поле в 1 квадрат
+    square = 32
+    board = np.full(((rows + 3) * square, (columns + 3) * square), 255, np.uint8)
+    for j in range(rows + 1):
+        for i in range(columns + 1):
+            if (i + j) % 2 == 0:
+                board[(j + 1) * square:(j + 2) * square, (i + 1) * square:(i + 2) * square] = 0
+    board_to_plane = np.array(
+        [[1 / square, 0, -2], [0, 1 / square, -2], [0, 0, 1]],
+        np.float64
+    )
+
+    center = np.array([(columns - 1) / 2, (rows - 1) / 2, 0.0])
+    distance = 2.5 * columns * camera_matrix[0, 0] / width
+    pairs = []
+    for _ in range(count):
+        rotation, _ = cv2.Rodrigues(rng.uniform(-0.35, 0.35, 3))
+        translation = -rotation @ center + np.array([
+            baseline / 2 + rng.uniform(-1, 1) * columns * 0.15,
+            rng.uniform(-1, 1) * rows * 0.15,
+            distance * rng.uniform(0.8, 1.2)
+        ])
+        frames = []
+        for shift in (0.0, -baseline):
+            extrinsic = np.column_stack(
+                [rotation[:, 0], rotation[:, 1], translation + np.array([shift, 0, 0])]
+            )
+            homography = camera_matrix @ extrinsic @ board_to_plane
+            image = cv2.warpPerspective(
+                board, homography, size, flags=cv2.INTER_LINEAR, borderValue=160
+            )
+            frames.append(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR))
+        pairs.append(frames)
+    return pairs, camera_matrix
@@ -0,0 +1,240 @@
+import json
+import time
+import threading
+import warnings
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Deque, Dict, Iterable, Optional, Tuple, Union
+
+import pathlib
+import cv2
+import numpy as np
+
+
+Snapshot = Dict[str, Dict[str, float]]
+
+
+class _StageTimer:
+    __slots__ = ("telemetry", "name", "start")
+
+    def __init__(self, telemetry: "Telemetry", name: str) -> None:
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self) -> "_StageTimer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.telemetry.record(self.name, time.perf_counter() - self.start)
+
+
+class Telemetry:
+    """
+    Замеры времени этапов обработки
+
+    Для каждого этапа хранятся последние window замеров, по которым
+    считаются перцентили p50/p95/p99 и частота выполнения этапа (FPS).
+    Время измеряется монотонными часами time.perf_counter.
+
+    Параметры
+    ---------
+    window: :class:`int`
+        Количество последних замеров каждого этапа
+    log_path: Optional[:class:`str` | :class:`Path`]
+        Файл, в который раз в log_interval секунд дописывается
+        строка JSON со сводкой по всем этапам
+    log_interval: :class:`float`
+        Период записи сводки в секундах
+    callback: Optional[Callable[[Snapshot], None]]
+        Вызывается с той же сводкой раз в log_interval секунд,
+        например для передачи в систему сбора метрик
+
+    Сводку собирает, записывает и передает в callback отдельный фоновый поток,
+    поэтому потоки этапов только добавляют замеры. Поток запускается,
+    если указан log_path или callback, и останавливается методом :meth:`close`.
+
+    Пример
+    ------
+    ::
+
+        telemetry = Telemetry(log_path="telemetry.jsonl")
+        with telemetry.stage("match"):
+            ...
+        telemetry.close()
+    """
+    enabled = True
+
+    def __init__(
+        self,
+        window: int = 512,
+        log_path: Optional[Union[str, pathlib.Path]] = None,
+        log_interval: float = 5.0,
+        callback: Optional[Callable[[Snapshot], None]] = None
+    ) -> None:
+        self.window = window
+        self.log_path = log_path
+        self.log_interval = log_interval
+        self.callback = callback
+        self._durations: Dict[str, Deque[float]] = {}
+        self._finished: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # запись сводки по таймеру и flush из другого потока не должны перемешивать строки журнала
+        self._emit_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if log_path is not None or callback is not None:
+            self._thread = threading.Thread(target=self._emit_loop, daemon=True)
+            self._thread.start()
+
+    def stage(self, name: str) -> _StageTimer:
+        """Контекстный менеджер, замеряющий время выполнения блока"""
+        return _StageTimer(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        """Добавляет замер этапа name"""
+        now = time.monotonic()
+        # замеры приходят из потоков конвейера и записи, поэтому счетчик и очереди
+        # меняются под блокировкой, иначе инкременты теряются
+        with self._lock:
+            if name not in self._durations:
+                self._durations[name] = deque(maxlen=self.window)
+                self._finished[name] = deque(maxlen=self.window)
+                self._counts[name] = 0
+            self._durations[name].append(seconds)
+            self._finished[name].append(now)
+            self._counts[name] += 1
+
+    def snapshot(self) -> Snapshot:
+        """
+        Сводка по этапам
+
+        Возвращает
+        ----------
+        Dict[:class:`str`, Dict[:class:`str`, :class:`float`]]
+            Для каждого этапа: count - всего замеров, p50, p95, p99 и mean в секундах,
+            fps - частота выполнения этапа по последним замерам
+        """
+        with self._lock:
+            stages = {
+                name: (np.array(durations), list(self._finished[name]), self._counts[name])
+                for name, durations in self._durations.items()
+            }
+        snapshot = {}
+        for name, (durations, finished, count) in stages.items():
+            if not len(durations):
+                continue
+            p50, p95, p99 = np.percentile(durations, (50, 95, 99))
+            span = finished[-1] - finished[0] if len(finished) > 1 else 0.0
+            snapshot[name] = {
+                "count": count,
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "mean": float(durations.mean()),
+                "fps": (len(finished) - 1) / span if span > 0 else 0.0,
+            }
+        return snapshot
+
+    def overlay(
+        self,
+        image: np.ndarray,
+        stages: Optional[Iterable[str]] = None,
+        origin: Tuple[int, int] = (8, 20)
+    ) -> np.ndarray:
+        """
+        Рисует сводку по этапам поверх изображения (изменяет image)
+
+        Параметры
+        ---------
+        stages: Optional[Iterable[:class:`str`]]
+            Этапы, которые нужно показать. По умолчанию - все
+        """
+        snapshot = self.snapshot()
+        names = snapshot if stages is None else [name for name in stages if name in snapshot]
+        x, y = origin
+        for name in names:
+            stats = snapshot[name]
+            text = (
+                f"{name}: {stats['p50'] * 1000:.1f}/{stats['p95'] * 1000:.1f}/"
+                f"{stats['p99'] * 1000:.1f} ms  {stats['fps']:.1f} fps"
+            )
+            # темная обводка, чтобы текст читался на любом фоне
+            cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, 0, 3, cv2.LINE_AA)
+            cv2.putText(
+                image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45,
+                (255, 255, 255), 1, cv2.LINE_AA
+            )
+            y += 18
+        return image
+
+    def flush(self) -> None:
+        """Немедленно записывает сводку в журнал и передает ее в callback"""
+        self._emit()
+
+    def close(self) -> None:
+        """Останавливает фоновую запись сводки и записывает последнюю сводку"""
+        if self._thread is None or self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self._emit()
+
+    def __enter__(self) -> "Telemetry":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _emit_loop(self) -> None:
+        while not self._closed.wait(self.log_interval):
+            try:
+                self._emit()
+            except Exception as error:
+                # ошибка журнала или callback не должна останавливать запись сводки
+                warnings.warn(f"Не удалось записать сводку замеров: {error}")
+
+    def _emit(self) -> None:
+        if self.log_path is None and self.callback is None:
+            return
+        with self._emit_lock:
+            snapshot = self.snapshot()
+            if self.log_path is not None:
+                line = json.dumps({"time": time.time(), "stages": snapshot}, ensure_ascii=False)
+                with open(self.log_path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+            if self.callback is not None:
+                self.callback(snapshot)
+
+
+class NullTelemetry:
+    """
+    Выключенные замеры
+
+    Используется по умолчанию: :meth:`stage` возвращает один и тот же
+    пустой контекстный менеджер, поэтому накладные расходы пренебрежимо малы.
+    """
+    enabled = False
+    _timer = nullcontext()
+
+    def stage(self, name: str) -> nullcontext:
+        return self._timer
+
+    def record(self, name: str, seconds: float) -> None:
+        pass
+
+    def snapshot(self) -> Snapshot:
+        return {}
+
+    def overlay(self, image: np.ndarray, *args, **kwargs) -> np.ndarray:
+        return image
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+NULL_TELEMETRY = NullTelemetry()
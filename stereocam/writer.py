@@ -0,0 +1,147 @@
+import queue
+import threading
+from typing import Callable, List, Optional
+
+import cv2
+
+
+class AsyncWriter:
+    """
+    Фоновая запись на диск
+
+    Задачи записи попадают в ограниченную очередь, которую разбирают
+    рабочие потоки, поэтому поток захвата не ждет, пока кадры и карты
+    будут сжаты и записаны.
+
+    Параметры
+    ---------
+    workers: :class:`int`
+        Количество рабочих потоков
+    queue_size: :class:`int`
+        Максимальное количество ожидающих записи задач
+    block: :class:`bool`
+        Поведение при заполненной очереди. True - ждать освобождения места
+        (обратное давление), False - отбросить задачу
+    image_format: :class:`str`
+        Расширение файлов кадров, например png, jpg, bmp
+    png_compression: :class:`int`
+        Уровень сжатия PNG от 0 до 9. Меньше - быстрее запись, больше файлы
+
+    Аттрибуты
+    ---------
+    submitted: :class:`int`
+        Количество принятых задач
+    completed: :class:`int`
+        Количество выполненных задач
+    dropped: :class:`int`
+        Количество задач, отброшенных из-за заполненной очереди
+    errors: List[:class:`BaseException`]
+        Исключения, возникшие при записи
+    """
+    def __init__(
+        self,
+        workers: int = 2,
+        queue_size: int = 16,
+        block: bool = True,
+        image_format: str = "png",
+        png_compression: int = 1
+    ) -> None:
+        self.block = block
+        self.image_format = image_format
+        self.png_compression = png_compression
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.errors: List[BaseException] = []
+
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker_loop, daemon=True)
+            for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Количество задач в очереди"""
+        return self._queue.qsize()
+
+    @property
+    def image_params(self) -> List[int]:
+        """Параметры cv2.imwrite для выбранного формата"""
+        if self.image_format == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+        return []
+
+    def submit(self, task: Callable, *args) -> bool:
+        """
+        Ставит задачу записи в очередь
+
+        Возвращает
+        ----------
+        :class:`bool`
+            False, если задача была отброшена
+        """
+        try:
+            self._queue.put((task, args), block=self.block)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def flush(self) -> None:
+        """
+        Дожидается завершения всех поставленных задач
+
+        Если при записи возникли исключения, пробрасывает первое из них
+        """
+        self._queue.join()
+        if self.errors:
+            error = self.errors[0]
+            self.errors = []
+            raise error
+
+    def close(self) -> None:
+        """Дожидается записи и останавливает рабочие потоки"""
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self) -> "AsyncWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _worker_loop(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            task, args = item
+            try:
+                task(*args)
+            except BaseException as error:
+                with self._lock:
+                    self.errors.append(error)
+            else:
+                with self._lock:
+                    self.completed += 1
+            finally:
+                self._queue.task_done()
+
+
+def write_image(path: str, image: cv2.typing.MatLike, params: Optional[List[int]] = None) -> None:
+    """Записывает изображение и проверяет результат"""
+    if not cv2.imwrite(path, image, params or []):
+        raise IOError(f"Не удалось записать {path}")
@@ -0,0 +1,55 @@
+import numpy as np
+
+from stereocam import StereoReconstructor
+from stereocam.calibration import RectificationData
+from stereocam.point_cloud import VERTEX_DTYPE, reproject_points
+from stereocam.stereo_reconstructor import disparity_scale
+from stereocam.synthetic import synthetic_q_matrix
+
+
+SIZE = (320, 240)
+
+
+def saved_map(min_disparity=0):
+    # сырая карта SGBM в 1/16 пикселя, как ее сохраняет StereoPair.save_disparity
+    rng = np.random.default_rng(0)
+    raw = rng.integers(16 * 10, 16 * 96, (SIZE[1], SIZE[0])).astype(np.int16)
+    raw[:, :20] = (min_disparity - 1) * 16
+    return raw
+
+
+def reconstructor():
+    q_matrix = synthetic_q_matrix(SIZE)
+    rectification = RectificationData(
+        np.eye(3), np.eye(3), np.eye(3, 4), np.eye(3, 4), q_matrix, np.zeros(4), np.zeros(4)
+    )
+    return StereoReconstructor(rectification), q_matrix
+
+
+def test_depth_map_matches_point_cloud_depth(tmp_path):
+    stereo_reconstructor, q_matrix = reconstructor()
+    raw = saved_map()
+    depth = stereo_reconstructor.depth_map(raw)
+
+    points, mask = reproject_points(raw, q_matrix, disparity_scale=disparity_scale(raw))
+    np.testing.assert_allclose(points[:, 2], depth[mask], rtol=1e-5)
+    assert not depth[~mask].any()
+
+    frames = [np.zeros((SIZE[1], SIZE[0], 3), np.uint8)] * 2
+    count = stereo_reconstructor.save_point_cloud((frames, raw), tmp_path / "cloud.ply")
+    data = (tmp_path / "cloud.ply").read_bytes()
+    header_end = data.index(b"end_header\n") + len(b"end_header\n")
+    vertices = np.frombuffer(data[header_end:], VERTEX_DTYPE)
+    assert len(vertices) == count
+    np.testing.assert_allclose(np.sort(vertices["z"]), np.sort(depth[depth > 0]), rtol=1e-5)
+
+
+def test_depth_map_respects_min_disparity():
+    stereo_reconstructor, _ = reconstructor()
+    raw = saved_map(min_disparity=8)
+    depth = stereo_reconstructor.depth_map(raw, min_disparity=8)
+
+    assert not depth[:, :20].any()
+    assert (depth[:, 20:] > 0).all()
+    # меньше min_disparity - невалидный пиксель, даже если значение положительное
+    assert not stereo_reconstructor.depth_map(np.full((1, 1), 7 * 16, np.int16), min_disparity=8).any()
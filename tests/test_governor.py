@@ -0,0 +1,88 @@
+import pytest
+
+from stereocam.governor import DEFAULT_LEVELS, QualityGovernor
+
+
+# время кадра каждого уровня по умолчанию, с
+COSTS = {
+    "hh_wls": 0.6,
+    "sgbm_wls": 0.4,
+    "sgbm": 0.2,
+    "3way": 0.14,
+    "3way_half": 0.04,
+    "3way_quarter": 0.015,
+}
+
+
+def run(governor, frames, costs=COSTS, scale=lambda frame: 1.0):
+    names = []
+    for frame in range(frames):
+        level = governor.level
+        names.append(level.name)
+        governor.update(costs[level.name] * scale(frame), level)
+    return names
+
+
+def switches(names):
+    return sum(previous != current for previous, current in zip(names, names[1:]))
+
+
+def test_settles_on_fastest_level_within_budget():
+    governor = QualityGovernor(target_fps=10)
+    names = run(governor, 1000)
+
+    assert names[-1] == "3way_half"
+    # после одной неудачной попытки повышения уровень больше не меняется
+    assert switches(names[100:500]) == 0
+    over_budget = sum(COSTS[name] > governor.budget for name in names)
+    assert over_budget < 0.05 * len(names)
+
+
+def test_failed_upgrades_back_off():
+    governor = QualityGovernor(target_fps=10, max_hold=10 ** 6)
+    names = []
+    for _ in range(2000):
+        # без измеренных отношений задержек повторные попытки сдерживает только выдержка
+        governor._ratios.clear()
+        level = governor.level
+        names.append(level.name)
+        governor.update(COSTS[level.name], level)
+
+    holds = []
+    frames_on_level = 0
+    for previous, current in zip(names, names[1:]):
+        frames_on_level += 1
+        if previous != current:
+            if (previous, current) == ("3way_half", "3way"):
+                holds.append(frames_on_level)
+            frames_on_level = 0
+    assert holds == [30, 60, 120, 240, 480, 960][:len(holds)]
+    assert len(holds) >= 5
+
+
+def test_upgrades_again_when_load_drops():
+    governor = QualityGovernor(target_fps=10)
+    names = run(governor, 3000, scale=lambda frame: 1.0 if frame < 300 else 0.05)
+
+    assert names[299] == "3way_half"
+    assert names[-1] == "hh_wls"
+
+
+def test_ignores_frames_of_previous_level():
+    governor = QualityGovernor(target_fps=10, window=2)
+    first = governor.level
+    governor.update(1.0, first)
+    governor.update(1.0, first)
+    assert governor.index == 1
+
+    # кадры, уже находившиеся в конвейере, пришли со старым уровнем
+    for _ in range(10):
+        governor.update(1.0, first)
+    assert governor.index == 1
+
+
+def test_requires_single_budget():
+    with pytest.raises(ValueError):
+        QualityGovernor(DEFAULT_LEVELS)
+    with pytest.raises(ValueError):
+        QualityGovernor(DEFAULT_LEVELS, target_fps=10, target_latency=0.1)
@@ -0,0 +1,43 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from stereocam.capture import StampedPair
+from stereocam.pipeline import DisparityPipeline
+
+
+class FakeEstimator:
+    rectifier = SimpleNamespace(reserve=lambda count: None)
+
+    def rectify(self, frames):
+        return frames
+
+    def match(self, rectified):
+        return np.zeros(rectified[0].shape[:2], np.int16)
+
+
+def run(source):
+    items = []
+    pipeline = DisparityPipeline(source, FakeEstimator(), items.append)
+    pipeline.run()
+    return items
+
+
+def test_timestamp_is_capture_time_of_stamped_pair():
+    frames = (np.zeros((4, 4, 3), np.uint8), np.zeros((4, 4, 3), np.uint8))
+    grabbed = time.monotonic() - 5
+    items = run([StampedPair(frames, (grabbed - 0.002, grabbed + 0.002), 0)])
+
+    assert len(items) == 1
+    assert items[0].timestamp == pytest.approx(grabbed)
+    assert isinstance(items[0].frames, list)
+
+
+def test_timestamp_of_plain_pair_is_taken_by_pipeline():
+    frames = [np.zeros((4, 4, 3), np.uint8), np.zeros((4, 4, 3), np.uint8)]
+    before = time.monotonic()
+    items = run([frames])
+
+    assert before <= items[0].timestamp <= time.monotonic()
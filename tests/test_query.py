@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from stereocam.disparity_estimator import DisparityEstimator
+from stereocam.synthetic import identity_transformation, make_stereo_pair
+
+
+SIZE = (1280, 720)
+
+
+@pytest.fixture(scope="module")
+def scene():
+    frames, _ = make_stereo_pair(SIZE, disparity_range=(20, 200), shapes=6, seed=1)
+    estimator = DisparityEstimator(identity_transformation(SIZE))
+    rectified = [frame.copy() for frame in estimator.rectify(frames)]
+    return estimator, rectified, estimator.match(rectified)
+
+
+@pytest.mark.parametrize("box", [
+    (600, 300, 50, 50),
+    (700, 80, 120, 80),
+    # области у правого и нижнего края кадра
+    (1250, 300, 30, 60),
+    (1200, 650, 200, 200),
+])
+def test_query_matches_full_disparity(scene, box):
+    estimator, rectified, full = scene
+    result, = estimator.query(rectified, [box])
+    x, y, w, h = result.region
+    reference = full[y:y + h, x:x + w]
+    valid = reference >= estimator.config.min_disparity
+
+    assert result.disparity.shape == (h, w)
+    assert (valid != result.valid).mean() <= 0.01
+    both = valid & result.valid
+    assert (np.abs(reference[both] - result.disparity[both]) <= 1).mean() >= 0.99
+
+
+def test_query_point_and_clipping(scene):
+    estimator, rectified, full = scene
+    point, clipped = estimator.query(rectified, [(640, 360), (-10, -10, 30, 30)])
+
+    assert point.region == (640, 360, 1, 1)
+    assert clipped.region == (0, 0, 20, 20)
+    # левый край кадра невалиден и при полном расчете
+    assert not clipped.valid.any()
+    with pytest.raises(ValueError):
+        estimator.query(rectified, [(SIZE[0], 0, 10, 10)])
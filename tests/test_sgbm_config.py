@@ -0,0 +1,62 @@
+import os
+import threading
+
+import cv2
+
+from stereocam.sgbm_config import MatcherRegistry
+
+
+CONFIG = """min_disparity: 0
+num_disparities: 64
+block_size: {block_size}
+disp_12_max_diff: 1
+pre_filter_cap: 63
+uniqueness_ratio: 15
+speckle_window_size: 0
+speckle_range: 2
+"""
+
+
+def write_config(path, block_size, mtime_ns):
+    # как при сохранении редактором: файл заменяется целиком
+    temporary = path.with_suffix(".tmp")
+    temporary.write_text(CONFIG.format(block_size=block_size), "utf-8")
+    os.utime(temporary, ns=(mtime_ns, mtime_ns))
+    temporary.replace(path)
+
+
+def test_matchers_follow_reload_from_other_thread(tmp_path):
+    path = tmp_path / "sgbm_config.yml"
+    write_config(path, 5, 10 ** 18)
+    registry = MatcherRegistry(path, check_interval=0)
+    mode = cv2.STEREO_SGBM_MODE_SGBM_3WAY
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not stop.is_set():
+                registry.get_matcher(mode)
+                registry.get_wls_matcher(mode)
+                registry.get_right_matcher(mode)
+                registry.get_wls_filter(mode)
+            # после последней перезагрузки матчеры потока соответствуют итоговому конфигу
+            block_size = registry.config.block_size
+            _, matcher = registry.get_wls_filter(mode)
+            sizes = (registry.get_matcher(mode).getBlockSize(), matcher.getBlockSize())
+            if sizes != (block_size, block_size) or registry.get_wls_matcher(mode) is not matcher:
+                errors.append(sizes)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for step in range(1, 200):
+        write_config(path, 5 + 2 * (step % 2), 10 ** 18 + step)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert registry.version > 0
@@ -0,0 +1,42 @@
+import numpy as np
+
+from stereocam import StereoPair
+from stereocam.datasets import DisparityStore
+from stereocam.datasets.manifest import Manifest
+from stereocam.sources import FrameSource
+
+
+class StaticSource(FrameSource):
+    def __init__(self, frames):
+        self.frames = frames
+
+    def grab(self):
+        return True
+
+    def retrieve(self):
+        return list(self.frames)
+
+
+class FakeEstimator:
+    def set_mode(self, mode):
+        pass
+
+    def get_filtered_disparity(self, frames):
+        return np.full(frames[0].shape[:2], 16, np.int16)
+
+
+def test_frames_and_disparity_share_capture_time(tmp_path):
+    frames = [np.zeros((8, 8, 3), np.uint8), np.full((8, 8, 3), 255, np.uint8)]
+    stereo_pair = StereoPair(StaticSource(frames))
+    captured = 1700000000.25
+    (tmp_path / "frames").mkdir()
+    (tmp_path / "store").mkdir()
+
+    stereo_pair.save_frames(str(tmp_path / "frames"), frames, captured)
+    stereo_pair.save_disparity(str(tmp_path / "0.npz"), FakeEstimator(), frames, None, captured)
+    store = DisparityStore(tmp_path / "store")
+    stereo_pair.save_disparity(str(tmp_path / "1.npz"), FakeEstimator(), frames, store, captured)
+    store.close()
+
+    for folder in (tmp_path / "frames", tmp_path, tmp_path / "store"):
+        assert [entry.timestamp for entry in Manifest(folder).read()] == [captured]
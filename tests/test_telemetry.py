@@ -0,0 +1,49 @@
+import threading
+
+from stereocam.telemetry import Telemetry
+
+
+def test_record_counts_concurrent_stages():
+    telemetry = Telemetry(window=64)
+
+    def work():
+        for _ in range(10000):
+            telemetry.record("write", 0.001)
+
+    def read():
+        # сводка читается одновременно с записью, как при выводе поверх кадра
+        for _ in range(200):
+            telemetry.snapshot()
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    threads.append(threading.Thread(target=read))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = telemetry.snapshot()["write"]
+    assert stats["count"] == 40000
+    assert stats["p50"] == stats["p99"] == 0.001
+
+
+def test_summary_is_emitted_off_the_recording_thread(tmp_path):
+    emitted = []
+    ready = threading.Event()
+
+    def callback(snapshot):
+        emitted.append((threading.current_thread(), snapshot))
+        ready.set()
+
+    log_path = tmp_path / "telemetry.jsonl"
+    telemetry = Telemetry(log_path=log_path, log_interval=0.01, callback=callback)
+    telemetry.record("match", 0.002)
+    assert ready.wait(5)
+    telemetry.close()
+
+    # последняя сводка записывается при закрытии в вызывающем потоке
+    assert all(thread is not threading.current_thread() for thread, _ in emitted[:-1])
+    assert emitted[-1][0] is threading.current_thread()
+    assert emitted[-1][1]["match"]["count"] == 1
+    assert len(log_path.read_text(encoding="utf-8").splitlines()) == len(emitted)
+    assert not telemetry._thread.is_alive()